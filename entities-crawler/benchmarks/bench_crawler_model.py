@@ -0,0 +1,217 @@
+''' Cost of the /crawlers and /url_patterns views: eager vs lazy crawler model.
+
+usage: python benchmarks/bench_crawler_model.py [--memory] [websites] [crawlers per website]
+
+Fills a scratch database on localhost (dropped afterwards) with websites,
+crawlers and URL patterns, then for each mode runs the model work of the
+two views in a fresh process and reports wall time, peak RSS and the number
+of database queries:
+
+  eager - what WebsiteCrawler.__init__ used to do for every crawler: its
+          own EntityExtractor, its WebsiteURLPatterns and its crawler
+  lazy  - current model, nothing beyond the crawler record is built
+
+A local Redis is used for the crawler objects of the eager mode.
+With --memory the database and Redis are in-process stand-ins (no servers
+needed): time and RSS then leave out query latency, which the query count
+stands for.
+'''
+import os
+import sys
+import time
+import datetime
+import resource
+import subprocess
+
+from bson import ObjectId
+
+SCRATCH_DB = 'bench_crawler_model'
+
+
+class MemoryCollection(object):
+
+    ''' The part of a pymongo collection the models use, counting queries;
+        equality lookups go through per-field indexes like they would in
+        Mongo (ensure_crawler_indexes) '''
+
+    def __init__(self, db):
+        self.db = db
+        self.docs = []
+        self.indexes = {}  # field -> value -> docs
+
+    def _candidates(self, query):
+        for field, value in (query or {}).iteritems():
+            if not isinstance(value, dict):
+                index = self.indexes.get(field)
+                if index is None:
+                    index = self.indexes[field] = {}
+                    for doc in self.docs:
+                        index.setdefault(doc.get(field), []).append(doc)
+                return index.get(value, [])
+        return self.docs
+
+    @staticmethod
+    def _matches(doc, query):
+        for field, value in (query or {}).iteritems():
+            if isinstance(value, dict) and '$in' in value:
+                if doc.get(field) not in value['$in']:
+                    return False
+            elif doc.get(field) != value:
+                return False
+        return True
+
+    def find(self, query=None, projection=None):
+        self.db.queries += 1
+        return [dict(doc) for doc in self._candidates(query) if self._matches(doc, query)]
+
+    def find_one(self, query=None, projection=None):
+        self.db.queries += 1
+        for doc in self._candidates(query):
+            if self._matches(doc, query):
+                return dict(doc)
+        return None
+
+    def insert(self, doc):
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(dict(doc))
+        self.indexes.clear()
+        return doc['_id']
+
+    def update(self, query, update, **kwargs):
+        self.db.queries += 1
+        for doc in self._candidates(query):
+            if self._matches(doc, query):
+                doc.update(update.get('$set', {}))
+        self.indexes.clear()
+
+    def ensure_index(self, *args, **kwargs):
+        self.db.queries += 1
+
+    create_index = ensure_index
+
+
+class MemoryDB(object):
+
+    def __init__(self):
+        self.queries = 0
+        self.collections = {}
+        self.client = self
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollection(self)
+        return self.collections[name]
+
+    __getattr__ = __getitem__
+
+    def drop_database(self, name):
+        self.collections.clear()
+
+
+def fill(db, websites, crawlers):
+    db.client.drop_database(SCRATCH_DB)
+    now = datetime.datetime.now()
+    for w in range(websites):
+        url = u'http://www.site-%d.com/' % w
+        website_id = db.website.insert({
+            'name': u'site %d' % w, 'status': 1, 'publisher_id': '', 'publisher_name': u'pub',
+            'website_url': url, 'website_ad_position': '', 'website_templates': [],
+            'category': u'news', 'crawler_type': 'links_crawler', 'url_rules': {},
+            'pages': 0, 'date_created': now, 'date_lastupdated': now})
+        for c in range(crawlers):
+            crawler_id = db.crawlers.insert({
+                'name': u'crawler %d/%d' % (w, c), 'status': 1, 'crawling_status': 0,
+                'website_id': website_id, 'category': u'news', 'scraper': 'SoupScrapper',
+                'date_detector': 'bounded', 'extractor': 'entitycrawler_extractor2',
+                'start_url': url, 'age': 3600, 'frequency': 3600,
+                'crawler_type': 'links_crawler', 'crawled_pages': 0,
+                'date_created': now, 'date_lastupdated': now})
+            ids = [db.url_patterns.insert({
+                'website': 'www.site-%d.com' % w, 'crawler': crawler_id,
+                'pattern': r'http://www\.site-%d\.com/s%d/%d/.*' % (w, c, p),
+                'harvester_categories': [], 'exclude_words': [], 'ad_script': ''})
+                for p in range(10)]
+            db.crawlers.update({'_id': crawler_id}, {'$set': {'default_url_pattern': ids[0]}})
+
+
+class QueryCounter(object):
+
+    ''' pymongo command listener counting the commands sent '''
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def run(mode, memory, websites, crawlers):
+    import entitycrawler.crawler
+    from entitycrawler.crawler import WebsiteCrawler, WebsiteURLPatterns
+    from entitycrawler.extractor import EntityExtractor
+
+    if memory:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+        from tests.memredis import MemRedis
+        db, redis = MemoryDB(), MemRedis()
+        fill(db, websites, crawlers)
+        queries = lambda: db.queries
+    else:
+        from pymongo import MongoClient
+        from redis import Redis
+        counter = QueryCounter()
+        db, redis = MongoClient(event_listeners=[counter])[SCRATCH_DB], Redis()
+        queries = lambda: counter.count
+    before = queries()
+    start = time.time()
+    # /crawlers
+    crawlers = WebsiteCrawler.get_all(db=db, redis=redis)
+    if mode == 'eager':
+        for crawler in crawlers:
+            crawler._lazy_extractor = EntityExtractor(db)
+            crawler.url_patterns
+            crawler.crawler
+    listed = [crawler.doc for crawler in crawlers]
+    # /url_patterns
+    for crawler in WebsiteCrawler.get_all(db=db, redis=redis):
+        if mode == 'eager':
+            crawler._lazy_extractor = EntityExtractor(db)
+            crawler.crawler
+        crawler.doc['url_patterns'] = WebsiteURLPatterns(crawler).get_list()
+    elapsed = time.time() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sys.__stdout__.write("%-6s %6d crawlers %8.2fs %8d KB peak RSS %6d queries\n" % (
+        mode, len(listed), elapsed, rss, queries() - before))
+
+
+def main(args):
+    memory = '--memory' in args
+    args = [a for a in args if a != '--memory']
+    if args and args[0] == '--run':
+        return run(args[1], memory, int(args[2]), int(args[3]))
+    websites = int(args[0]) if args else 20
+    crawlers = int(args[1]) if len(args) > 1 else 3
+
+    command = [sys.executable, __file__] + (['--memory'] if memory else []) + ['--run']
+    if memory:
+        for mode in ('eager', 'lazy'):
+            subprocess.check_call(command + [mode, str(websites), str(crawlers)])
+        return
+    from pymongo import MongoClient
+    db = MongoClient()[SCRATCH_DB]
+    fill(db, websites, crawlers)
+    try:
+        for mode in ('eager', 'lazy'):
+            subprocess.check_call(command + [mode, '0', '0'])
+    finally:
+        db.client.drop_database(SCRATCH_DB)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+''' Date detection micro-benchmark: old Scrapper._get_article_date vs the detectors.
+
+usage: python benchmarks/bench_dates.py [page.html ...]
+
+Without arguments a synthetic corpus is used: pages with
+article:published_time, JSON-LD, <time> tags and text-only dates.
+'''
+import re
+import sys
+import time
+from datetime import datetime
+
+import pytz
+from dateutil.parser import parse
+
+from entitycrawler.crawler.scrapers.document import ParsedDocument
+from entitycrawler.crawler.scrapers import dates
+
+ROUNDS = 5
+
+FILLER = ''.join('<p>Paragraph %d, published on Monday the 3rd, updated 10/12/2014.</p>' % i
+                 for i in range(2000))
+
+
+def corpus():
+    head = '<html><head><title>t</title>%s</head><body>%s%s</body></html>'
+    return [
+        ('meta', head % ('<meta property="article:published_time" content="2015-06-01T10:00:00Z">', '', FILLER)),
+        ('json-ld', head % ('<script type="application/ld+json">{"@type": "NewsArticle", '
+                            '"datePublished": "2015-06-01T10:00:00Z"}</script>', '', FILLER)),
+        ('time', head % ('', '<time datetime="2015-06-01T10:00:00Z">June 1</time>', FILLER)),
+        ('text', head % ('', '<p>Posted June 1st, 2015</p>', FILLER)),
+    ]
+
+
+def legacy(html):
+    ''' Scrapper._get_article_date before the dates module (regex branch) '''
+    current_time = datetime.now(pytz.utc)
+    list_of_dates = []
+    found = set()
+    for regex in [p.pattern for p in dates.DATE_PATTERNS]:
+        found.update(re.findall(regex, html.decode('utf-8'), re.IGNORECASE))
+    for elem in found:
+        try:
+            date = parse(elem).replace(tzinfo=pytz.UTC)
+        except:
+            pass
+        else:
+            if (current_time - date).days >= 0:
+                list_of_dates.append(date)
+    if list_of_dates:
+        return sorted(list_of_dates)[-1]
+    return None
+
+
+def timed(fn, html):
+    start = time.time()
+    for _ in range(ROUNDS):
+        dates.PARSE_CACHE.clear()
+        fn(html)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+def detector_fn(name):
+    detector = dates.get_date_detector(name)
+    return lambda html: detector.detect(ParsedDocument(html))
+
+
+def main(paths):
+    if paths:
+        pages = [(p[-12:], open(p, 'rb').read()) for p in paths]
+    else:
+        pages = corpus()
+    names = [dates.STRUCTURED, dates.BOUNDED, dates.FULL]
+    print("%-12s %10s" % ('page', 'legacy ms') + ''.join(" %10s" % ('%s ms' % n) for n in names))
+    for name, html in pages:
+        row = "%-12s %10.2f" % (name, timed(legacy, html))
+        for n in names:
+            row += " %10.2f" % timed(detector_fn(n), html)
+        print(row)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,122 @@
+''' Crawled page storage: inline `html` (before) vs htmlstore blobs (after).
+
+usage: python benchmarks/bench_html_store.py [--mongo] [page.html ...]
+
+Reports the BSON bytes written per mode and how many pages/s can be
+prepared for writing (hashing + compression). With --mongo the pages are
+also written to a scratch database on localhost (dropped afterwards) to
+measure real write throughput.
+
+Without page arguments a synthetic corpus is used where every page is
+recrawled a few times, like the crawlers do with start and listing pages.
+'''
+import sys
+import time
+from datetime import datetime
+
+from bson import BSON
+
+from entitycrawler import htmlstore
+
+RECRAWLS = 3
+SCRATCH_DB = 'bench_html_store'
+
+
+def synthetic_pages():
+    pages = []
+    for n in range(50):
+        paragraphs = ''.join('<p class="para">Paragraph %d of story %d with <b>Some Name</b> '
+                             'and a <a href="/news/%d.html">link</a>.</p>' % (i, n, i)
+                             for i in range(150))
+        html = ('<html><head><title>Story %d</title></head><body><div id="nav">%s</div>'
+                '<div id="content">%s</div></body></html>' %
+                (n, '<a href="/">Home</a>' * 40, paragraphs))
+        pages.append(('http://example.com/story-%d.html' % n, html))
+    return pages
+
+
+def page_doc(url, html):
+    ''' Crawled page as ScrappedPage.save writes it, minus html '''
+    return {'url': url, 'parser': 'Soup4', 'date': datetime.utcnow(),
+            'metadata': {'keywords': []}, 'links': [], 'title': 'Title',
+            'text': ['some text'] * 20, 'highlighted_strings': [],
+            'crawled_at': datetime.utcnow()}
+
+
+def inline(pages):
+    docs = []
+    for url, html in pages:
+        doc = page_doc(url, html)
+        doc['html'] = html
+        docs.append(doc)
+    return docs, []
+
+
+def blobs(pages, codec):
+    docs, stored = [], {}
+    for url, html in pages:
+        key, blob = htmlstore.make_blob(html, codec)
+        stored.setdefault(key, dict(blob, _id=key, last_seen=datetime.utcnow()))
+        doc = page_doc(url, html)
+        doc['html_hash'] = key
+        doc['html_unicode'] = htmlstore.is_unicode(html)
+        docs.append(doc)
+    return docs, stored.values()
+
+
+def bson_size(docs):
+    return sum(len(BSON.encode(d)) for d in docs)
+
+
+def write_mongo(pages, mode, codec=None):
+    from pymongo import MongoClient
+    db = MongoClient()[SCRATCH_DB]
+    db.client.drop_database(SCRATCH_DB)
+    start = time.time()
+    for url, html in pages:
+        doc = page_doc(url, html)
+        if mode == 'inline':
+            doc['html'] = html
+        else:
+            doc['html_hash'] = htmlstore.save(db, html, codec)
+            doc['html_unicode'] = htmlstore.is_unicode(html)
+        db.crawled_pages.update({'url': url}, doc, upsert=True)
+    elapsed = time.time() - start
+    db.client.drop_database(SCRATCH_DB)
+    return len(pages) / elapsed
+
+
+def main(args):
+    use_mongo = '--mongo' in args
+    paths = [a for a in args if a != '--mongo']
+    if paths:
+        pages = [(p, open(p, 'rb').read()) for p in paths]
+    else:
+        pages = synthetic_pages()
+    pages = pages * RECRAWLS
+
+    codecs = [htmlstore.ZLIB]
+    if htmlstore.zstandard is not None:
+        codecs.append(htmlstore.ZSTD)
+
+    modes = [('inline', lambda: inline(pages), None)]
+    for codec in codecs:
+        modes.append(('blob-' + codec, lambda codec=codec: blobs(pages, codec), codec))
+
+    print("%d page writes, %d distinct bodies" %
+          (len(pages), len(set(htmlstore.html_hash(h) for _, h in pages))))
+    print("%-12s %12s %12s %12s %12s" % ('mode', 'pages B', 'blobs B', 'total B', 'prep p/s'))
+    for name, fn, codec in modes:
+        start = time.time()
+        docs, stored = fn()
+        rate = len(pages) / (time.time() - start)
+        page_bytes, blob_bytes = bson_size(docs), bson_size(stored)
+        row = "%-12s %12d %12d %12d %12.0f" % (name, page_bytes, blob_bytes,
+                                                page_bytes + blob_bytes, rate)
+        if use_mongo:
+            row += "  mongo %.0f p/s" % write_mongo(pages, name.split('-')[0], codec)
+        print(row)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+''' Per-page parse cost: separate parses (before) vs shared ParsedDocument (after).
+
+usage: python benchmarks/bench_parse.py [page.html ...]
+
+Without arguments a synthetic article page is used.
+'''
+import re
+import sys
+import time
+from io import StringIO
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from entitycrawler.crawler.scrapers.document import ParsedDocument, LXML, SOUP
+
+ROUNDS = 20
+
+LINKS_RE = 'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
+RELATIVE_LINKS_RE = '<a href="?\'?([^"\'>]*)'
+
+
+def synthetic_page():
+    links = ''.join('<li><a href="/news/story-%d.html">Story %d</a></li>' % (i, i)
+                    for i in range(300))
+    paragraphs = ''.join('<p>Paragraph %d of the article with <b>Some Name</b> in it.</p>' % i
+                         for i in range(200))
+    return ('<html><head><title>Article</title>'
+            '<meta name="keywords" content="a, b, c">'
+            '<meta property="article:published_time" content="2015-06-01T10:00:00Z">'
+            '</head><body><ul>%s</ul><article><time datetime="2015-06-01">June 1</time>%s'
+            '</article></body></html>' % (links, paragraphs))
+
+
+def before(html):
+    ''' what SoupScrapper v3 did: lxml tree for dates, soup for the rest, regex for links '''
+    tree = etree.parse(StringIO(html.decode('utf-8')), etree.HTMLParser())
+    tree.findall('.//time')
+    soup = BeautifulSoup(html)
+    soup.find_all('meta')
+    soup.find_all('a')
+    re.findall(LINKS_RE, html)
+    re.findall(RELATIVE_LINKS_RE, html)
+
+
+def after(html, backend):
+    document = ParsedDocument(html, backend=backend)
+    document.time_tags()
+    document.meta_tags()
+    document.link_tags()
+    return document.parses
+
+
+def timed(fn, *args):
+    start = time.time()
+    for _ in range(ROUNDS):
+        fn(*args)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+def main(paths):
+    if paths:
+        pages = [(p, open(p, 'rb').read()) for p in paths]
+    else:
+        pages = [('synthetic', synthetic_page())]
+    print("%-30s %12s %12s %12s" % ('page', 'before ms', 'soup ms', 'lxml ms'))
+    for name, html in pages:
+        print("%-30s %12.2f %12.2f %12.2f" % (name[-30:],
+                                               timed(before, html),
+                                               timed(after, html, SOUP),
+                                               timed(after, html, LXML)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+''' robots.txt matching: compiled RobotsRules vs the stdlib robotparser.
+
+usage: python benchmarks/bench_robots.py [robots.txt]
+
+Reports URL checks per second of both on a robots.txt (a synthetic one by
+default). Fetching, caching and revalidation are covered by
+tests/test_robots.py against a local fixture server.
+'''
+import sys
+import time
+import robotparser
+
+from entitycrawler.crawler import robots
+
+ROUNDS = 20000
+BASE = 'http://www.example.com'
+
+SYNTHETIC = '\n'.join(
+    ['User-agent: *', 'Crawl-delay: 2'] +
+    ['Disallow: /private-%d/' % i for i in range(100)] +
+    ['Allow: /private-7/public/', 'Disallow: /*.pdf$', 'Disallow: /search?',
+     '', 'User-agent: BadBot', 'Disallow: /'])
+
+
+def paths():
+    return ['/news/story-%d.html' % i for i in range(50)] + \
+           ['/private-%d/page.html' % i for i in range(0, 100, 10)] + \
+           ['/private-7/public/a.html', '/files/report.pdf', '/search?q=x']
+
+
+def main(args):
+    text = open(args[0]).read() if args else SYNTHETIC
+    checks = paths()
+
+    rules = robots.RobotsRules(text)
+    start = time.time()
+    for i in xrange(ROUNDS):
+        rules.allowed(checks[i % len(checks)])
+    compiled_rate = ROUNDS / (time.time() - start)
+
+    parser = robotparser.RobotFileParser()
+    parser.parse(text.splitlines())
+    urls = [BASE + path for path in checks]
+    start = time.time()
+    for i in xrange(ROUNDS):
+        parser.can_fetch('TrendIn', urls[i % len(urls)])
+    stdlib_rate = ROUNDS / (time.time() - start)
+
+    print("checks/s: compiled %.0f, robotparser %.0f" % (compiled_rate, stdlib_rate))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+''' SoupScrapper text extraction: v3 (recursive, per-node fix_text) vs current.
+
+usage: python benchmarks/bench_soup_text.py [page.html ...]
+
+Prints extraction timings (parse excluded) for the given pages, by default
+the pages of tests/fixtures/soup_text and a synthetic one. Timings only:
+the V3 copy below leaves out the debug prints and the first-piece doubling
+of v3, so its output isn't v3's. That v4 gives v3's text is checked by
+tests/test_soup_text.py against outputs recorded from v3 itself.
+'''
+import os
+import sys
+import glob
+import time
+
+import bs4
+from bs4 import BeautifulSoup
+from ftfy import fix_text
+
+from entitycrawler.crawler.scrapers import SoupScrapper
+
+ROUNDS = 10
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'tests', 'fixtures', 'soup_text', '*.html')
+
+
+class V3(object):
+    ''' SoupScrapper v3 text extraction algorithm, for timing '''
+
+    def __init__(self, soup):
+        self.soup = soup
+
+    def _is_semantic_string(self, s):
+        return (s.parent.name in SoupScrapper.SEMANTIC_TAGS and
+                len(s.split()) <= SoupScrapper.SEMANTIC_TEXT_MAX_LEN)
+
+    def _grouping_parent(self, e):
+        while e and e.name not in SoupScrapper.GROUPING_TAGS:
+            e = e.parent
+        return e
+
+    def _extract_text_pieces(self, elements=None):
+        text = []
+        highlighted_strings = []
+        if not elements:
+            elements = self.soup.children
+        for e in elements:
+            if type(e) == bs4.element.NavigableString and e.parent.name in SoupScrapper.VISIBLE_TAGS:
+                t = fix_text(e).strip()
+                if t and self._is_semantic_string(e):
+                    highlighted_strings.append(t)
+                if len(t) > 2:
+                    text.append((t, e))
+            elif getattr(e, 'children', False):
+                t, h = self._extract_text_pieces(e.children)
+                text.extend(t)
+                highlighted_strings.extend(h)
+        return text, highlighted_strings
+
+    def _group_text(self, text):
+        result = text[:1]
+        for t, e in text[1:]:
+            prev_t, prev_e = result[-1]
+            if self._grouping_parent(e) == self._grouping_parent(prev_e):
+                result[-1] = (u'%s %s' % (prev_t, t), prev_e)
+            else:
+                result.append((t, e))
+        return result
+
+    def text(self):
+        text, highlights = self._extract_text_pieces()
+        text = self._group_text(text)
+        text = [t[0].strip() for t in text if t[0].strip()]
+        return text, highlights
+
+
+class V4(SoupScrapper):
+    ''' current SoupScrapper on an already downloaded page '''
+
+    def __init__(self, soup):
+        self.soup = soup
+
+    def text(self):
+        text, highlights = self._extract_text_pieces()
+        text = self._group_text(text)
+        text = [fix_text(t).strip() for t, _ in text]
+        return [t for t in text if t], [fix_text(h) for h in highlights]
+
+
+def synthetic_page():
+    blocks = ''.join('<div class="b%d"><p>Block %d about <b>Jane Doe</b> and <a href="#">More</a> '
+                     'news from <em>Acme Inc</em> today.</p><span>side %d</span></div>' % (i, i, i)
+                     for i in range(400))
+    return '<html><head><title>Page</title></head><body>%s</body></html>' % blocks
+
+
+def timed(cls, html):
+    soup = BeautifulSoup(html)
+    start = time.time()
+    for _ in range(ROUNDS):
+        result = cls(soup).text()
+    return result, (time.time() - start) / ROUNDS * 1000
+
+
+def main(paths):
+    pages = [(os.path.basename(p)[-20:], open(p, 'rb').read())
+             for p in paths or sorted(glob.glob(FIXTURES))]
+    if not paths:
+        pages.append(('synthetic', synthetic_page()))
+    print("%-20s %10s %10s" % ('page', 'v3 ms', 'v4 ms'))
+    for name, html in pages:
+        _, old_ms = timed(V3, html)
+        _, new_ms = timed(V4, html)
+        print("%-20s %10.2f %10.2f" % (name, old_ms, new_ms))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
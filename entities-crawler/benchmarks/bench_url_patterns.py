@@ -0,0 +1,100 @@
+''' URL pattern matching: regex loop (before) vs URLPatternMatcher (after).
+
+usage: python benchmarks/bench_url_patterns.py [patterns] [links]
+
+Matches a synthetic set of links (half of them to other hosts, like the
+links of a typical news page) against a crawler with tens of patterns, and
+reports links/s of the old per-regex loop of validate_link + match and of
+the combined matcher, after checking that both pick the same patterns.
+'''
+import re
+import sys
+import time
+import random
+
+from entitycrawler.crawler.urlmatch import URLPatternMatcher
+
+SECTIONS = ['news', 'sport', 'business', 'culture', 'tech', 'travel', 'auto',
+            'health', 'science', 'opinion', 'video', 'photo', 'world', 'local']
+ROUNDS = 5
+
+
+def make_patterns(count):
+    patterns = [('default', r'https?://(www\.)?site\.com/.*')]
+    for i in range(count - 1):
+        section = SECTIONS[i % len(SECTIONS)]
+        patterns.append(('p%d' % i, r'https?://(www\.)?site\.com/%s/%d/\d{4}/\d{2}/[\w-]+\.html' %
+                         (section, i)))
+    return patterns
+
+
+def make_links(count, patterns):
+    rnd = random.Random(1)
+    links = []
+    for i in range(count):
+        kind = rnd.random()
+        section = SECTIONS[rnd.randrange(len(SECTIONS))]
+        if kind < 0.5:
+            host = rnd.choice(['cdn.site-static.com', 'facebook.com', 'twitter.com',
+                               'ads.example.net', 'partner.org'])
+            links.append('https://%s/%s/%d' % (host, section, i))
+        elif kind < 0.8:
+            n = rnd.randrange(len(patterns) - 1)
+            links.append('http://www.site.com/%s/%d/2016/05/story-%d.html' %
+                         (SECTIONS[n % len(SECTIONS)], n, i))
+        else:
+            links.append('http://site.com/%s/page-%d' % (section, i))
+    return links
+
+
+def loop_match(regexes, default, url):
+    ''' validate_link + match as they were: every regex for every link '''
+    valid = False
+    for _id, regex in regexes:
+        if regex.match(url):
+            valid = True
+    if not valid:
+        return None
+    matches = []
+    default_match = False
+    for _id, regex in regexes:
+        if regex.match(url):
+            if _id == default:
+                default_match = True
+            else:
+                matches.append(_id)
+    if matches:
+        return matches[0]
+    return default if default_match else None
+
+
+def rate(func, links):
+    start = time.time()
+    for _ in range(ROUNDS):
+        for url in links:
+            func(url)
+    return ROUNDS * len(links) / (time.time() - start)
+
+
+def main(args):
+    pattern_count = int(args[0]) if args else 40
+    link_count = int(args[1]) if len(args) > 1 else 5000
+    patterns = make_patterns(pattern_count)
+    links = make_links(link_count, patterns)
+
+    regexes = [(_id, re.compile(source, re.IGNORECASE)) for _id, source in patterns]
+    matcher = URLPatternMatcher(patterns, 'default')
+
+    mismatches = [url for url in links
+                  if loop_match(regexes, 'default', url) != matcher.match_id(url)]
+    assert not mismatches, mismatches[:5]
+
+    matched = sum(1 for url in links if matcher.match_id(url) is not None)
+    print("%s patterns, %s links, %s matched" % (pattern_count, link_count, matched))
+    print("links/s: regex loop %.0f, combined matcher %.0f" % (
+        rate(lambda url: loop_match(regexes, 'default', url), links),
+        rate(matcher.match_id, links)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+''' URL canonicalization.
+
+The canonical form of a URL is the key the crawler dedupes on (the seen
+filter, and the canonical_key crawled pages are stored and looked up by),
+so variants of one article (tracking parameters, parameter order, default
+port, fragment) are queued and fetched once. The URL itself is still what
+gets fetched, stored and matched against the URL patterns. Rules can be
+changed per website (Website.url_rules), e.g. {'strip_www': True,
+'drop_params': ['sessid'], 'trailing_slash': False}; folding www./bare
+host and trailing slashes is opt-in, only for sites serving both forms.
+A fetched page is stored under its same-site <link rel="canonical">.
+'''
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+TRACKING_PREFIXES = ('utm_',)
+TRACKING_PARAMS = frozenset(['fbclid', 'gclid', 'yclid', 'dclid', 'msclkid', 'mc_cid',
+                             'mc_eid', '_openstat', 'igshid', 'ref_src'])
+
+DEFAULT_RULES = {
+    'strip_www': False,
+    'sort_query': True,
+    'trailing_slash': None,   # None: keep, False: strip it (except for /), True: add it
+    'drop_params': [],        # site specific params to drop, on top of tracking ones
+    'keep_params': None,      # if set, the only params kept
+    'drop_query': False,
+}
+
+
+def _host(netloc):
+    return netloc.rsplit('@', 1)[-1].split(':', 1)[0].lower()
+
+
+def _site(host):
+    return host[4:] if host.startswith('www.') else host
+
+
+class CanonicalRules(object):
+
+    def __init__(self, rules=None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+        self.drop_params = TRACKING_PARAMS.union(p.lower() for p in self.rules['drop_params'])
+        keep = self.rules['keep_params']
+        self.keep_params = frozenset(keep) if keep is not None else None
+
+    def _keep_param(self, name):
+        if self.keep_params is not None:
+            return name in self.keep_params
+        lowered = name.lower()
+        return lowered not in self.drop_params and not lowered.startswith(TRACKING_PREFIXES)
+
+    def canonicalize(self, url):
+        ''' Canonical form of absolute url (other URLs are returned as is) '''
+        is_unicode = isinstance(url, unicode)
+        if is_unicode:
+            url = url.encode('utf-8')
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.netloc:
+            return url.decode('utf-8') if is_unicode else url
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        path, query = parts.path, parts.query
+
+        host = _host(parts.netloc)
+        if self.rules['strip_www']:
+            host = _site(host)
+        if port and port != DEFAULT_PORTS[scheme]:
+            host = '%s:%s' % (host, port)
+
+        path = path or '/'
+        if path != '/' and self.rules['trailing_slash'] is not None:
+            if self.rules['trailing_slash']:
+                if not path.endswith('/') and '.' not in path.rsplit('/', 1)[-1]:
+                    path += '/'
+            else:
+                path = path.rstrip('/') or '/'
+
+        if self.rules['drop_query']:
+            query = ''
+        elif query:
+            params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True)
+                      if self._keep_param(k)]
+            if self.rules['sort_query']:
+                params.sort()
+            query = urlencode(params)
+
+        url = urlunsplit((scheme, host, path, query, ''))
+        return url.decode('utf-8', 'replace') if is_unicode else url
+
+    def canonical_of(self, url, declared):
+        ''' URL to store the page fetched from url under: the href of its
+            <link rel="canonical"> when that is on the same site, else url '''
+        if declared:
+            declared_host = _host(urlsplit(declared).netloc)
+            if declared_host and _site(declared_host) == _site(_host(urlsplit(url).netloc)):
+                return declared
+        return url
+
+
+DEFAULT_CANONICAL = CanonicalRules()
+
+
+def canonicalize(url, rules=None):
+    return (rules or DEFAULT_CANONICAL).canonicalize(url)
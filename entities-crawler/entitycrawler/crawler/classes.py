@@ -6,7 +6,13 @@ from urlparse import urlparse
 from pymongo import MongoClient
 from scrapers import (NewspaperScrapper, SoupScrapper,
                       ReadabilityScrapper, DefaultScrapper, SCRAPPERS_BY_TYPE)
+from scrapers.dates import DEFAULT_DATE_DETECTOR, DATE_DETECTORS_BY_TYPE
 from crawlers import LinksCrawler, SitemapCrawler, RSSCrawler, choose_crawler_type
+from frontier import MAX_DEPTH, MAX_SIZE
+from canonical import CanonicalRules
+from urlmatch import URLPatternMatcher
+import patternindex
+from counters import CRAWL_COUNTERS, COUNTER_FIELDS, WEBSITE_FIELDS
 from entitycrawler.db import (
     CRAWLERS_POOL_NAME,
     WEBSITES_COL,
@@ -17,8 +23,10 @@ from entitycrawler.db import (
     WEBSITES_CANDIDATES_COL,
     URL_MATCHING_COL,
 )
-from entitycrawler.extractor import EntityExtractor, ExtractedPage
+from entitycrawler.extractor import EntityExtractor, ExtractedPage, dedup
+from entitycrawler import htmlstore
 from entitycrawler.crawler.exceptions import NoMatchedPatternError
+from entitycrawler.utils import lazyprop
 
 
 STATUS = {'disabled': 0,
@@ -29,6 +37,18 @@ STATUS = {'disabled': 0,
 DEFAULT_MAX_AGE = 31536000
 DEFAULT_FREQUENCY = 3600
 
+# fields read by the models, for bulk loading (Website.get_all)
+WEBSITE_PROJECTION = ['name', 'status', 'publisher_id', 'publisher_name', 'website_url',
+                      'website_ad_position', 'website_templates', 'category', 'crawler_type',
+                      'url_rules', 'pages', 'extracted_pages', 'errors', 'bytes',
+                      'date_created', 'date_lastupdated']
+CRAWLER_PROJECTION = ['name', 'status', 'crawling_status', 'website_id', 'category', 'scraper',
+                      'date_detector', 'extractor', 'start_url', 'default_url_pattern', 'age',
+                      'frequency', 'max_depth', 'max_frontier', 'crawler_type', 'crawled_pages',
+                      'extracted_pages', 'errors', 'bytes', 'date_created', 'date_lastupdated']
+PATTERN_PROJECTION = ['website', 'crawler', 'pattern', 'harvester_categories',
+                      'exclude_words', 'ad_script']
+
 logger = logging.getLogger('crawler')
 
 
@@ -36,14 +56,18 @@ class WebsiteURLPatterns:
 
     ''' Patterns manager '''
 
-    def __init__(self, crawler):
+    def __init__(self, crawler, patterns=None):
+        ''' patterns - url_patterns records of crawler if already loaded '''
         self.crawler = crawler
         self.db = crawler.db
 
         self.website = crawler.get_website().hostname
         self.default = crawler.default_url_pattern
-        self.patterns = list(self.db[URL_MATCHING_COL].find({'crawler': crawler._id}))
+        if patterns is None:
+            patterns = self.db[URL_MATCHING_COL].find({'crawler': crawler._id})
+        self.patterns = list(patterns)
         self.regexes = {}
+        self._matcher = None
 
         for pattern in self.patterns:
             self.regexes[pattern['_id']] = self._make_regex(pattern['pattern'])
@@ -52,6 +76,16 @@ class WebsiteURLPatterns:
     def _make_regex(pattern):
         return re.compile(pattern, re.IGNORECASE)
 
+    @property
+    def matcher(self):
+        ''' All regexes compiled into one URLPatternMatcher, rebuilt after save() '''
+        if self._matcher is None:
+            order = [p['_id'] for p in self.patterns if p['_id'] in self.regexes]
+            order += [_id for _id in self.regexes if _id not in order]
+            self._matcher = URLPatternMatcher(
+                [(_id, self.regexes[_id].pattern) for _id in order], self.default)
+        return self._matcher
+
     def get_list(self):
         return self.patterns
 
@@ -59,68 +93,32 @@ class WebsiteURLPatterns:
         if url[-4:] in ('.jpg', '.png'):
             return False
         url = url.split("#")[0]
-        for _id, regex in self.regexes.iteritems():
-            if regex.match(url):
-                return True
-        return False
+        return self.matcher.match_id(url) is not None
+
+    def match_id(self, url):
+        ''' _id of the first non-default pattern matching url, else the
+            default pattern _id if it matches, else None (no DB lookups) '''
+        return self.matcher.match_id(url)
 
     def match(self, url):
-        matches = []
-        default_match = False
-        for _id, regex in self.regexes.iteritems():
-            if regex.match(url):
-                if _id == self.default:
-                    default_match = True
-                else:
-                    matches.append(_id)
-        if not default_match and len(matches) == 0:
+        _id = self.match_id(url)
+        if _id is None:
             return None
-        if len(matches) > 0:
-            if len(matches) > 1:
-                print("URL %s matched for more then one non-default patterns: %s" % (
-                    url, [pattern['pattern'] for pattern in self.patterns]))
-                print ("using first match")
-            return self.get_pattern(_id=matches[0], db=self.db, redis=self.crawler.redis)
-        else:
-            return self.get_pattern(_id=self.default, db=self.db, redis=self.crawler.redis)
+        return self.get_pattern(_id=_id, db=self.db, redis=self.crawler.redis)
 
     @staticmethod
-    def arbitrary_match(url, db):
-        website = urlparse(url).hostname
-        s = website.split('.')
-        if s[0] == "www":
-            patterns = list(db[URL_MATCHING_COL].find({'website': website}))
-            website = '.'.join(s[1:])
-            patterns.extend(list(db[URL_MATCHING_COL].find({'website': website})))
-        else:
-            patterns = list(db[URL_MATCHING_COL].find({'website': "www." + website}))
-            patterns.extend(list(db[URL_MATCHING_COL].find({'website': website})))
-        default_ids = [crawler['default_url_pattern'] for crawler in db[CRAWLERS_COL].find()]
-        matches = []
-        default_match = False
-        for pattern in patterns:
-            regex = WebsiteURLPatterns._make_regex(pattern['pattern'])
-            if regex.match(url):
-                if pattern['_id'] in default_ids:
-                    default_match = True
-                    default = pattern['_id']
-                else:
-                    matches.append(pattern['_id'])
-        if not default_match and len(matches) == 0:
+    def arbitrary_match(url, db, redis=None):
+        ''' Pattern of any crawler of url's site that url matches (from the
+            in-process pattern index, non-default patterns first) '''
+        _id = patternindex.get_index(db, redis).match_id(url)
+        if _id is None:
             return None
-        if len(matches) > 0:
-            if len(matches) > 1:
-                print("URL %s matched for more then one non-default patterns: %s" % (
-                    url, [pattern['pattern'] for pattern in patterns]))
-                print("using first match")
-            matched = WebsiteURLPatterns.get_pattern(db=db, _id=matches[0], redis=None)
-        else:
-            matched = WebsiteURLPatterns.get_pattern(db=db, _id=default, redis=None)
-        return matched
+        return WebsiteURLPatterns.get_pattern(db=db, _id=_id, redis=redis)
 
     @staticmethod
-    def delete(db, _id):
+    def delete(db, _id, redis=None):
         db[URL_MATCHING_COL].remove({'_id': _id})
+        patternindex.bump(redis)
 
     @staticmethod
     def get_pattern(_id, db, redis=None):
@@ -136,13 +134,18 @@ class WebsiteURLPatterns:
                 crawler.url_patterns.save(data, new=False)
         if not isinstance(_id, ObjectId):
             _id = ObjectId(_id)
-        pattern = db[URL_MATCHING_COL].find_one({'_id': _id})
-        print("PATTERN FROM DB", pattern)
+        pattern = patternindex.get_index(db, redis).pattern(_id)
+        if pattern is None:
+            # saved after the index was loaded, before the change was seen
+            pattern = db[URL_MATCHING_COL].find_one({'_id': _id})
+            print("PATTERN FROM DB", pattern)
+            crawler = db[CRAWLERS_COL].find_one({'_id': pattern['crawler']},
+                                                {'default_url_pattern': 1}) or {}
+            dflt = crawler.get('default_url_pattern')
+            pattern['default'] = dflt == pattern['_id'] or dflt == None
         pattern['id'] = str(pattern['_id'])
         pattern['db'] = db
         pattern['redis'] = redis
-        dflt = WebsiteCrawler.get_by_id(pattern['crawler'], db=db, redis=None).default_url_pattern
-        pattern['default'] = dflt == pattern['_id'] or dflt == None
         return Pattern(**pattern)
 
     def _save(self, pattern):
@@ -177,8 +180,10 @@ class WebsiteURLPatterns:
             elif data.has_key('id'):
                 url_pattern['_id'] = ObjectId(data['id'])
         _id = self._save(url_pattern)
+        patternindex.bump(self.crawler.redis)
 
         self.regexes[_id] = self._make_regex(data.get('pattern', data.get('url_pattern')))
+        self._matcher = None
         if not new:
             url_pattern['_id'] = _id
             self.patterns = [pattern for pattern in self.patterns if pattern['_id'] != _id]
@@ -196,6 +201,7 @@ class WebsiteCrawler:
                     website_id: ID,
                     website_name: text,
                     scraper: BSOUP\NEWSP,
+                    date_detector: bounded\structured\full,
                     extractor: our_extractor1,
                     pages: int,
                     start_url: text,
@@ -203,6 +209,8 @@ class WebsiteCrawler:
                     default_url_pattern: id,
                     age: int,
                     frequency: int ,
+                    max_depth: int,
+                    max_frontier: int,
                     date_created: Date,
                     date_lastupdated: Date }'''
     ENABLED = STATUS['enabled']
@@ -235,21 +243,42 @@ class WebsiteCrawler:
         self.website_id = db_record["website_id"]
         self.category = db_record['category']
         self.scraper_type = db_record["scraper"]
+        self.date_detector = db_record.get("date_detector", DEFAULT_DATE_DETECTOR)
         self.extractor_type = db_record["extractor"]
         self.crawled_pages = db_record.get("crawled_pages", 0)
         self.start_url = db_record["start_url"]
         self.age = db_record["age"]
         self.frequency = db_record["frequency"]
+        self.max_depth = db_record.get("max_depth", MAX_DEPTH)
+        self.max_frontier = db_record.get("max_frontier", MAX_SIZE)
         self.date_created = db_record["date_created"]
         self.date_lastupdated = db_record["date_lastupdated"]
         self.crawler_type = db_record["crawler_type"]
         self.default_url_pattern = db_record.get("default_url_pattern", None)
 
         self.scraper = self._get_scrapper(db_record["scraper"])
-        self.crawler = self._get_crawler(db_record["crawler_type"])
         assert (db_record["extractor"][:-2] == EntityExtractor.name[:-2])
-        self.extractor = EntityExtractor(db)
-        self.url_patterns = WebsiteURLPatterns(self)
+        # the rest is only built when used (crawling, pattern edits), and
+        # rebuilt from the new record on update()
+        for name in ('_lazy_crawler', '_lazy_url_patterns', '_lazy_canonical', 'pattern_records'):
+            self.__dict__.pop(name, None)
+
+    @lazyprop
+    def crawler(self):
+        return self._get_crawler(self.crawler_type)
+
+    @lazyprop
+    def extractor(self):
+        return EntityExtractor.shared(self.db)
+
+    @lazyprop
+    def url_patterns(self):
+        # records preloaded by Website.get_all are used once
+        return WebsiteURLPatterns(self, self.__dict__.pop('pattern_records', None))
+
+    @lazyprop
+    def canonical(self):
+        return CanonicalRules(self.get_website().url_rules)
 
     def _getstatus(self):
         return False if self.status == STATUS['disabled'] else True
@@ -289,16 +318,20 @@ class WebsiteCrawler:
             'crawling_status': 0,
             'website_id': kwargs['website_id'],
             'scraper': kwargs.get('scraper', DefaultScrapper.name),
+            'date_detector': kwargs.get('date_detector') or DEFAULT_DATE_DETECTOR,
             'category': kwargs['category'],
             'extractor': kwargs.get('extractor', EntityExtractor.name),
             'start_url': kwargs['start_url'],
             'age': kwargs.get('age') or DEFAULT_MAX_AGE,
             'frequency': kwargs.get('frequency') or DEFAULT_FREQUENCY,
+            'max_depth': kwargs.get('max_depth') or MAX_DEPTH,
+            'max_frontier': kwargs.get('max_frontier') or MAX_SIZE,
             'crawler_type': kwargs['crawler_type'],
             'crawled_pages': 0,
             'date_created': datetime.datetime.now(),
             'date_lastupdated': datetime.datetime.now()}
         assert kwargs['crawler_type'] in [LinksCrawler._type, SitemapCrawler._type, RSSCrawler._type]
+        assert crawler_data['date_detector'] in DATE_DETECTORS_BY_TYPE
         crawler_data['_id'] = db[CRAWLERS_COL].insert(crawler_data)
         new_crawler = WebsiteCrawler(crawler_data, db=db, redis=redis)
 
@@ -320,6 +353,7 @@ class WebsiteCrawler:
         self.dequeue()
         self.db[CRAWLERS_COL].remove({'_id': ObjectId(self._id)})
         self.db[URL_MATCHING_COL].remove({'crawler': ObjectId(self._id)})
+        patternindex.bump(self.redis)
 
     def update(self, doc=None, upsert=False, check_status=True):
         if doc is None:
@@ -330,11 +364,14 @@ class WebsiteCrawler:
                    'website_id': self.website_id,
                    'category': self.category,
                    'scraper': self.scraper_type,
-                   'extractor': self.extractor.name,
+                   'date_detector': self.date_detector,
+                   'extractor': EntityExtractor.name,
                    'start_url': self.start_url,
                    'default_url_pattern': self.default_url_pattern,
                    'age': self.age,
                    'frequency': self.frequency,
+                   'max_depth': self.max_depth,
+                   'max_frontier': self.max_frontier,
                    'crawler_type': self.crawler_type,
                    'crawled_pages': self.crawled_pages,
                    'date_created': self.date_created,
@@ -343,14 +380,25 @@ class WebsiteCrawler:
         old_doc = self.db[CRAWLERS_COL].find_one({'_id': ObjectId(self._id)})
         if isinstance(old_doc, dict):
             if old_doc['age'] != self.age:
+                crawled_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.age)
                 self.db[CRAWLED_PAGES_COL].update({'category': self.category},
-                                                  {"$set": {'crawled_at': datetime.datetime.utcnow() + datetime.timedelta(seconds=self.age)}},
+                                                  {"$set": {'crawled_at': crawled_at}},
                                                   multi=True)
+                # the HTML blobs of these pages have to live as long
+                htmlstore.extend(self.db, self.db[CRAWLED_PAGES_COL].distinct(
+                    'html_hash', {'category': self.category}), crawled_at)
+            # counters are only ever $inc'ed (see counters.CounterBuffer)
+            for field in COUNTER_FIELDS.intersection(old_doc):
+                doc[field] = old_doc[field]
         doc['date_lastupdated'] = datetime.datetime.now()
         doc['date_created'] = self.date_created
         self.db[CRAWLERS_COL].save(doc)
+        patternindex.bump(self.redis)
 
+        crawler = self.__dict__.get('_lazy_crawler')
         self.__init__(doc, db=self.db, redis=self.redis)
+        if crawler is not None:
+            self.crawler.url_buffer = crawler.url_buffer
         if check_status:
             self.update_queue()
 
@@ -376,25 +424,34 @@ class WebsiteCrawler:
         try:
             website = self.website
         except:
-            website = Website.get_by_id(self.website_id, db=self.db, redis=self.redis)
+            website = self.website = Website.get_by_id(self.website_id, db=self.db, redis=self.redis)
         return website
 
     def check_url_age(self, url):
-        if self.start_url == url:
-            return True
-        record = self.db[CRAWLED_PAGES_COL].find_one({"url": url})
-        if record is None:
-            print("check_url_age record expired:", url)
-            return True
-        else:
-            print("check_url_age record exist:", url)
-            return False
+        return bool(self.check_urls_age([url]))
+
+    def check_urls_age(self, urls):
+        ''' urls (in order) that can be crawled now: start url or no crawled
+            page record, looked up by canonical_key (or url, for pages
+            stored without one) '''
+        keys = dict((url, self.canonical.canonicalize(url)) for url in urls)
+        crawled = set()
+        for r in self.db[CRAWLED_PAGES_COL].find(
+                {"$or": [{"canonical_key": {"$in": list(set(keys.values()))}},
+                         {"url": {"$in": list(keys)}}]},
+                {"url": 1, "canonical_key": 1, "_id": 0}):
+            crawled.add(r['url'])
+            crawled.add(r.get('canonical_key'))
+        allowed = [url for url in urls
+                   if url == self.start_url or (url not in crawled and keys[url] not in crawled)]
+        print("check_urls_age: %s of %s urls already crawled" % (len(urls) - len(allowed), len(urls)))
+        return allowed
 
     def queue(self):
         self.redis.rpush(CRAWLERS_POOL_NAME, self.id)
 
     def dequeue(self):
-        self.redis.lrem(CRAWLERS_POOL_NAME, self.id)
+        self.redis.lrem(CRAWLERS_POOL_NAME, 0, self.id)
 
     def update_queue(self):
         if self.enabled:
@@ -403,9 +460,9 @@ class WebsiteCrawler:
             self.dequeue()
 
     def inc_crawled_count(self):
-        print("Inc Crawler Count")
+        ''' Buffered, written by CRAWL_COUNTERS.flush() '''
         self.crawled_pages += 1
-        self.update(check_status=False)
+        CRAWL_COUNTERS.count(self, crawled_pages=1)
 
 
 class Website:
@@ -421,6 +478,7 @@ class Website:
                     website_templates: [],
                     category: text,
                     crawler_type: sitemaps\links,
+                    url_rules: {}, (see crawler.canonical)
                     pages: int,
                     date_created: Date,
                     date_lastupdated: Date } '''
@@ -435,7 +493,8 @@ class Website:
 
     enabled = property(_getstatus, doc="Check if crawler Enabled or Disabled.")
 
-    def __init__(self, db_record, db, redis):
+    def __init__(self, db_record, db, redis, crawler_records=None):
+        ''' crawler_records - crawlers of the website if already loaded '''
         self.db = db
         self.redis = redis
 
@@ -451,24 +510,39 @@ class Website:
         self.website_ad_position = db_record.get('website_ad_position', u"")
         self.website_templates = db_record.get('website_templates')
         self.category = db_record['category']
-        self.crawler_type = db_record.get('crawler_type', choose_crawler_type(self.website_url))
+        # `or`, not a get() default: choosing the type fetches robots.txt/sitemaps
+        self.crawler_type = db_record.get('crawler_type') or choose_crawler_type(self.website_url)
+        self.url_rules = db_record.get('url_rules') or {}
 
         self.pages = db_record.get('pages', self.update_pages())
         self.date_created = db_record.get('date_created', datetime.datetime.now())
         self.date_lastupdated = db_record.get('date_lastupdated', datetime.datetime.now())
-        self.crawlers = [WebsiteCrawler(record, website=self, db=self.db, redis=self.redis) for record in
-                         db[CRAWLERS_COL].find({"website_id": self._id})]
+        if crawler_records is None:
+            crawler_records = db[CRAWLERS_COL].find({"website_id": self._id})
+        self.crawlers = [WebsiteCrawler(record, website=self, db=self.db, redis=self.redis)
+                         for record in crawler_records]
 
     @classmethod
     def get_all(cls, db, redis, status=None):
-        ''' List websites '''
+        ''' List websites with their crawlers and the crawlers' URL patterns,
+            loaded with three queries '''
+        query = {'status': status} if status is not None else {}
+        records = list(db[WEBSITES_COL].find(query, WEBSITE_PROJECTION))
+        crawlers = {}
+        for record in db[CRAWLERS_COL].find({'website_id': {'$in': [r['_id'] for r in records]}},
+                                            CRAWLER_PROJECTION):
+            crawlers.setdefault(record['website_id'], []).append(record)
+        patterns = {}
+        crawler_ids = [c['_id'] for records_ in crawlers.itervalues() for c in records_]
+        for record in db[URL_MATCHING_COL].find({'crawler': {'$in': crawler_ids}},
+                                                PATTERN_PROJECTION):
+            patterns.setdefault(record['crawler'], []).append(record)
         websites = []
-        if status is not None:
-            wersites_records = db[WEBSITES_COL].find({'status': status})
-        else:
-            wersites_records = db[WEBSITES_COL].find()
-        for c in wersites_records:
-            websites.append(Website(c, db, redis=redis))
+        for record in records:
+            website = Website(record, db, redis=redis, crawler_records=crawlers.get(record['_id'], []))
+            for crawler in website.crawlers:
+                crawler.pattern_records = patterns.get(crawler._id, [])
+            websites.append(website)
         return websites
 
     @classmethod
@@ -510,10 +584,15 @@ class Website:
                      'website_templates': self.website_templates,
                      'category': self.category,
                      'crawler_type': self.crawler_type,
+                     'url_rules': self.url_rules,
                      'pages': self.update_pages(),
                      'date_created': self.date_created,
                      'date_lastupdated': datetime.datetime.now()
                      }
+        old_doc = self.db[WEBSITES_COL].find_one({'_id': self._id}) or {}
+        # counters are only ever $inc'ed (see counters.CounterBuffer)
+        for field in set(WEBSITE_FIELDS.values()).intersection(old_doc):
+            db_record[field] = old_doc[field]
         for key in doc.keys():
             if key == "enabled":
                 db_record['status'] = STATUS['enabled'] if doc['enabled'] else STATUS['disabled']
@@ -557,6 +636,7 @@ class Website:
                         'website_templates': [],
                         'category': site_category,
                         'crawler_type': crawler_type,
+                        'url_rules': {},
                         'pages': 0,
                         'date_created': datetime.datetime.now(),
                         'date_lastupdated': datetime.datetime.now()}
@@ -587,6 +667,10 @@ class Website:
             'sentiment', 1).limit(LIMIT_QUERY))
         return top_entities, top_candidates, top_postitive, top_negative
 
+    def get_duplicate_rate(self):
+        ''' (pages, near-duplicates, rate) seen by the extractor for this site '''
+        return dedup.duplicate_rate(self.db, self.hostname)
+
     def generate_report(self, include, exclude):
         urls = self.db[EXTRACTED_PAGES_COL]
         words = list(include.difference(exclude))
@@ -676,7 +760,7 @@ class CrawlerService:
         else:
             self.db = mongodb
         self.redis = redis
-        self.extractor = EntityExtractor(mongodb)
+        self.extractor = EntityExtractor.shared(mongodb)
 
     def create_website_record(self, publisher_name, name, website_url, site_category):
         ''' Create website record '''
@@ -702,7 +786,7 @@ class CrawlerService:
         if _id:
             pattern = WebsiteURLPatterns.get_pattern(_id=_id, db=self.db, redis=self.redis)
         else:
-            pattern = WebsiteURLPatterns.arbitrary_match(url=url, db=self.db)
+            pattern = WebsiteURLPatterns.arbitrary_match(url=url, db=self.db, redis=self.redis)
 
             if not pattern:
                 raise NoMatchedPatternError(url)
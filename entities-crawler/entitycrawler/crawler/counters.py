@@ -0,0 +1,78 @@
+''' Buffered crawl counters.
+
+Per-crawler and per-website counts (pages crawled and extracted, errors,
+bytes downloaded) are added up in process memory and written to MongoDB
+by flush() with one unordered bulk of $inc updates per collection, instead
+of an update per page. The crawler service flushes every minute; a crash
+loses at most the counts of that minute.
+'''
+import logging
+from collections import Counter
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from entitycrawler.db import CRAWLERS_COL, WEBSITES_COL
+
+log = logging.getLogger("crawler")
+
+# crawler counter -> website counter
+WEBSITE_FIELDS = {
+    'crawled_pages': 'pages',
+    'extracted_pages': 'extracted_pages',
+    'errors': 'errors',
+    'bytes': 'bytes',
+}
+COUNTER_FIELDS = frozenset(WEBSITE_FIELDS)
+
+
+class CounterBuffer(object):
+
+    def __init__(self):
+        self._pending = {}  # (collection, _id) -> Counter
+
+    def inc(self, collection, _id, **fields):
+        counts = self._pending.get((collection, _id))
+        if counts is None:
+            counts = self._pending[(collection, _id)] = Counter()
+        counts.update(fields)
+
+    def count(self, crawler, **fields):
+        ''' Add fields (crawled_pages=1, bytes=...) to a WebsiteCrawler
+            and its website '''
+        self.inc(CRAWLERS_COL, crawler._id, **fields)
+        self.inc(WEBSITES_COL, crawler.website_id,
+                 **dict((WEBSITE_FIELDS[f], n) for f, n in fields.iteritems()))
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self, db):
+        ''' Write pending counts, one bulk per collection '''
+        pending, self._pending = self._pending, {}
+        ops = {}
+        for (collection, _id), counts in pending.iteritems():
+            inc = dict((f, n) for f, n in counts.iteritems() if n)
+            if inc:
+                ops.setdefault(collection, []).append((_id, inc))
+        for collection, updates in ops.iteritems():
+            try:
+                db[collection].bulk_write([UpdateOne({'_id': _id}, {'$inc': inc})
+                                           for _id, inc in updates], ordered=False)
+            except BulkWriteError as e:
+                # an unordered bulk applies all but the failed updates,
+                # only those are kept for the next flush
+                failed = [updates[error['index']] for error in e.details.get('writeErrors', [])]
+                log.error("flushing %s of %s counters of %s failed: %s",
+                          len(failed), len(updates), collection, e)
+                for _id, inc in failed:
+                    self.inc(collection, _id, **inc)
+            except Exception as e:
+                log.error("flushing %s counters of %s failed: %s", len(updates), collection, e)
+                # nothing was written, keep them all for the next flush
+                for _id, inc in updates:
+                    self.inc(collection, _id, **inc)
+        return sum(len(updates) for updates in ops.itervalues())
+
+
+CRAWL_COUNTERS = CounterBuffer()
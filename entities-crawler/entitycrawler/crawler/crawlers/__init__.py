@@ -1,62 +1,133 @@
 import datetime as dt
+import time
+import calendar
 import logging
-import requests
-import re
-from BeautifulSoup import BeautifulSoup
+from collections import deque
+from urlparse import urljoin
+
+import pytz
 import feedparser
-import urllib2
+from requests.exceptions import RequestException
 
+from entitycrawler import httpclient
 from entitycrawler.crawler.scrapers import ScrappedPage
-from entitycrawler.db import CRAWLER_QUEUE_PREFIX
+from entitycrawler.crawler.scrapers.document import ParsedDocument
+from entitycrawler.crawler.seen import SeenFilter, SEEN_ERROR_RATE
+from entitycrawler.crawler.robots import RobotsCache
+from entitycrawler.crawler import sitemaps
+from entitycrawler.crawler.frontier import Frontier, SPECIFIC_PATTERN, DEFAULT_PATTERN
+from entitycrawler.crawler.roundtrips import RoundTripCounter
+from entitycrawler.crawler.revisit import RevisitSchedule
+from entitycrawler.crawler.counters import CRAWL_COUNTERS
+from entitycrawler.crawler.exceptions import (PageNotModifiedError,
+                                               UnsupportedContentError,
+                                               PageTooLargeError)
+from entitycrawler.db import SITEMAP_VISIT_PREFIX, FEED_STATE_PREFIX, FEED_URL_PREFIX
 
 log = logging.getLogger("crawler")
 log.level = logging.DEBUG
 
+FRONTIER_BATCH = 20  # URLs popped from the Redis frontier per round trip
+SITEMAP_BATCH = 500  # sitemap URLs checked and queued per round trip
+FEED_DISCOVERY_TTL = 24 * 3600
+
 
 class CrawlerClass(object):
     name = ''
+    frontier_batch = FRONTIER_BATCH
+    seen_error_rate = SEEN_ERROR_RATE
+    # crawl_page claims and records start page visits; False when
+    # _generate_urls does it for the whole sitemap walk / feed poll
+    start_page_revisits = True
 
     def __init__(self, scrapper, crawler_manager):
         self.scrapper = scrapper
         self.crawler = crawler_manager
-        self.redis = crawler_manager.redis
+        self.redis = RoundTripCounter(crawler_manager.redis)
         self.db = crawler_manager.db
         self.name = crawler_manager.id
 
-        self.start_url_crawled_at = None
+        self.revisit = RevisitSchedule(self.redis, self.name, crawler_manager.frequency)
         self.on_pause = False
+        # (url, depth) popped from Redis and checked against crawled_pages,
+        # not crawled yet
+        self.url_buffer = deque()
+        self.depth = 0  # of the page being crawled
+        self.frontier = Frontier(self.redis, self.name, crawler_manager.max_depth,
+                                 crawler_manager.max_frontier)
+        self.seen = SeenFilter(self.redis, self.name, crawler_manager.age,
+                               error_rate=self.seen_error_rate)
+        self.robots = RobotsCache(self.redis)
 
     def get_url(self):
-        ''' Get URL from queue, or try to generate queue '''
+        ''' Get URL from the local buffer, refilling it from the queue in
+            batches, or try to generate queue '''
         log.debug("geturl")
-        url = self.redis.spop(CRAWLER_QUEUE_PREFIX + self.name)
-        log.debug("url from redis %s", url)
-        if url is None:
-            url = self._generate_urls()
-            log.debug("generated url %s", url)
-        if not self.crawler.check_url_age(url):
-            url = self.get_url()
-        log.debug("got url: %s", url)
+        generated = False
+        while not self.url_buffer:
+            entries = self.frontier.pop(self.frontier_batch)
+            log.debug("urls from redis %s", len(entries))
+            if not entries:
+                if generated:
+                    return None
+                generated = True
+                # _generate_urls either returns the url to crawl or queues
+                # urls into the frontier and returns None
+                url = self._generate_urls()
+                log.debug("generated url %s", url)
+                if url is None:
+                    continue
+                entries = [(url, 0)]
+            depths = dict(entries)
+            urls = self.crawler.check_urls_age([url for url, _ in entries])
+            self.url_buffer.extend((url, depths[url]) for url in urls)
+        url, self.depth = self.url_buffer.popleft()
+        log.debug("got url: %s (depth %s)", url, self.depth)
         return url
 
-    @staticmethod
-    def is_html(url):
-        if re.search('.html|.htm', url) is None:
-            resp = requests.head(url)
-            if 'content-type' in resp.headers:
-                if resp.headers['content-type'].split(';')[0] != 'text/html':
-                    log.debug("wrong content type: " + url)
-                    return False
-            return True
-        else:
-            return True
+    def pattern_rank(self, url):
+        if self.crawler.url_patterns.match_id(url) in (None, self.crawler.default_url_pattern):
+            return DEFAULT_PATTERN
+        return SPECIFIC_PATTERN
+
+    def queue_urls(self, urls, depth=1):
+        ''' Add the urls not queued during the last crawler age to the frontier;
+            they are deduped on their canonical form, and queued as they are '''
+        if depth > self.frontier.max_depth:
+            return 0
+        keys = []
+        by_key = {}
+        for url in urls:
+            key = self.crawler.canonical.canonicalize(url)
+            if key not in by_key:
+                keys.append(key)
+                by_key[key] = url
+        new = self.seen.add_many(keys)
+        if new:
+            self.frontier.push([by_key[key] for key in new], depth, self.pattern_rank)
+        return len(new)
+
+    def release_urls(self):
+        ''' Put buffered URLs back into the Redis frontier '''
+        by_depth = {}
+        for url, depth in self.url_buffer:
+            by_depth.setdefault(depth, []).append(url)
+        for depth, urls in by_depth.iteritems():
+            self.frontier.push(urls, depth, self.pattern_rank)
+        self.url_buffer.clear()
 
     def valid_url(self, url):
-        return self.crawler.url_patterns.validate_link(url)
+        return self.crawler.url_patterns.validate_link(url) and self.robots.allowed(url)
+
+    def _process_links(self, page):
+        ''' Queue links of a crawled page, return how many were new; only
+            LinksCrawler follows links, the others get their URLs from
+            sitemaps or feeds '''
+        return 0
 
     def can_resume(self):
         '''If crawler was paused before for some reason - can it resume right now?'''
-        return self._can_crawl_start_page()
+        return self.revisit.due()
 
     def pause(self):
         self.on_pause = True
@@ -65,44 +136,46 @@ class CrawlerClass(object):
         self.on_pause = False
 
     def _can_crawl_start_page(self):
-        log.debug('Last crawled at %s (freq: %s)', self.start_url_crawled_at,
-                  self.crawler.frequency)
-        now = dt.datetime.utcnow()
-        if not self.start_url_crawled_at:
-            self.start_url_crawled_at = now
-            return True
-        freq = dt.timedelta(seconds=int(self.crawler.frequency))
-        expire = self.start_url_crawled_at + freq
-        if expire > now:
-            log.debug('  skipping until %s', expire)
-            return False
-        log.debug('  crawling again')
-        self.start_url_crawled_at = now
-        return True
+        ''' Claim the next visit of the start page if it is due (see revisit) '''
+        return self.revisit.claim()
 
     def crawl_page(self):
         url = self.get_url()
         if url is None:
             return None
 
-        if url == self.crawler.start_url:
+        start_page = url == self.crawler.start_url and self.start_page_revisits
+        if start_page:
             log.debug('Start url reached')
-            if not self.can_resume():
+            if not self._can_crawl_start_page():
                 return self.pause()
 
-        if not self.is_html(url):
-            return None
-
         log.debug("crawling url %s", url)
         try:
             page = ScrappedPage(url=url, scrapper=self.scrapper._type,
-                                db=self.db)
+                                db=self.db, date_detector=self.crawler.date_detector,
+                                canonical=self.crawler.canonical)
+        except PageNotModifiedError:
+            log.debug("Not modified since last crawl, skipping: %s", url)
+            return None
+        except (UnsupportedContentError, PageTooLargeError) as e:
+            log.debug("Skipping: %s", e.message)
+            return None
         except Exception as e:
             log.debug("Exception in scrapper for url: %s\n%s", url, str(e))
+            CRAWL_COUNTERS.count(self.crawler, errors=1)
             return None
         assert isinstance(page.page, dict)
         assert isinstance(page, ScrappedPage)
-        self._process_links(page.page)
+        if page.downloaded_bytes is not None:
+            # not a page reused from crawled_pages
+            CRAWL_COUNTERS.count(self.crawler, crawled_pages=1, bytes=page.downloaded_bytes)
+        if page.url != url:
+            log.debug("canonical url of %s: %s", url, page.url)
+            self.seen.add_many([self.crawler.canonical.canonicalize(page.url)])
+        queued = self._process_links(page.page)
+        if start_page:
+            self.revisit.record(queued)
         return page
 
 
@@ -110,11 +183,12 @@ class LinksCrawler(CrawlerClass):
     _type = "links_crawler"
 
     def _process_links(self, page):
-        links = page['links']
-        for url in links:
-            if self.valid_url(url):
-                log.debug("found url: %s", url)
-                self.redis.sadd(CRAWLER_QUEUE_PREFIX + self.name, url)
+        links = [url for url in page['links'] if self.valid_url(url)]
+        # links queued during the last crawler age are dropped here instead
+        # of by a crawled_pages lookup once they come out of the queue
+        queued = self.queue_urls(links, self.depth + 1)
+        log.debug("found %s urls, %s new", len(links), queued)
+        return queued
 
     def _generate_urls(self):
         return self.crawler.start_url
@@ -122,11 +196,41 @@ class LinksCrawler(CrawlerClass):
 
 class SitemapCrawler(CrawlerClass):
     _type = "sitemap_crawler"
+    sitemap_batch = SITEMAP_BATCH
+    start_page_revisits = False
 
     @staticmethod
-    def has_sitemaps(url):
-        ''' Check if site has sitemap '''
-        return False
+    def has_sitemaps(url, redis=None):
+        ''' Check if site has sitemap (robots.txt Sitemap: or /sitemap.xml) '''
+        return bool(sitemaps.discover(url, RobotsCache(redis)))
+
+    def _last_visit(self):
+        visit = self.redis.get(SITEMAP_VISIT_PREFIX + self.name)
+        if visit is None:
+            return None
+        return dt.datetime.fromtimestamp(float(visit), pytz.utc)
+
+    def _generate_urls(self):
+        ''' Queue sitemap URLs modified since the previous sitemap walk '''
+        if not self._can_crawl_start_page():
+            return self.pause()
+        started = time.time()
+        since = self._last_visit()
+        found = queued = 0
+        batch = []
+        urls = sitemaps.iter_urls(sitemaps.discover(self.crawler.start_url, self.robots), since)
+        for url, _ in urls:
+            found += 1
+            if self.valid_url(url):
+                batch.append(url)
+            if len(batch) >= self.sitemap_batch:
+                queued += self.queue_urls(batch)
+                batch = []
+        queued += self.queue_urls(batch)
+        self.redis.set(SITEMAP_VISIT_PREFIX + self.name, started)
+        log.debug("sitemaps: %s urls changed since %s, %s queued", found, since, queued)
+        self.revisit.record(queued)
+        return None
 
 
 FEED_LINKS_ATTRIBUTES = [
@@ -141,7 +245,7 @@ FEED_LINKS_ATTRIBUTES = [
     'text/rss',
     'text/atom',
     'text/rdf+xml',
-    'text/rdf'
+    'text/rdf',
     'text/xml',
     'application/xml',
 ]
@@ -149,20 +253,21 @@ FEED_LINKS_ATTRIBUTES = [
 
 class RSSCrawler(CrawlerClass):
     _type = "rss_crawler"
+    start_page_revisits = False
 
     @staticmethod
-    def find_rss(url):
-        page = urllib2.urlopen(url)
-        soup = BeautifulSoup(page)
-        link = soup.find('link', type='application/rss+xm')
-        if link is not None:
-            return str(link['href'])
-        else:
-            return None
+    def find_rss(url, html=None):
+        ''' Feed advertised by a <link type="application/rss+xml" ...> of page url '''
+        if html is None:
+            html = httpclient.get(url).content
+        for _, attrs in ParsedDocument(html).link_tags(tags=('link',)):
+            if (attrs.get('type') or '').lower() in FEED_LINKS_ATTRIBUTES and attrs.get('href'):
+                return urljoin(url, attrs['href'].strip())
+        return None
 
     @staticmethod
     def is_rss(url):
-        resp = requests.head(url)
+        resp = httpclient.head(url)
         if 'content-type' in resp.headers:
             content_type = resp.headers['content-type'].split(';')
             if content_type[0] in FEED_LINKS_ATTRIBUTES:
@@ -171,41 +276,111 @@ class RSSCrawler(CrawlerClass):
         log.debug("not rss_feed content-type in:%s ", url)
         return False
 
-    def _parse_rss(self, url):
-        rss = feedparser.parse(url)
-        first_url = rss.entries.pop()
-        for post in rss.entries:
-            log.debug("found url: %s", post.link)
-            self.redis.sadd(CRAWLER_QUEUE_PREFIX + self.name, post.link)
-        return first_url.link
+    @staticmethod
+    def _fetch_feed(url, etag=None, modified=None):
+        ''' Download feed over the shared keep-alive pools, parse with feedparser.
+
+        Returns (feed, response headers), feed is None if not modified or
+        the feed couldn't be fetched.
+        '''
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if modified:
+            headers['If-Modified-Since'] = modified
+        try:
+            resp = httpclient.get(url, headers=headers)
+            if resp.status_code == 304:
+                return None, resp.headers
+            resp.raise_for_status()
+        except RequestException as e:
+            log.debug("feed %s not fetched: %s", url, e)
+            return None, {}
+        return feedparser.parse(resp.content, response_headers=dict(resp.headers)), resp.headers
+
+    @staticmethod
+    def _entry_time(entry):
+        published = entry.get('published_parsed') or entry.get('updated_parsed')
+        if published is None:
+            return None
+        return calendar.timegm(published)
+
+    def feed_url(self):
+        ''' start_url if it is a feed, else the feed it advertises (cached);
+            None if there's none or start_url couldn't be fetched '''
+        key = FEED_URL_PREFIX + self.crawler.start_url
+        url = self.redis.get(key)
+        if url is not None:
+            return url or None
+        url = self.crawler.start_url
+        try:
+            resp = httpclient.get(url)
+            resp.raise_for_status()
+        except RequestException as e:
+            log.debug("feed discovery on %s failed: %s", url, e)
+            return None
+        content_type = resp.headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in FEED_LINKS_ATTRIBUTES and 'html' in content_type:
+            url = self.find_rss(url, resp.content)
+            log.debug("discovered feed %s for %s", url, self.crawler.start_url)
+        self.redis.set(key, url or '', ex=FEED_DISCOVERY_TTL)
+        return url
+
+    def poll_feed(self, url):
+        ''' Links of entries newer than the last poll, [] when not modified.
+
+        ETag/Last-Modified and the newest entry time seen (high-water mark)
+        are kept in Redis per feed.
+        '''
+        key = FEED_STATE_PREFIX + url
+        state = self.redis.hgetall(key)
+        feed, headers = self._fetch_feed(url, state.get('etag'), state.get('modified'))
+        if feed is None:
+            log.debug("feed not modified or not fetched: %s", url)
+            return []
+        newest = float(state.get('newest') or 0)
+        high_water = newest
+        links = []
+        for entry in feed.entries:
+            published = self._entry_time(entry)
+            if published is not None:
+                if published <= newest:
+                    continue
+                high_water = max(high_water, published)
+            if entry.get('link'):
+                links.append(entry.link)
+        self.redis.hmset(key, {'etag': headers.get('etag') or '',
+                               'modified': headers.get('last-modified') or '',
+                               'newest': high_water})
+        log.debug("feed %s: %s entries, %s new", url, len(feed.entries), len(links))
+        return links
 
     def _generate_urls(self):
-        if not self.can_resume():
+        if not self._can_crawl_start_page():
             return self.pause()
-        rss = feedparser.parse(self.crawler.start_url)
-        if len(rss.entries) == 0:
+        url = self.feed_url()
+        if url is None:
             return None
-        url = rss.entries.pop()
-        for post in rss.entries:
-            log.debug("found url: %s", post.link)
-            self.redis.sadd(CRAWLER_QUEUE_PREFIX + self.name, post.link)
-        return url.link
+        self.revisit.record(self.queue_urls(self.poll_feed(url)))
+        return None
 
     def crawl_page(self):
         url = self.get_url()
         if url is None:
             return None
 
-        if not self.is_html(url):
-            return None
-
         log.debug("crawling url %s", url)
         try:
-            page = self.scrapper(url).scrape_rss()
+            page = self.scrapper(url, date_detector=self.crawler.date_detector).scrape_rss()
+        except (UnsupportedContentError, PageTooLargeError) as e:
+            log.debug("Skipping: %s", e.message)
+            return None
         except Exception as e:
             log.debug("Exception in scrapper for url: %s\n%s", url, str(e))
+            CRAWL_COUNTERS.count(self.crawler, errors=1)
             return None
         assert isinstance(page, dict)
+        CRAWL_COUNTERS.count(self.crawler, crawled_pages=1, bytes=page.pop('downloaded_bytes'))
         return page
 
 
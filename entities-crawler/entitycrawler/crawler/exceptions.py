@@ -12,3 +12,29 @@ class NoSuchScrapperError(Exception):
         self.scrapper = scrapper
         self.message = "Can't find scrapper: [%s]" % scrapper
         super(NoMatchedPatternError, self).__init__(self.message)
+
+
+class PageNotModifiedError(Exception):
+
+    def __init__(self, url):
+        self.url = url
+        self.message = "Page not modified since last crawl: [%s]" % url
+        super(PageNotModifiedError, self).__init__(self.message)
+
+
+class UnsupportedContentError(Exception):
+
+    def __init__(self, url, content_type):
+        self.url = url
+        self.content_type = content_type
+        self.message = "Not an HTML page (%s): [%s]" % (content_type, url)
+        super(UnsupportedContentError, self).__init__(self.message)
+
+
+class PageTooLargeError(Exception):
+
+    def __init__(self, url, limit):
+        self.url = url
+        self.limit = limit
+        self.message = "Page is larger than %s bytes: [%s]" % (limit, url)
+        super(PageTooLargeError, self).__init__(self.message)
@@ -0,0 +1,100 @@
+''' Per-crawler priority frontier in a Redis sorted set.
+
+Lower score is crawled first. The score packs, from most to least
+significant: link depth from start_url, URL pattern rank (links matching a
+non-default pattern before default-pattern ones) and discovery time (newer
+first). Depth is read back from the score of popped URLs, so no per-URL
+bookkeeping is needed to compute the depth of the links found on them.
+'''
+import time
+import logging
+
+from entitycrawler.db import CRAWLER_FRONTIER_PREFIX, CRAWLER_QUEUE_PREFIX
+
+log = logging.getLogger("crawler")
+
+MAX_DEPTH = 10
+MAX_SIZE = 100000
+PUSH_CHUNK = 500  # members per ZADD
+
+SPECIFIC_PATTERN = 0
+DEFAULT_PATTERN = 1
+
+DEPTH_WEIGHT = 1e11
+PATTERN_WEIGHT = 1e10
+TIME_BASE = 1e10  # > any epoch time we'll see, keeps the time part positive
+
+_migrated = set()
+
+
+def score(depth, rank, discovered=None):
+    if discovered is None:
+        discovered = time.time()
+    return depth * DEPTH_WEIGHT + rank * PATTERN_WEIGHT + (TIME_BASE - discovered)
+
+
+def depth_of(score):
+    return int(score // DEPTH_WEIGHT)
+
+
+class Frontier(object):
+
+    def __init__(self, redis, name, max_depth=MAX_DEPTH, max_size=MAX_SIZE):
+        self.redis = redis
+        self.name = name
+        self.key = CRAWLER_FRONTIER_PREFIX + name
+        self.max_depth = max_depth
+        self.max_size = max_size
+        if name not in _migrated:
+            self.migrate_legacy()
+            _migrated.add(name)
+
+    def push(self, urls, depth, rank=None):
+        ''' Add urls found at depth (rank: url -> pattern rank).
+
+        Links past max_depth are dropped, and the lowest priority entries
+        are trimmed once the frontier holds more than max_size.
+        Returns the number of urls pushed.
+        '''
+        if depth > self.max_depth:
+            return 0
+        now = time.time()
+        members = []
+        for url in urls:
+            members.append((url, score(depth, rank(url) if rank else DEFAULT_PATTERN, now)))
+        if not members:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for i in xrange(0, len(members), PUSH_CHUNK):
+            pipe.zadd(self.key, dict(members[i:i + PUSH_CHUNK]))
+        if self.max_size:
+            pipe.zremrangebyrank(self.key, self.max_size, -1)
+        result = pipe.execute()
+        if self.max_size and result[-1]:
+            log.debug("frontier %s full, dropped %s urls", self.name, result[-1])
+        return len(members)
+
+    def pop(self, count=1):
+        ''' Up to count (url, depth) pairs, best first '''
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrange(self.key, 0, count - 1, withscores=True)
+        pipe.zremrangebyrank(self.key, 0, count - 1)
+        entries, _ = pipe.execute()
+        return [(url, depth_of(s)) for url, s in entries]
+
+    def __len__(self):
+        return self.redis.zcard(self.key)
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+    def migrate_legacy(self):
+        ''' Move URLs of the old unordered SET frontier (crawler_<id>) in here '''
+        legacy = CRAWLER_QUEUE_PREFIX + self.name
+        if self.redis.type(legacy) != 'set':
+            return 0
+        urls = list(self.redis.smembers(legacy))
+        pushed = self.push(urls, 1)
+        self.redis.delete(legacy)
+        log.info("frontier %s: migrated %s urls from %s", self.name, pushed, legacy)
+        return pushed
@@ -0,0 +1,124 @@
+''' Per-process index of all URL patterns by site.
+
+arbitrary_match and get_pattern are answered from here without database
+round trips: patterns are loaded with two queries (url_patterns and the
+crawlers' default pattern ids), grouped by site (host without www.) and
+compiled into one URLPatternMatcher per site.
+
+Writers call bump() after changing patterns or crawlers: it increments a
+version counter in Redis and publishes it. Indexes reload when a message
+arrives on the channel, and also re-read the counter every
+VERSION_CHECK_INTERVAL seconds in case a message was missed. Without Redis
+the index is just reloaded every LOCAL_TTL seconds.
+'''
+import time
+import logging
+from urlparse import urlparse
+
+from entitycrawler.db import URL_MATCHING_COL, CRAWLERS_COL, URL_PATTERNS_VERSION_NAME
+from entitycrawler.crawler.urlmatch import URLPatternMatcher
+
+log = logging.getLogger("crawler")
+
+VERSION_CHECK_INTERVAL = 30
+LOCAL_TTL = 60
+
+PATTERN_INDEXES = {}  # id(db) -> PatternIndex
+
+
+def site_of(host):
+    host = (host or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def bump(redis):
+    ''' Tell all processes that URL patterns or crawler defaults changed '''
+    if redis is None:
+        return None
+    version = redis.incr(URL_PATTERNS_VERSION_NAME)
+    redis.publish(URL_PATTERNS_VERSION_NAME, version)
+    return version
+
+
+def get_index(db, redis=None):
+    index = PATTERN_INDEXES.get(id(db))
+    if index is None or (index.redis is None and redis is not None):
+        index = PATTERN_INDEXES[id(db)] = PatternIndex(db, redis)
+    return index
+
+
+class PatternIndex(object):
+
+    def __init__(self, db, redis=None):
+        self.db = db
+        self.redis = redis
+        self.pubsub = None
+        self.version = None
+        self.loaded_at = self.checked_at = 0
+        self.sites = {}
+        self.patterns = {}
+        if redis is not None:
+            try:
+                self.pubsub = redis.pubsub(ignore_subscribe_messages=True)
+                self.pubsub.subscribe(URL_PATTERNS_VERSION_NAME)
+            except Exception as e:
+                log.warning("URL pattern index: no pub/sub, polling version: %s", e)
+                self.pubsub = None
+        self.load()
+
+    def load(self):
+        version = self.redis.get(URL_PATTERNS_VERSION_NAME) if self.redis is not None else None
+        defaults = dict((c['_id'], c.get('default_url_pattern'))
+                        for c in self.db[CRAWLERS_COL].find({}, {'default_url_pattern': 1}))
+        default_ids = set(_id for _id in defaults.itervalues() if _id is not None)
+        patterns = {}
+        by_site = {}
+        for doc in self.db[URL_MATCHING_COL].find():
+            crawler_default = defaults.get(doc.get('crawler'))
+            doc['default'] = crawler_default == doc['_id'] or crawler_default is None
+            patterns[doc['_id']] = doc
+            by_site.setdefault(site_of(doc.get('website')), []).append(doc)
+        sites = {}
+        for site, docs in by_site.iteritems():
+            sites[site] = URLPatternMatcher([(doc['_id'], doc['pattern']) for doc in docs],
+                                            defaults=default_ids)
+        self.sites, self.patterns = sites, patterns
+        self.version = version
+        self.loaded_at = self.checked_at = time.time()
+        log.info("URL pattern index: %s patterns of %s sites (version %s)",
+                 len(patterns), len(sites), version)
+
+    def refresh(self):
+        ''' Reload if patterns changed since the last load '''
+        now = time.time()
+        if self.redis is None:
+            if now - self.loaded_at > LOCAL_TTL:
+                self.load()
+            return
+        changed = False
+        if self.pubsub is not None:
+            try:
+                while self.pubsub.get_message() is not None:
+                    changed = True
+            except Exception as e:
+                log.warning("URL pattern index: pub/sub lost, polling version: %s", e)
+                self.pubsub = None
+        if not changed and now - self.checked_at > VERSION_CHECK_INTERVAL:
+            self.checked_at = now
+            changed = self.redis.get(URL_PATTERNS_VERSION_NAME) != self.version
+        if changed:
+            self.load()
+
+    def match_id(self, url):
+        ''' _id of the pattern url matches (non-default ones first), or None '''
+        self.refresh()
+        matcher = self.sites.get(site_of(urlparse(url).hostname))
+        if matcher is None:
+            return None
+        return matcher.match_id(url)
+
+    def pattern(self, _id):
+        ''' Copy of the url_patterns document _id with its 'default' flag '''
+        self.refresh()
+        doc = self.patterns.get(_id)
+        return dict(doc) if doc is not None else None
@@ -0,0 +1,98 @@
+''' Host-aware crawler scheduling.
+
+Crawler ids wait in a Redis sorted set scored by the time they may run next.
+A crawler that is due is claimed with ZREM (only one worker process wins it)
+and then has to take a token from the bucket of its host; buckets live in
+Redis too, so all crawlers and processes hitting one host share them. The
+bucket refill rate follows robots.txt crawl-delay when the host sets one.
+'''
+import time
+import logging
+from urlparse import urlparse
+
+from entitycrawler.db import CRAWLERS_READY_NAME, HOST_BUCKET_PREFIX
+from entitycrawler.crawler.robots import RobotsCache
+
+log = logging.getLogger("crawler")
+
+HOST_RATE = 1.0  # requests per second per host without crawl-delay
+HOST_BURST = 2
+CLAIM_SCAN = 10  # due crawlers looked at per claim
+
+# KEYS[1] bucket; ARGV rate, burst, now. Returns seconds to wait, 0 if a
+# token was taken.
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+'''
+
+
+class HostScheduler(object):
+
+    def __init__(self, redis, robots=None, rate=HOST_RATE, burst=HOST_BURST):
+        self.redis = redis
+        self.robots = robots or RobotsCache(redis)
+        self.rate = rate
+        self.burst = burst
+        self._take_token = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def add(self, crawler_id, at=None):
+        ''' Make crawler schedulable (keeps its slot if already queued) '''
+        if self.redis.zscore(CRAWLERS_READY_NAME, crawler_id) is None:
+            self.redis.zadd(CRAWLERS_READY_NAME, {crawler_id: at or time.time()})
+
+    def remove(self, crawler_id):
+        self.redis.zrem(CRAWLERS_READY_NAME, crawler_id)
+
+    def clear(self):
+        self.redis.delete(CRAWLERS_READY_NAME)
+
+    def host_limits(self, url):
+        ''' (rate, burst) for the host of url '''
+        delay = self.robots.crawl_delay(url)
+        if delay:
+            return 1.0 / delay, 1
+        return self.rate, self.burst
+
+    def take(self, url):
+        ''' Take a token of url's host; seconds to wait if there is none '''
+        rate, burst = self.host_limits(url)
+        key = HOST_BUCKET_PREFIX + urlparse(url).hostname
+        return float(self._take_token(keys=[key], args=[rate, burst, time.time()]))
+
+    def claim(self, start_urls):
+        ''' Id of a due crawler whose host has a token, or None.
+
+        start_urls - crawler id -> start url of the crawlers this process runs
+        The claimed crawler is rescheduled right away for when its host allows
+        the next request; crawlers whose host is busy are pushed back.
+        '''
+        now = time.time()
+        due = self.redis.zrangebyscore(CRAWLERS_READY_NAME, '-inf', now, start=0, num=CLAIM_SCAN)
+        for crawler_id in due:
+            url = start_urls.get(crawler_id)
+            if url is None or not self.redis.zrem(CRAWLERS_READY_NAME, crawler_id):
+                continue
+            wait = self.take(url)
+            if wait > 0:
+                log.debug("Host of crawler %s busy for %.2fs", crawler_id, wait)
+                self.redis.zadd(CRAWLERS_READY_NAME, {crawler_id: now + wait})
+                continue
+            rate, _ = self.host_limits(url)
+            self.redis.zadd(CRAWLERS_READY_NAME, {crawler_id: now + 1.0 / rate})
+            return crawler_id
+        return None
@@ -0,0 +1,82 @@
+''' Adaptive revisit schedule of a crawler's start page / feed / sitemaps.
+
+Each visit reports how many new links it found. The revisit interval is
+adjusted AIMD style: halved when something new showed up, increased by a
+fixed step when nothing did, and kept within [min_interval, max_interval].
+Busy sections converge to short intervals, static ones back off. The
+schedule is kept in a Redis hash per crawler so restarts don't trigger an
+immediate recrawl; it starts over from the crawler frequency when that is
+changed.
+'''
+import time
+import logging
+
+from entitycrawler.db import REVISIT_PREFIX
+
+log = logging.getLogger("crawler")
+
+REVISIT_MIN_INTERVAL = 5 * 60
+REVISIT_MAX_INTERVAL = 24 * 3600
+REVISIT_DECREASE = 0.5  # interval factor after a visit with new links
+REVISIT_INCREASE = 10 * 60  # seconds added after a visit without
+
+
+class RevisitSchedule(object):
+
+    def __init__(self, redis, name, frequency, min_interval=REVISIT_MIN_INTERVAL,
+                 max_interval=REVISIT_MAX_INTERVAL):
+        self.redis = redis
+        self.key = REVISIT_PREFIX + name
+        self.frequency = float(frequency)
+        # a crawler configured to poll faster than the bounds keeps its pace
+        self.min_interval = min(min_interval, self.frequency)
+        self.max_interval = max(max_interval, self.frequency)
+
+    def _load(self):
+        state = self.redis.hgetall(self.key)
+        if not state or float(state.get('frequency', 0)) != self.frequency:
+            return {'interval': self.frequency, 'next': 0.0, 'visits': 0, 'changes': 0}
+        return {'interval': float(state['interval']),
+                'next': float(state.get('next') or 0),
+                'visits': int(state.get('visits') or 0),
+                'changes': int(state.get('changes') or 0)}
+
+    def _save(self, state):
+        state['frequency'] = self.frequency
+        self.redis.hmset(self.key, state)
+        self.redis.expire(self.key, int(self.max_interval * 4))
+
+    def due(self):
+        return time.time() >= self._load()['next']
+
+    def claim(self):
+        ''' True if a visit is due; it is then not due again for an interval '''
+        state = self._load()
+        now = time.time()
+        if now < state['next']:
+            log.debug('  skipping until %s', time.ctime(state['next']))
+            return False
+        state['next'] = now + state['interval']
+        self._save(state)
+        return True
+
+    def record(self, new_links):
+        ''' Adjust the interval after a visit that found new_links new links '''
+        state = self._load()
+        if new_links:
+            interval = state['interval'] * REVISIT_DECREASE
+            state['changes'] += 1
+        else:
+            interval = state['interval'] + REVISIT_INCREASE
+        state['interval'] = max(self.min_interval, min(self.max_interval, interval))
+        state['visits'] += 1
+        state['next'] = time.time() + state['interval']
+        self._save(state)
+        log.debug("revisit %s: %s new links, next visit in %.0fs",
+                  self.key, new_links, state['interval'])
+        return state['interval']
+
+    def stats(self):
+        state = self._load()
+        state['change_rate'] = float(state['changes']) / state['visits'] if state['visits'] else 0.0
+        return state
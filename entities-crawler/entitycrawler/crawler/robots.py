@@ -0,0 +1,234 @@
+''' robots.txt rules and crawl-delay, cached per host.
+
+robots.txt is fetched once per host and kept in Redis (shared by every
+worker process) together with its ETag/Last-Modified; after ROBOTS_TTL it is
+revalidated with a conditional GET. Each process keeps the compiled rules
+in ROBOTS_LOCAL_CACHE, so checking a URL normally costs no I/O at all.
+
+Matching follows RFC 9309: the group for our user agent (else `*`), the
+longest matching rule wins and allow wins a tie; `*` and `$` wildcards are
+supported. A missing robots.txt (4xx) allows everything, an unreachable one
+(5xx, network error) disallows everything until ROBOTS_ERROR_TTL passes.
+'''
+import re
+import json
+import time
+import logging
+from collections import Counter
+from urlparse import urlparse
+
+from entitycrawler import httpclient
+from entitycrawler.db import ROBOTS_PREFIX
+
+log = logging.getLogger("crawler")
+
+ROBOTS_TTL = 24 * 3600
+ROBOTS_ERROR_TTL = 1800
+ROBOTS_KEEP = 7 * 24 * 3600  # stale entries stay in Redis for revalidation
+ROBOTS_TIMEOUT = 10
+ROBOTS_MAX_BYTES = 500 * 1024
+ROBOTS_LOCK_TTL = 30
+LOCAL_CACHE_SIZE = 1000
+
+ALLOW_ALL = 'allow'
+DISALLOW_ALL = 'disallow'
+
+ROBOTS_LOCAL_CACHE = dict()  # robots url -> RobotsRules
+ROBOTS_STATS = Counter()
+
+
+class RobotsRules(object):
+
+    ''' Compiled rules of the group that applies to user_agent '''
+
+    def __init__(self, text='', user_agent=httpclient.USER_AGENT, expires=0, status=None):
+        self.expires = expires
+        self.status = status
+        self.entry = None
+        self.rules = []
+        self.crawl_delay = None
+        self.sitemaps = self._sitemaps(text)
+        if status == DISALLOW_ALL:
+            self.rules = [(1, False, '/', None)]
+        elif status != ALLOW_ALL:
+            self._compile(*self._group(text, user_agent.lower()))
+
+    @staticmethod
+    def _sitemaps(text):
+        ''' Sitemap: lines, they apply to every user agent '''
+        sitemaps = []
+        for line in text.splitlines():
+            field, _, value = line.split('#', 1)[0].partition(':')
+            if field.strip().lower() == 'sitemap' and value.strip():
+                sitemaps.append(value.strip())
+        return sitemaps
+
+    @staticmethod
+    def _group(text, agent):
+        ''' (rules, crawl delay) of the most specific matching group '''
+        groups = []  # ([agents], [(field, value)])
+        for line in text.splitlines():
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            field, value = line.split(':', 1)
+            field, value = field.strip().lower(), value.strip()
+            if field == 'user-agent':
+                if not groups or groups[-1][1]:
+                    groups.append(([], []))
+                groups[-1][0].append(value.lower())
+            elif field in ('allow', 'disallow', 'crawl-delay') and groups:
+                groups[-1][1].append((field, value))
+        by_agent = {}
+        for agents, group_lines in groups:
+            for name in agents:
+                by_agent.setdefault(name, []).extend(group_lines)
+        specific = [name for name in by_agent if name != '*' and name in agent]
+        if specific:
+            lines = by_agent[max(specific, key=len)]
+        else:
+            lines = by_agent.get('*', [])
+        rules, delay = [], None
+        for field, value in lines:
+            if field == 'crawl-delay':
+                if delay is None:
+                    try:
+                        delay = float(value)
+                    except ValueError:
+                        pass
+            elif value:
+                rules.append((field == 'allow', value))
+        return rules, delay
+
+    def _compile(self, rules, delay):
+        compiled = []
+        for allow, pattern in rules:
+            if '*' in pattern or pattern.endswith('$'):
+                anchored = pattern.endswith('$')
+                body = pattern[:-1] if anchored else pattern
+                regex = '.*'.join(re.escape(p) for p in body.split('*'))
+                compiled.append((len(pattern), allow, None, re.compile(regex + ('$' if anchored else ''))))
+            else:
+                compiled.append((len(pattern), allow, pattern, None))
+        # longest first, allow before disallow on equal length
+        compiled.sort(key=lambda r: (-r[0], not r[1]))
+        self.rules = compiled
+        self.crawl_delay = delay
+
+    def allowed(self, path):
+        for _, allow, prefix, regex in self.rules:
+            if prefix is not None:
+                if path.startswith(prefix):
+                    return allow
+            elif regex.match(path):
+                return allow
+        return True
+
+
+def robots_url(url):
+    parsed = urlparse(url)
+    return '%s://%s/robots.txt' % (parsed.scheme or 'http', parsed.netloc)
+
+
+class RobotsCache(object):
+
+    def __init__(self, redis=None, user_agent=httpclient.USER_AGENT):
+        self.redis = redis
+        self.user_agent = user_agent
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        return self.rules(url).allowed(path)
+
+    def crawl_delay(self, url):
+        return self.rules(url).crawl_delay
+
+    def rules(self, url):
+        key = robots_url(url)
+        now = time.time()
+        rules = ROBOTS_LOCAL_CACHE.get(key)
+        if rules is not None and rules.expires > now:
+            ROBOTS_STATS['local_hits'] += 1
+            return rules
+
+        entry = self._load(key)
+        if entry is None and rules is not None:
+            entry = rules.entry
+        if entry is not None and entry['expires'] > now:
+            ROBOTS_STATS['shared_hits'] += 1
+        elif entry is not None and not self._lock(key):
+            # another process is refreshing it, stale rules will do meanwhile
+            ROBOTS_STATS['stale_hits'] += 1
+        else:
+            entry = self._fetch(key, entry)
+            self._store(key, entry)
+        rules = RobotsRules(entry['text'], self.user_agent, entry['expires'], entry['status'])
+        rules.entry = entry  # kept for revalidation
+        if len(ROBOTS_LOCAL_CACHE) >= LOCAL_CACHE_SIZE:
+            ROBOTS_LOCAL_CACHE.clear()
+        ROBOTS_LOCAL_CACHE[key] = rules
+        return rules
+
+    def _fetch(self, key, entry):
+        headers = {}
+        if entry is not None and entry['status'] is None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        now = time.time()
+        try:
+            resp = httpclient.get(key, headers=headers, timeout=ROBOTS_TIMEOUT)
+        except Exception as e:
+            log.debug("robots.txt %s failed: %s", key, e)
+            ROBOTS_STATS['errors'] += 1
+            return {'text': '', 'status': DISALLOW_ALL, 'expires': now + ROBOTS_ERROR_TTL}
+        if resp.status_code == 304 and headers:
+            ROBOTS_STATS['revalidated'] += 1
+            return dict(entry, expires=now + ROBOTS_TTL)
+        ROBOTS_STATS['fetches'] += 1
+        if resp.status_code >= 500:
+            return {'text': '', 'status': DISALLOW_ALL, 'expires': now + ROBOTS_ERROR_TTL}
+        if resp.status_code >= 400:
+            return {'text': '', 'status': ALLOW_ALL, 'expires': now + ROBOTS_TTL}
+        return {'text': resp.content[:ROBOTS_MAX_BYTES].decode('utf-8', 'replace'),
+                'status': None,
+                'etag': resp.headers.get('etag'),
+                'last_modified': resp.headers.get('last-modified'),
+                'expires': now + ROBOTS_TTL}
+
+    def _load(self, key):
+        if self.redis is None:
+            return None
+        data = self.redis.get(ROBOTS_PREFIX + key)
+        return json.loads(data) if data else None
+
+    def _store(self, key, entry):
+        if self.redis is not None:
+            self.redis.set(ROBOTS_PREFIX + key, json.dumps(entry), ex=ROBOTS_KEEP)
+
+    def _lock(self, key):
+        if self.redis is None:
+            return True
+        return bool(self.redis.set(ROBOTS_PREFIX + 'lock:' + key, 1, ex=ROBOTS_LOCK_TTL, nx=True))
+
+
+def stats():
+    ''' Counters and hit rate of the robots caches of this process '''
+    lookups = sum(ROBOTS_STATS.values())
+    hits = ROBOTS_STATS['local_hits'] + ROBOTS_STATS['shared_hits'] + ROBOTS_STATS['stale_hits']
+    result = dict(ROBOTS_STATS)
+    result['lookups'] = lookups
+    result['hit_rate'] = float(hits) / lookups if lookups else 0.0
+    return result
+
+
+def log_stats():
+    s = stats()
+    log.info("robots.txt: %s lookups, hit rate %.3f, %s fetches, %s revalidated, %s errors",
+             s['lookups'], s['hit_rate'], s.get('fetches', 0), s.get('revalidated', 0),
+             s.get('errors', 0))
+    return s
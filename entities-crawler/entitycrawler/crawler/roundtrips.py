@@ -0,0 +1,60 @@
+''' Redis client proxy counting network round trips.
+
+Every command is one round trip, a pipeline is one round trip per
+execute() and a registered Lua script one per call. Crawlers talk to Redis
+through it so the round trips spent on each crawled page can be reported.
+'''
+
+
+class RoundTripCounter(object):
+
+    def __init__(self, redis):
+        self._redis = redis
+        self.round_trips = 0
+        self.pages = 0
+        self.total = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._redis, name)
+        if not callable(attr):
+            return attr
+
+        def command(*args, **kwargs):
+            self.round_trips += 1
+            return attr(*args, **kwargs)
+        return command
+
+    def pipeline(self, *args, **kwargs):
+        return _CountingPipeline(self, self._redis.pipeline(*args, **kwargs))
+
+    def register_script(self, script):
+        run = self._redis.register_script(script)
+
+        def call(keys=[], args=[], client=None):
+            self.round_trips += 1
+            return run(keys=keys, args=args, client=client)
+        return call
+
+    def page_done(self):
+        ''' Round trips since the previous page, adds them to the average '''
+        trips, self.round_trips = self.round_trips, 0
+        self.pages += 1
+        self.total += trips
+        return trips
+
+    def average(self):
+        return float(self.total) / self.pages if self.pages else 0.0
+
+
+class _CountingPipeline(object):
+
+    def __init__(self, counter, pipe):
+        self._counter = counter
+        self._pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self._pipe, name)
+
+    def execute(self, *args, **kwargs):
+        self._counter.round_trips += 1
+        return self._pipe.execute(*args, **kwargs)
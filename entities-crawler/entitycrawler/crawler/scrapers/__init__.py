@@ -1,27 +1,30 @@
 # Scrapers
 import re
+import codecs
 import logging
-import pytz
-import requests
 from datetime import datetime, timedelta
-from urlparse import urljoin, urlparse, urlunparse
 from itertools import chain, groupby
-from io import StringIO
 from operator import itemgetter
+from urlparse import urljoin
 
 import bs4
 import boilerpipy as bp
 from bs4 import BeautifulSoup
-from lxml import etree
 from newspaper import Article
-from dateutil.parser import parse
 from ftfy import fix_text
 
 BSOUP = "SoupScrapper"
 NEWSP = "NewspScrapper"
-REQUEST_TIMEOUT = 180
 
+from entitycrawler import httpclient, htmlstore
+from entitycrawler.textmatch import MultiPatternMatcher
 from entitycrawler.utils import lazyprop
+from entitycrawler.crawler.exceptions import (PageNotModifiedError,
+                                               UnsupportedContentError,
+                                               PageTooLargeError)
+from entitycrawler.crawler.scrapers.document import ParsedDocument, LXML, SOUP
+from entitycrawler.crawler.scrapers.dates import get_date_detector, STRUCTURED
+from entitycrawler.crawler.scrapers.links import LinkExtractor
 from entitycrawler.db import (
     CRAWLERS_POOL_NAME,
     WEBSITES_COL,
@@ -31,88 +34,103 @@ from entitycrawler.db import (
     WEBSITES_ENTITIES_COL,
     WEBSITES_CANDIDATES_COL,
     URL_MATCHING_COL,
+    HTTP_VALIDATORS_COL,
 )
 
+# how ScrappedPage.save keeps the raw page
+HTML_INLINE = 'inline'  # `html` field of the crawled page
+HTML_BLOB = 'blob'  # compressed in htmlstore, page keeps `html_hash` and `html_unicode`
+DEFAULT_HTML_STORAGE = HTML_BLOB
+
+HTML_CONTENT_TYPES = frozenset(['text/html', 'application/xhtml+xml'])
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def parse_content_type(header):
+    ''' (mime type, charset or None) from a Content-Type header '''
+    if not header:
+        return None, None
+    parts = header.split(';')
+    charset = None
+    for param in parts[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            charset = value.strip().strip('"\'').lower() or None
+    return parts[0].strip().lower(), charset
+
 
 class Scrapper(object):
 
     name = None
+    document_backend = LXML
+    max_page_bytes = MAX_PAGE_BYTES
 
-    def __init__(self, url, fuzzy_date=True):
+    def __init__(self, url, fuzzy_date=True, validators=None, date_detector=None,
+                 link_filter=None):
         self.url = url
-        self.html = self._download(url)
+        self.link_filter = link_filter
+        self.validators = {}
         self.encoding = 'utf-8'
-        self.date = self._get_article_date(self.html, fuzzy_date)
-
-    def _absolutize_url(self, url):
-        url = urljoin(self.url, url)
-        if isinstance(url, str):
-            url = unicode(url, self.encoding)
-        return url
-
-    def _remove_hashtag(self, url):
-        u = urlparse(url)
-        url = urlunparse((u.scheme, u.netloc, u.path, u.params, u.query, ''))
-        return url
-
-    def _download(self, url):
-        headers = {'User-Agent': 'TrendIn'}
+        self.downloaded_bytes = 0  # size of the body as received
+        self.html = self._download(url, validators)
+        self.document = ParsedDocument(self.html, encoding=self.encoding,
+                                       backend=self.document_backend)
+        if not fuzzy_date:
+            date_detector = STRUCTURED
+        self.date = get_date_detector(date_detector).detect(self.document)
+
+    def _download(self, url, validators=None):
+        ''' Fetch page, revalidating with stored ETag/Last-Modified if any.
+
+        The body is streamed and only read once the response headers say it
+        is HTML; it's decoded with the declared charset (left as bytes when
+        there is none, so the parsers can sniff <meta charset>).
+
+        Raises PageNotModifiedError on 304, UnsupportedContentError for
+        non-HTML responses and PageTooLargeError past max_page_bytes.
+        '''
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        resp = httpclient.get(url, headers=headers, verify=True, stream=True)
         try:
-            html = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT, verify=True).content
-        except requests.ConnectionError as err:
-            raise requests.ConnectionError(err)
-        return ' '.join(html.split())
-
-    def _get_article_date(self, html, fuzzy_date):
-        '''parse html string'''
-
-        parser = etree.HTMLParser()
-        tree = etree.parse(StringIO(unicode(html.decode('utf-8'))), parser)
-        # Find all time tags
-        time_tags_list = tree.findall('.//time')
-        current_time = datetime.now(pytz.utc)
-        list_of_dates = []
-        for elem in time_tags_list:
-            time_tag = parse(elem.attrib.get('datetime', elem.text),
-                             fuzzy=True)
-            if isinstance(time_tag, datetime):
-                time_tag = time_tag.replace(tzinfo=pytz.UTC)
-            else:
-                continue
-
-            print("Type of time_tag: ", type(time_tag))
-            if time_tag < current_time:
-                list_of_dates.append(time_tag)
-
-        if list_of_dates:
-            print('_get_article_date', list_of_dates)
-            return sorted(list_of_dates)[-1]
-        elif fuzzy_date is True:
-            list_of_regex = [
-                r"(?:(?:jan(?:(?:.)?|(?:uary)?)|feb(?:(?:.)?|(?:ruary)?)|mar(?:(?:.)?|(?:ch)?)|apr(?:(?:.)?|(?:il)?)|may|jun(?:(?:.)?|(?:e)?)|jul(?:(?:.)?|(?:y)?)|aug(?:(?:.)?|(?:gust)?)|sep(?:(?:.)?|(?:ept(?:(?:.)?))?|(?:tember)?)|oct(?:(?:.)?|(?:ober)?)|nov(?:(?:.)?|(?:ember)?)|dec(?:(?:.)?|(?:ember)?)) (?:[123][0-9]|[1-9])[ \t\r\f\v]?(?:rd|st|th)?(?:,)?[ \t\r\f\v]?(?:[0-2][0-9][0-9][0-9])?)",
-                r"(?:(?:[0]?[1-9])|(?:[1][0-2]))[-/](?:(?:[012]?[0-9])|(?:[3][01]))[/-][12]?[0-9]?[0-9][0-9]",  # find all cases of American style date i.e. 10/12/98
-                # r"(?:christmas|memorial day|labor day|halloween|new years eve|new year's eve|mothers day|mother's day|martin luther king day|presidents day|president's day|memorial day| independence day|labor day|columbus day|veterans day|valentines day|valentine's day|halloween|st. patricks day|st. patricks day|veteran's day|thanksgiving|thanksgiving day)", #find all instances of important holidays
-                r"(?:mon(?:\.|day)?|tue(?:\.|sday)?|wed(?:\.|nesday)?|thur(?:\.|sday)?|fri(?:\.|day)?|sat(?:\.|urday)?|sun(?:\.|day)?)?[ \t\r\f\v]?the (?:[123][0-9]|[1-9])?[ \t\r\f\v]?(?:rd|st|th)?(?:,)?[ \t\r\f\v]?[ \t\r\f\v]?of?[ \t\r\f\v]?(?:jan(?:\.|uary)?|feb(?:\.|ruary)?|mar(?:\.|ch)?|apr(?:\.|il)?|may|jun(?:\.|e)?|jul(?:\.|y)?|aug(?:\.|ust)?|oct(?:\.|ober)?|nov(?:\.|ember)?|dec(?:\.|ember)?),?[ \t\r\f\v]?(?:[0-2][0-9][0-9][0-9])?",  # find instances of dates formatted like "the 21st of december 2014"
-                r"(?:mon(?:|day)?|tue(?:|sday)?|wed(?:|nesday)?|thur(?:|sday)?|fri(?:|day)?|sat(?:|urday)?|sun(?:|day)?)[ \t\r\f\v](?:the)?[ \t\f\r\v]?(?:(?:[123][0-9]|[1-9])[ \t\r\f\v]?(?:rd|st|th)?)?",  # find instances of dates formatted like "Monday the 23rd"
-            ]
-            dates = set()
-            for regex in list_of_regex:
-                matches = re.findall(regex, html.decode('utf-8'), re.IGNORECASE)
-                map(dates.add, matches)
-
-            for elem in dates:
-                try:
-                    date = parse(elem).replace(tzinfo=pytz.UTC)
-                except:
-                    pass
-                else:
-                    delta = current_time - date
-                    if delta.days >= 0:
-                        list_of_dates.append(date)
-            print('_get_article_date', list_of_dates)
-            if len(list_of_dates):
-                return sorted(list_of_dates)[-1]
-        return None
+            if resp.status_code == 304:
+                raise PageNotModifiedError(url)
+            content_type, charset = parse_content_type(resp.headers.get('content-type'))
+            if content_type is not None and content_type not in HTML_CONTENT_TYPES:
+                raise UnsupportedContentError(url, content_type)
+            html = self._read_body(resp)
+        finally:
+            resp.close()
+        self.validators = {'etag': resp.headers.get('etag'),
+                           'last_modified': resp.headers.get('last-modified')}
+        if charset:
+            try:
+                codecs.lookup(charset)
+            except LookupError:
+                return html
+            self.encoding = charset
+            return html.decode(charset, 'replace')
+        return html
+
+    def _read_body(self, resp):
+        limit = self.max_page_bytes
+        length = resp.headers.get('content-length')
+        if limit and length and length.isdigit() and int(length) > limit:
+            raise PageTooLargeError(resp.url, limit)
+        chunks = []
+        size = 0
+        for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if limit and size > limit:
+                raise PageTooLargeError(resp.url, limit)
+            chunks.append(chunk)
+        self.downloaded_bytes = size
+        return b''.join(chunks)
 
     def get_page_meta(self):
         ''' Get page metadata '''
@@ -137,7 +155,10 @@ class Scrapper(object):
                   'links': links,
                   'text': text,
                   'title': title,
-                  'highlighted_strings': highlighted_strings}
+                  'highlighted_strings': highlighted_strings,
+                  'canonical': self.get_canonical(),
+                  'validators': self.validators,
+                  'downloaded_bytes': self.downloaded_bytes}
         return result
 
     def scrape_rss(self):
@@ -154,23 +175,29 @@ class Scrapper(object):
                   'links': [],
                   'text': text,
                   'title': title,
-                  'highlighted_strings': highlighted_strings}
+                  'highlighted_strings': highlighted_strings,
+                  'validators': self.validators,
+                  'downloaded_bytes': self.downloaded_bytes}
         return result
 
+    def get_canonical(self):
+        ''' Absolute href of <link rel="canonical">, None if there's none '''
+        for _, attrs in self.document.link_tags(tags=('link',)):
+            rel = attrs.get('rel') or ''
+            if not isinstance(rel, basestring):  # bs4 keeps rel as a list
+                rel = ' '.join(rel)
+            if 'canonical' in rel.lower().split() and attrs.get('href'):
+                return urljoin(self.url, attrs['href'].strip())
+        return None
+
     def get_links(self):
-        ''' Get all links on page, using RegExe's '''
-        urls = re.findall('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+',
-                          self.html)
-        relative_urls = re.findall('<a href="?\'?([^"\'>]*)',
-                                   self.html)
-        for url in relative_urls:
-            urls.append(self._absolutize_url(url))
-        links = set([self._remove_hashtag(l) for l in urls])
-        return list(links)
+        ''' Get all links on page (only the ones link_filter accepts, if set) '''
+        extractor = LinkExtractor(self.url, accept=self.link_filter, encoding=self.encoding)
+        return extractor.feed_document(self.document)
 
 
 class SoupScrapper(Scrapper):
-    version = "3"
+    version = "4"
     _type = BSOUP
     name = _type + version
 
@@ -280,25 +307,36 @@ class SoupScrapper(Scrapper):
 
     JUNK_CUTOFF = 0.3
 
+    _visible_tags = frozenset(VISIBLE_TAGS)
+    _grouping_tags = frozenset(GROUPING_TAGS)
+
+    document_backend = SOUP
+
     def __init__(self, *args, **kwargs):
         self.use_readability = kwargs.pop('use_readability', False)
+        if self.use_readability:
+            # soup is built from the readability extract, not the whole page
+            self.document_backend = LXML
         super(SoupScrapper, self).__init__(*args, **kwargs)
-        html = self.html
         if self.use_readability:
             self.readability = bp.Extractor(self.html, loglevel=logging.getLogger().getEffectiveLevel())
-            html = self.readability.extracted()
-        self.soup = BeautifulSoup(html)
-        self.encoding = self.extract_encoding()
+            self.soup = BeautifulSoup(self.readability.extracted())
+        else:
+            self.soup = self.document.soup
+        if not isinstance(self.html, unicode):
+            # no charset in the response headers, fall back to <meta>
+            self.encoding = self.extract_encoding()
         self.REPLACEMENT_TAB = dict((ord(char), None) for char in u'@#${}')
 
     def get_text(self):
         '''Scrape visible text and get highlighted text list with BeautifulSoup'''
         text, highlighted_strings = self._extract_text_pieces()
         if not text:
-            return [], []
+            return [], [], None
         text = self._group_text(text)
-        text = [t[0].strip() for t in text if t[0].strip()]
-        print '/n/n', text
+        text = [fix_text(t).strip() for t, _ in text]
+        text = [t for t in text if t]
+        highlighted_strings = [fix_text(h) for h in highlighted_strings]
         text, highlighted_strings = self._cut_junk(text, highlighted_strings)
         if self.use_readability:
             title = self.readability.title()
@@ -321,7 +359,7 @@ class SoupScrapper(Scrapper):
                    tag.get('itemprop'))
             return key
 
-        meta = self.soup.find_all('meta')
+        meta = self.document.meta_tags()
         meta = groupby(meta, tag_key)
         result = {}
         for key, val in meta:
@@ -335,17 +373,10 @@ class SoupScrapper(Scrapper):
                 result[key.lower().replace(".", "_")] = content
         return result
 
-    def get_links(self):
-        ''' Get all links on page '''
-        links = self.soup.find_all('a')
-        links = [self._absolutize_url(l.get('href')) for l in links if l.get('href')]
-        links = set([self._remove_hashtag(l) for l in links])
-        return list(links)
-
     def extract_encoding(self):
         charset = None
-        for m in self.soup.find_all('meta'):
-            attrs = {a.lower(): v.lower() for a, v in m.attrs.iteritems()}
+        for m in self.document.meta_tags():
+            attrs = {a.lower(): v.lower() for a, v in m.iteritems()}
             if attrs.get('http-equiv') == 'content-type':
                 charset_re = re.compile('.*charset=(.+)$')
                 m = charset_re.match(attrs.get('content', ''))
@@ -355,51 +386,68 @@ class SoupScrapper(Scrapper):
         return charset or 'utf-8'
 
     def _is_string(self, tag):
-        print('/n/n', tag, 'string', type(tag) == bs4.element.NavigableString)
         return type(tag) == bs4.element.NavigableString
 
     def _is_visible_tag(self, tag):
-        print('/n/n', tag, 'visible', tag.name in self.VISIBLE_TAGS)
-        return tag.name in self.VISIBLE_TAGS
+        return tag.name in self._visible_tags
 
     def _is_semantic_string(self, s):
         semantic = s.parent.name in self.SEMANTIC_TAGS
         short = len(s.split()) <= self.SEMANTIC_TEXT_MAX_LEN
         return semantic and short
 
-    def _grouping_parent(self, e):
-        while e and e.name not in self.GROUPING_TAGS:
-            e = e.parent
-        return e
-
-    def _extract_text_pieces(self, elements=None):
+    def _grouping_parent(self, e, cache):
+        ''' Closest grouping ancestor of e, memoized per visited tag in cache '''
+        path = []
+        tag = e.parent
+        while tag is not None and id(tag) not in cache:
+            if tag.name in self._grouping_tags:
+                break
+            path.append(tag)
+            tag = tag.parent
+        if tag is not None and id(tag) in cache:
+            found = cache[id(tag)]
+        else:
+            found = tag
+            if tag is not None:
+                cache[id(tag)] = tag
+        for t in path:
+            cache[id(t)] = found
+        return found
+
+    def _extract_text_pieces(self):
+        ''' Visible strings (unfixed) in document order, in a single iterative pass '''
         text = []
         highlighted_strings = []
-        if not elements:
-            elements = self.soup.children
-        for e in elements:
-            if self._is_string(e) and self._is_visible_tag(e.parent):
-                t = fix_text(e).strip()
-                if t and self._is_semantic_string(e):
-                    highlighted_strings.append(t)
-                if len(t) > 2:
-                    text.append((t, e))
-            elif getattr(e, 'children', False):
-                t, h = self._extract_text_pieces(e.children)
-                text.extend(t)
-                highlighted_strings.extend(h)
+        stack = list(reversed(self.soup.contents))
+        while stack:
+            e = stack.pop()
+            if self._is_string(e):
+                if self._is_visible_tag(e.parent):
+                    t = e.strip()
+                    if t and self._is_semantic_string(e):
+                        highlighted_strings.append(t)
+                    if len(t) > 2:
+                        text.append((t, e))
+            else:
+                children = getattr(e, 'contents', None)
+                if children:
+                    stack.extend(reversed(children))
         return text, highlighted_strings
 
     def _group_text(self, text):
         if not text:
             return []
-        result = text[:1]
+        cache = {}
+        result = []
+        prev_parent = None
         for t, e in text:
-            prev_t, prev_e = result[-1]
-            if self._grouping_parent(e) == self._grouping_parent(prev_e):
-                result[-1] = (u'%s %s' % (prev_t, t), prev_e)
+            parent = self._grouping_parent(e, cache)
+            if result and parent is prev_parent:
+                result[-1] = (u'%s %s' % (result[-1][0], t), result[-1][1])
             else:
                 result.append((t, e))
+            prev_parent = parent
         return result
 
     def _cut_junk(self, text, highlights):
@@ -411,20 +459,17 @@ class SoupScrapper(Scrapper):
 
         Also removes all entity candidates (highlights) that don't appear in resulting text.
         '''
-        print("text: ", text)
         text = [(t, len(t)) for t in text]
-        print("text2: ", text)
-        new_highlights = set()
+        new_highlights = []
         _, longest = max(text, key=itemgetter(1))
         if longest > 0:
             text = [t for t, length in text
                     if (float(length) / longest) > self.JUNK_CUTOFF]
-            for h in highlights:
-                for t in text:
-                    if h in t:
-                        new_highlights.add(h)
-                        break
-        return text, list(new_highlights)
+            # blocks are joined with a char no highlight contains, so one scan
+            # can't match across two blocks
+            matcher = MultiPatternMatcher(h for h in highlights if u'\x00' not in h)
+            new_highlights = matcher.found_in(u'\x00'.join(text))
+        return text, new_highlights
 
 class NewspaperScrapper(Scrapper):
     version = "2"
@@ -479,13 +524,18 @@ class ScrappedPage(object):
 
     '''
         scraper - scraper backend BSOUP for BeautifullSoup, NEWSP for newspaper lib
+        html_storage - HTML_INLINE or HTML_BLOB, see save()
+        canonical - CanonicalRules of the site; a freshly scraped page is
+                    stored under its same-site <link rel="canonical">, with
+                    the canonical form of that URL as canonical_key, and
+                    stored pages are looked up by the canonical_key of url;
+                    ETag/Last-Modified stay keyed by the fetched_url
     '''
 
     SCRAPPED_PAGE_FIELDS = {
         'metadata',
         'url',
         'parser',
-        'html',
         'date',
         'links',
         'text',
@@ -493,10 +543,14 @@ class ScrappedPage(object):
         'highlighted_strings',
     }
 
-    def __init__(self, url, scrapper=None, db=None):
+    def __init__(self, url, scrapper=None, db=None, revalidate=True, date_detector=None,
+                 html_storage=DEFAULT_HTML_STORAGE, canonical=None):
         self.db = db
+        self.html_storage = html_storage
         self._id = None
         self.url = url
+        # bytes downloaded for this page, None when it came from crawled_pages
+        self.downloaded_bytes = None
         if scrapper:
             scrapper = SCRAPPERS_BY_TYPE.get(scrapper, None)
             if not scrapper:
@@ -505,7 +559,12 @@ class ScrappedPage(object):
             scrapper = DefaultScrapper
 
         if db:
-            page = db[CRAWLED_PAGES_COL].find_one({"url": url})
+            if canonical is not None:
+                # pages stored without a canonical_key are still found by url
+                page = db[CRAWLED_PAGES_COL].find_one(
+                    {"$or": [{"canonical_key": canonical.canonicalize(url)}, {"url": url}]})
+            else:
+                page = db[CRAWLED_PAGES_COL].find_one({"url": url})
             if self.check_fields(page) is False:
                 print("Scrapped page in DB for: ", url, " is not valid, rescrapping..")
                 page = None
@@ -513,30 +572,64 @@ class ScrappedPage(object):
             page = None
 
         if not page:
-            page = self.scrape_page(url, scrapper)
+            validators = None
+            if db and revalidate:
+                validators = self.get_validators(db, url)
+            page = self.scrape_page(url, scrapper, validators=validators,
+                                    date_detector=date_detector)
             assert self.check_fields(page)
+            self.downloaded_bytes = page.pop('downloaded_bytes', 0)
+            page['fetched_url'] = url
+            if canonical is not None:
+                page['url'] = self.url = canonical.canonical_of(url, page.get('canonical'))
+                page['canonical_key'] = canonical.canonicalize(self.url)
 
         self.__dict__.update(page)
         self.page = page
         self.scrapper = scrapper
 
     @classmethod
-    def scrape_page(cls, url, scraper=DefaultScrapper):
+    def scrape_page(cls, url, scraper=DefaultScrapper, validators=None, date_detector=None):
         '''
-            Get text and other data from one page
+            Get text and other data from one page; all its links are kept,
+            the stored page is shared by every crawler of the site
         '''
-        return scraper(url).scrape()
+        return scraper(url, validators=validators, date_detector=date_detector).scrape()
+
+    @staticmethod
+    def get_validators(db, url):
+        ''' Stored ETag/Last-Modified of the response fetched from url.
+
+        Only returned while an extracted page exists for url (stored under
+        the page_url the fetched page was saved as), since a 304 is
+        answered with that stored extract.
+        '''
+        validators = db[HTTP_VALIDATORS_COL].find_one({'url': url})
+        if validators is None:
+            return None
+        page_url = validators.get('page_url') or url
+        if db[EXTRACTED_PAGES_COL].find_one({'url': page_url}, {'_id': 1}) is None:
+            return None
+        return validators
 
     @classmethod
     def check_fields(cls, page):
         if page is None:
             print("check_fields: page is None")
             return False
-        check_result = cls.SCRAPPED_PAGE_FIELDS.issubset(page)
+        check_result = cls.SCRAPPED_PAGE_FIELDS.issubset(page) and\
+            ('html' in page or 'html_hash' in page)
         print("Checked fields in scrapped page [%s], result: %s" %
               (page.get('url', "NoURL"), check_result))
         return check_result
 
+    @lazyprop
+    def html(self):
+        ''' Raw page, loaded from htmlstore on first use when stored as a blob '''
+        if 'html' in self.page:
+            return self.page['html']
+        return htmlstore.load(self.db, self.page.get('html_hash'), self.page.get('html_unicode'))
+
     @lazyprop
     def is_saved(self):
         if self._id is not None:
@@ -546,7 +639,37 @@ class ScrappedPage(object):
 
     def save(self, expire=60):
         self.page['crawled_at'] = datetime.utcnow() + timedelta(seconds=expire)
-        opstatus = self.db[CRAWLED_PAGES_COL].update({'url': self.url}, self.page, upsert=True)
+        doc = self.page
+        if self.html_storage == HTML_BLOB and 'html' in doc:
+            doc = dict(doc)
+            html = doc.pop('html')
+            doc['html_hash'] = htmlstore.save(self.db, html, until=doc['crawled_at'])
+            doc['html_unicode'] = htmlstore.is_unicode(html)
+        elif self.html_storage == HTML_BLOB and doc.get('html_hash'):
+            # re-saving a page loaded from the DB keeps its blob alive
+            htmlstore.touch(self.db, doc['html_hash'], until=doc['crawled_at'])
+        if doc.get('canonical_key'):
+            spec = {'canonical_key': doc['canonical_key']}
+        else:
+            spec = {'url': self.url}
+        opstatus = self.db[CRAWLED_PAGES_COL].update(spec, doc, upsert=True)
         assert opstatus.get(u'upserted', False) or opstatus.get(u'nModified', False)
         self._id = opstatus.get('nUpserted', None)
+        self.save_validators()
         return self.is_saved
+
+    def save_validators(self):
+        ''' Keyed by the URL the validators came from, not the canonical
+            URL the page is stored under '''
+        validators = self.page.get('validators') or {}
+        fetched_url = self.page.get('fetched_url') or self.url
+        if validators.get('etag') or validators.get('last_modified'):
+            self.db[HTTP_VALIDATORS_COL].update(
+                {'url': fetched_url},
+                {'$set': {'etag': validators.get('etag'),
+                          'last_modified': validators.get('last_modified'),
+                          'page_url': self.url,
+                          'checked_at': datetime.utcnow()}},
+                upsert=True)
+        else:
+            self.db[HTTP_VALIDATORS_COL].remove({'url': fetched_url})
@@ -0,0 +1,201 @@
+''' Article date detection.
+
+Detectors look at structured metadata first (article:published_time,
+JSON-LD datePublished, <time datetime>) and only fall back to the fuzzy
+regexes when nothing is found.
+'''
+import re
+import json
+import logging
+from datetime import datetime
+
+import pytz
+from dateutil.parser import parse
+
+log = logging.getLogger("crawler")
+
+STRUCTURED = 'structured'
+BOUNDED = 'bounded'
+FULL = 'full'
+
+TEXT_WINDOW = 20000  # characters of the page body searched by the regex fallback
+PARSE_CACHE_SIZE = 2000
+
+DATE_META_KEYS = (
+    'article:published_time',
+    'og:published_time',
+    'datepublished',
+    'date',
+    'pubdate',
+    'publishdate',
+    'dc.date.issued',
+)
+
+DATE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+    r"(?:(?:jan(?:(?:.)?|(?:uary)?)|feb(?:(?:.)?|(?:ruary)?)|mar(?:(?:.)?|(?:ch)?)|apr(?:(?:.)?|(?:il)?)|may|jun(?:(?:.)?|(?:e)?)|jul(?:(?:.)?|(?:y)?)|aug(?:(?:.)?|(?:gust)?)|sep(?:(?:.)?|(?:ept(?:(?:.)?))?|(?:tember)?)|oct(?:(?:.)?|(?:ober)?)|nov(?:(?:.)?|(?:ember)?)|dec(?:(?:.)?|(?:ember)?)) (?:[123][0-9]|[1-9])[ \t\r\f\v]?(?:rd|st|th)?(?:,)?[ \t\r\f\v]?(?:[0-2][0-9][0-9][0-9])?)",
+    r"(?:(?:[0]?[1-9])|(?:[1][0-2]))[-/](?:(?:[012]?[0-9])|(?:[3][01]))[/-][12]?[0-9]?[0-9][0-9]",  # American style date i.e. 10/12/98
+    r"(?:mon(?:\.|day)?|tue(?:\.|sday)?|wed(?:\.|nesday)?|thur(?:\.|sday)?|fri(?:\.|day)?|sat(?:\.|urday)?|sun(?:\.|day)?)?[ \t\r\f\v]?the (?:[123][0-9]|[1-9])?[ \t\r\f\v]?(?:rd|st|th)?(?:,)?[ \t\r\f\v]?[ \t\r\f\v]?of?[ \t\r\f\v]?(?:jan(?:\.|uary)?|feb(?:\.|ruary)?|mar(?:\.|ch)?|apr(?:\.|il)?|may|jun(?:\.|e)?|jul(?:\.|y)?|aug(?:\.|ust)?|oct(?:\.|ober)?|nov(?:\.|ember)?|dec(?:\.|ember)?),?[ \t\r\f\v]?(?:[0-2][0-9][0-9][0-9])?",  # "the 21st of december 2014"
+    r"(?:mon(?:|day)?|tue(?:|sday)?|wed(?:|nesday)?|thur(?:|sday)?|fri(?:|day)?|sat(?:|urday)?|sun(?:|day)?)[ \t\r\f\v](?:the)?[ \t\f\r\v]?(?:(?:[123][0-9]|[1-9])[ \t\r\f\v]?(?:rd|st|th)?)?",  # "Monday the 23rd"
+)]
+
+BODY_RE = re.compile(r'<body', re.IGNORECASE)
+
+PARSE_CACHE = dict()
+
+
+def parse_date(value, fuzzy=False):
+    ''' dateutil parse with memoization, result is UTC aware or None '''
+    if not value:
+        return None
+    key = (value, fuzzy)
+    if key in PARSE_CACHE:
+        return PARSE_CACHE[key]
+    try:
+        date = parse(value, fuzzy=fuzzy)
+    except (ValueError, OverflowError, TypeError, AttributeError):
+        date = None
+    if isinstance(date, datetime):
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=pytz.UTC)
+        else:
+            date = date.astimezone(pytz.UTC)
+    else:
+        date = None
+    if len(PARSE_CACHE) >= PARSE_CACHE_SIZE:
+        PARSE_CACHE.clear()
+    PARSE_CACHE[key] = date
+    return date
+
+
+def _latest(dates, now):
+    dates = [d for d in dates if d is not None and d <= now]
+    if dates:
+        return max(dates)
+    return None
+
+
+def _json_ld_dates(obj):
+    if isinstance(obj, list):
+        for item in obj:
+            for date in _json_ld_dates(item):
+                yield date
+    elif isinstance(obj, dict):
+        if obj.get('datePublished'):
+            yield obj['datePublished']
+        for item in obj.get('@graph', []):
+            for date in _json_ld_dates(item):
+                yield date
+
+
+class DateDetector(object):
+    _type = None
+
+    def detect(self, document):
+        ''' Publication date of a ParsedDocument, or None '''
+        raise NotImplementedError
+
+
+class StructuredDateDetector(DateDetector):
+
+    ''' Metadata only: meta tags, JSON-LD, <time> tags '''
+
+    _type = STRUCTURED
+
+    def detect(self, document):
+        now = datetime.now(pytz.utc)
+        date = self._from_meta(document) or self._from_json_ld(document)
+        if date is not None and date <= now:
+            return date
+        return self._from_time_tags(document, now)
+
+    def _from_meta(self, document):
+        for attrs in document.meta_tags():
+            key = (attrs.get('property') or attrs.get('name') or
+                   attrs.get('itemprop') or '').lower()
+            if key in DATE_META_KEYS:
+                date = parse_date(attrs.get('content'))
+                if date is not None:
+                    return date
+        return None
+
+    def _from_json_ld(self, document):
+        for script in document.json_ld():
+            try:
+                data = json.loads(script)
+            except ValueError:
+                continue
+            for value in _json_ld_dates(data):
+                date = parse_date(value)
+                if date is not None:
+                    return date
+        return None
+
+    def _from_time_tags(self, document, now):
+        dates = []
+        for value, text in document.time_tags():
+            if value:
+                dates.append(parse_date(value))
+            else:
+                dates.append(parse_date(text, fuzzy=True))
+        return _latest(dates, now)
+
+
+class BoundedDateDetector(StructuredDateDetector):
+
+    ''' Metadata, then the fuzzy regexes over a bounded window of the page body '''
+
+    _type = BOUNDED
+    window = TEXT_WINDOW
+
+    def detect(self, document):
+        date = super(BoundedDateDetector, self).detect(document)
+        if date is not None:
+            return date
+        return self._from_text(self._text(document))
+
+    def _text(self, document):
+        text = document.normalized_text
+        body = BODY_RE.search(text)
+        start = body.start() if body else 0
+        if self.window is None:
+            return text[start:]
+        return text[start:start + self.window]
+
+    def _from_text(self, text):
+        now = datetime.now(pytz.utc)
+        matches = set()
+        for regex in DATE_PATTERNS:
+            matches.update(regex.findall(text))
+        return _latest([parse_date(m) for m in matches], now)
+
+
+class FullDateDetector(BoundedDateDetector):
+
+    ''' Old behaviour: fuzzy regexes over the whole page '''
+
+    _type = FULL
+    window = None
+
+    def _text(self, document):
+        return document.normalized_text
+
+
+DATE_DETECTORS_LIST = [
+    (BOUNDED, BOUNDED),
+    (STRUCTURED, STRUCTURED),
+    (FULL, FULL),
+]
+DATE_DETECTORS_BY_TYPE = {
+    BOUNDED: BoundedDateDetector,
+    STRUCTURED: StructuredDateDetector,
+    FULL: FullDateDetector,
+}
+DEFAULT_DATE_DETECTOR = BOUNDED
+
+
+def get_date_detector(name=None):
+    detector = DATE_DETECTORS_BY_TYPE.get(name or DEFAULT_DATE_DETECTOR)
+    if detector is None:
+        log.info("Unknown date detector [%s], using default", name)
+        detector = DATE_DETECTORS_BY_TYPE[DEFAULT_DATE_DETECTOR]
+    return detector()
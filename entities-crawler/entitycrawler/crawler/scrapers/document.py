@@ -0,0 +1,75 @@
+''' Parse-once page model shared by date detection, meta, text and link extraction '''
+from io import StringIO
+
+from bs4 import BeautifulSoup
+from lxml import etree
+
+from entitycrawler.utils import lazyprop
+
+LXML = 'lxml'
+SOUP = 'soup'
+
+
+class ParsedDocument(object):
+
+    ''' Downloaded page with lazily built parse trees.
+
+        backend - tree used by the query helpers (time_tags, meta_tags, link_tags):
+                  SOUP for scrapers that need BeautifulSoup anyway, LXML otherwise.
+                  A tree is only built the first time something asks for it.
+    '''
+
+    def __init__(self, html, encoding='utf-8', backend=LXML):
+        assert backend in (LXML, SOUP)
+        self.html = html
+        self.encoding = encoding
+        self.backend = backend
+        self.parses = 0
+
+    @lazyprop
+    def text(self):
+        ''' Decoded page '''
+        if isinstance(self.html, unicode):
+            return self.html
+        return self.html.decode(self.encoding, 'replace')
+
+    @lazyprop
+    def normalized_text(self):
+        ''' Decoded page with whitespace runs collapsed to single spaces '''
+        return u' '.join(self.text.split())
+
+    @lazyprop
+    def tree(self):
+        self.parses += 1
+        return etree.parse(StringIO(self.text), etree.HTMLParser())
+
+    @lazyprop
+    def soup(self):
+        self.parses += 1
+        return BeautifulSoup(self.html)
+
+    def time_tags(self):
+        ''' (datetime attribute, text) of every <time> tag '''
+        if self.backend == SOUP:
+            return [(t.get('datetime'), t.string) for t in self.soup.find_all('time')]
+        return [(t.attrib.get('datetime'), t.text) for t in self.tree.iter('time')]
+
+    def json_ld(self):
+        ''' Source of every JSON-LD <script> block '''
+        if self.backend == SOUP:
+            scripts = self.soup.find_all('script', type='application/ld+json')
+            return [s.string for s in scripts if s.string]
+        return [s.text for s in self.tree.iter('script')
+                if s.attrib.get('type') == 'application/ld+json' and s.text]
+
+    def meta_tags(self):
+        ''' Attribute dicts of all <meta> tags '''
+        if self.backend == SOUP:
+            return [t.attrs for t in self.soup.find_all('meta')]
+        return [dict(t.attrib) for t in self.tree.iter('meta')]
+
+    def link_tags(self, tags=('base', 'a', 'link')):
+        ''' (tag name, attributes) of link carrying tags in document order '''
+        if self.backend == SOUP:
+            return [(t.name, t.attrs) for t in self.soup.find_all(tags)]
+        return [(t.tag, t.attrib) for t in self.tree.iter(*tags)]
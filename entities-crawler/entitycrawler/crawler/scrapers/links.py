@@ -0,0 +1,60 @@
+''' Link extraction from anchors and <link rel> tags '''
+from urlparse import urljoin
+
+# <link rel> values that point to crawlable pages
+LINK_RELS = frozenset(['next', 'prev', 'alternate', 'amphtml'])
+SKIPPED_SCHEMES = ('javascript:', 'mailto:', 'tel:', 'data:')
+
+
+class LinkExtractor(object):
+
+    ''' Collects absolute, fragment-less, deduplicated links.
+
+        accept - optional predicate (e.g. crawler URL patterns); it gets the
+                 absolute URL string and links it rejects are dropped right away.
+
+        Tags come from the page's already parsed document (feed_document).
+    '''
+
+    def __init__(self, base_url, accept=None, encoding='utf-8'):
+        self.base_url = base_url
+        self.accept = accept
+        self.encoding = encoding
+        self.links = []
+        self._seen_hrefs = set()
+        self._seen = set()
+
+    def handle_tag(self, tag, attrs):
+        if tag == 'a':
+            self.add(attrs.get('href'))
+        elif tag == 'link':
+            rel = attrs.get('rel') or ''
+            if not isinstance(rel, basestring):  # bs4 keeps rel as a list
+                rel = ' '.join(rel)
+            if LINK_RELS.intersection(rel.lower().split()):
+                self.add(attrs.get('href'))
+        elif tag == 'base' and attrs.get('href') and not self._seen_hrefs:
+            self.base_url = urljoin(self.base_url, attrs['href'].strip())
+
+    def add(self, href):
+        if not href:
+            return
+        href = href.split('#', 1)[0].strip()
+        if not href or href in self._seen_hrefs:
+            return
+        self._seen_hrefs.add(href)
+        if href.lower().startswith(SKIPPED_SCHEMES):
+            return
+        url = urljoin(self.base_url, href)
+        if isinstance(url, str):
+            url = unicode(url, self.encoding, 'replace')
+        if url in self._seen:
+            return
+        self._seen.add(url)
+        if self.accept is None or self.accept(url):
+            self.links.append(url)
+
+    def feed_document(self, document):
+        for tag, attrs in document.link_tags():
+            self.handle_tag(tag, attrs)
+        return self.links
@@ -0,0 +1,195 @@
+''' Per-crawler "already queued" filter kept in Redis bitmaps.
+
+A scalable Bloom filter: every generation starts with one slice sized for
+SEEN_CAPACITY URLs; when a slice is full a new one twice as large with a
+tighter error rate is added, so the overall false positive rate stays under
+the configured one however many links a site has.
+
+Generations last half of the crawler age and the current and previous ones
+are checked, so a URL is suppressed for between age/2 and age seconds and
+can be queued again about when its crawled page record expires. Old
+generations are dropped by Redis key expiry; everything survives restarts.
+'''
+import math
+import time
+import hashlib
+import logging
+
+from entitycrawler.db import CRAWLER_SEEN_PREFIX
+
+log = logging.getLogger("crawler")
+
+SEEN_CAPACITY = 50000  # URLs in the first slice of a generation
+SEEN_ERROR_RATE = 0.001
+GROWTH = 2  # each new slice holds GROWTH times more URLs
+TIGHTENING = 0.5  # ... with error rate multiplied by TIGHTENING
+MIN_GENERATION = 3600
+
+
+class _Slice(object):
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / float(capacity) * math.log(2))))
+
+    def positions(self, digest):
+        # double hashing over the two halves of an md5 digest
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:], 16) | 1
+        return [(h1 + i * h2) % self.bits for i in xrange(self.hashes)]
+
+
+class SeenFilter(object):
+
+    def __init__(self, redis, name, age, error_rate=SEEN_ERROR_RATE, capacity=SEEN_CAPACITY):
+        self.redis = redis
+        self.name = name
+        self.generation_length = max(MIN_GENERATION, int(age) // 2)
+        self.error_rate = error_rate
+        self.capacity = capacity
+        # half of the error budget for each of the two generations checked,
+        # slice error rates form a geometric series summing to that half
+        self._base_error = error_rate / 2 * (1 - TIGHTENING)
+        self._slices = []
+        self._slice_counts = {}  # generation -> number of slices
+        self._room = {}  # generation -> URLs the last slice still takes
+
+    def _slice(self, i):
+        while len(self._slices) <= i:
+            n = len(self._slices)
+            self._slices.append(_Slice(self.capacity * GROWTH ** n,
+                                       self._base_error * TIGHTENING ** n))
+        return self._slices[i]
+
+    def _generation(self):
+        return int(time.time()) // self.generation_length
+
+    def _key(self, generation, i=None):
+        key = '%s%s:%s' % (CRAWLER_SEEN_PREFIX, self.name, generation)
+        if i is None:
+            return key  # meta hash: slices, count (in the last slice)
+        return '%s:%s' % (key, i)
+
+    def _slices_count(self, generation):
+        if generation not in self._slice_counts:
+            slices = self.redis.hget(self._key(generation), 'slices')
+            self._slice_counts = {g: c for g, c in self._slice_counts.items()
+                                  if g >= generation - 1}
+            self._slice_counts[generation] = int(slices or 1)
+        return self._slice_counts[generation]
+
+    def add_many(self, urls):
+        ''' Mark urls as seen, return the ones that weren't (in order).
+
+        One pipelined round trip checks all slices of both generations; a
+        second one sets the bits of the new urls in the current slice and
+        updates the counters. Urls already held by any slice are not set
+        again, so one linked in every generation becomes new again after at
+        most age seconds, and only new urls take room in a slice. Batches
+        bigger than the room left in the current slice are split so no
+        slice gets overfilled.
+        '''
+        urls = list(urls)
+        new = []
+        while urls:
+            room = max(1, self._room.get(self._generation(), len(urls)))
+            new.extend(self._add_chunk(urls[:room]))
+            urls = urls[room:]
+        return new
+
+    def _add_chunk(self, urls):
+        current = self._generation()
+        previous = current - 1
+        current_slices = self._slices_count(current)
+        previous_slices = self._slices_count(previous)
+        last = current_slices - 1
+
+        pipe = self.redis.pipeline(transaction=False)
+        layout = []
+        for url in urls:
+            if isinstance(url, unicode):
+                url = url.encode('utf-8')
+            digest = hashlib.md5(url).hexdigest()
+            checks = []
+            for generation, count in ((previous, previous_slices), (current, current_slices)):
+                for i in xrange(count):
+                    positions = self._slice(i).positions(digest)
+                    key = self._key(generation, i)
+                    for pos in positions:
+                        pipe.getbit(key, pos)
+                    checks.append(len(positions))
+            layout.append((digest, checks))
+        bits = iter(pipe.execute())
+
+        new = []
+        digests = []
+        added = set()  # a url twice in one batch is new only once
+        for url, (digest, checks) in zip(urls, layout):
+            # url was seen if all bits of any slice were already set
+            seen = False
+            for size in checks:
+                if all([next(bits) for _ in xrange(size)]):
+                    seen = True
+            if not seen and digest not in added:
+                added.add(digest)
+                digests.append(digest)
+                new.append(url)
+        if new:
+            self._count(current, last, digests)
+        return new
+
+    def _count(self, generation, last, digests):
+        meta = self._key(generation)
+        key = self._key(generation, last)
+        ttl = self.generation_length * 2
+        pipe = self.redis.pipeline(transaction=False)
+        for digest in digests:
+            for pos in self._slice(last).positions(digest):
+                pipe.setbit(key, pos, 1)
+        pipe.hsetnx(meta, 'slices', 1)
+        pipe.hincrby(meta, 'count', len(digests))
+        pipe.hget(meta, 'slices')
+        pipe.expire(meta, ttl)
+        pipe.expire(key, ttl)
+        _, count, slices, _, _ = pipe.execute()[-5:]
+        slices = int(slices)
+        room = self._slice(last).capacity - count
+        if slices == last + 1 and room <= 0:
+            # slice full: later adds go to a new, larger one
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(meta, 'slices', 1)
+            pipe.hset(meta, 'count', 0)
+            slices = pipe.execute()[0]
+            room = self._slice(slices - 1).capacity
+            log.info("Seen filter %s: slice %s full, adding slice %s", self.name, last, slices - 1)
+        self._slice_counts[generation] = slices
+        self._room = {generation: room}
+
+    def clear(self):
+        for generation in (self._generation() - 1, self._generation()):
+            slices = self._slices_count(generation)
+            self.redis.delete(self._key(generation),
+                              *[self._key(generation, i) for i in xrange(slices)])
+        self._slice_counts = {}
+        self._room = {}
+
+    def stats(self):
+        ''' Items and bytes used per live generation '''
+        generations = {}
+        for generation in (self._generation() - 1, self._generation()):
+            slices = self._slices_count(generation)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hget(self._key(generation), 'count')
+            for i in xrange(slices):
+                pipe.strlen(self._key(generation, i))
+            result = pipe.execute()
+            generations[generation] = {
+                'slices': slices,
+                'items': sum(self._slice(i).capacity for i in xrange(slices - 1)) +
+                int(result[0] or 0),
+                'bytes': sum(result[1:]),
+            }
+        return {'error_rate': self.error_rate,
+                'generations': generations,
+                'bytes': sum(g['bytes'] for g in generations.values())}
@@ -1,5 +1,7 @@
 import datetime
+import logging
 
+from entitycrawler import httpclient
 from entitycrawler.services.classes import AsyncService
 from entitycrawler.db import (
     REDIS_SPLIT_SYMBOL,
@@ -8,9 +10,14 @@ from entitycrawler.db import (
     CRAWLER_QUEUE_PREFIX,
     ensure_crawler_indexes,
 )
-from classes import Website, WebsiteCrawler, STATUS
+from classes import Website, STATUS
+from politeness import HostScheduler
+from counters import CRAWL_COUNTERS
+import robots
 from bson import ObjectId
 
+log = logging.getLogger("crawler")
+
 
 class CrawlerService(object):
 
@@ -27,13 +34,11 @@ class CrawlerService(object):
     def run_job(self):
         print ("running crawler: ", self.name, self.type)
         page = self.crawler.crawler.crawl_page()
+        log.debug("redis round trips: %s", self.crawler.crawler.redis.page_done())
         if page is None:
             return {'status': 'Exception',
                     'totalTransactions': 0,
                     'doc': {}}
-        self.db.crawlers.update(
-            {'_id': ObjectId(self.crawler.crawler.name)},
-            {'$inc': {'crawled_pages': 1}})
         extract = self.crawler.extractor.extract(page)
         return {'status': 'OK',
                 'totalTransactions': 1,
@@ -41,6 +46,10 @@ class CrawlerService(object):
                         'extract': extract,
                         'crawler': self.crawler}}
 
+    def stop(self):
+        ''' Return URLs fetched from the frontier but not crawled yet '''
+        self.crawler.crawler.release_urls()
+
 
 class MultiCrawlerService(AsyncService):
 
@@ -49,6 +58,7 @@ class MultiCrawlerService(AsyncService):
         super(MultiCrawlerService, self).__init__(*args, **kwargs)
         ensure_crawler_indexes(self.db)
 
+        self.scheduler = HostScheduler(self.redis)
         self.crawlers = {}
         self.crawlers_paused = {}
         self.init_crawlers()
@@ -57,23 +67,38 @@ class MultiCrawlerService(AsyncService):
         ''' check if crawlers in queue '''
         print("MultiCrawlerService init crawlers")
         self.redis.delete(CRAWLERS_POOL_NAME)
+        self.scheduler.clear()
         for website in Website.get_all(db=self.db, redis=self.redis, status=Website.ENABLED):
             for crawler in website.crawlers:
                 if crawler.enabled:
                     self.start_crawler(crawler)
 
     def check_crawlers_pool(self):
+        ''' Bring the pool in line with the database: stop crawlers disabled
+            since the last check, start new ones and restart the ones whose
+            record changed; unchanged crawlers keep running untouched '''
         print("MultiCrawlerService check pool")
+        wanted = {}
+        website_disabled = set()
         for website in Website.get_all(db=self.db, redis=self.redis, status=None):
-            if website.status == 0:
-                for crawler in website.crawlers:
-                    self.stop_crawler(crawler, status=-1)
-            if website.status == 1:
-                for crawler in website.crawlers:
-                    if crawler.status == STATUS['disabled']:
-                        self.stop_crawler(crawler, status=0)
-                    if crawler.status == STATUS['enabled']:
-                        self.start_crawler(crawler)
+            for crawler in website.crawlers:
+                if website.status != STATUS['enabled']:
+                    website_disabled.add(crawler.id)
+                elif crawler.status == STATUS['enabled']:
+                    wanted[crawler.id] = crawler
+
+        for crawler_id in set(self.crawlers).union(self.crawlers_paused).difference(wanted):
+            entry = self.crawlers.get(crawler_id) or self.crawlers_paused[crawler_id]
+            self.stop_crawler(entry['crawler'],
+                              status=-1 if crawler_id in website_disabled else 0)
+
+        for crawler_id, crawler in wanted.iteritems():
+            entry = self.crawlers.get(crawler_id) or self.crawlers_paused.get(crawler_id)
+            if entry is None:
+                self.start_crawler(crawler)
+            elif self._changed(entry['crawler'], crawler):
+                self.stop_crawler(entry['crawler'])
+                self.start_crawler(crawler)
 
         crawlers_paused = set(self.crawlers_paused.keys())
         print("PAUSED CRAWLERS: ", crawlers_paused)
@@ -89,10 +114,10 @@ class MultiCrawlerService(AsyncService):
             crawler = self.crawlers[crawler_id]['crawler']
             self.stop_crawler(crawler)
 
-        self.crawlers = {}
-        for crawler_id in crawlers_enabled:
-            crawler = WebsiteCrawler.get_by_id(crawler_id, db=self.db, redis=self.redis)
-            self.start_crawler(crawler)
+    @staticmethod
+    def _changed(running, loaded):
+        return (running.date_lastupdated, running.status) != \
+            (loaded.date_lastupdated, loaded.status)
 
     def pause_crawler(self, crawler):
         self.crawlers_paused[crawler.id] = self.crawlers.pop(crawler.id)
@@ -100,6 +125,7 @@ class MultiCrawlerService(AsyncService):
             {'_id': ObjectId(crawler.id)},
             {'$set': {'crawling_status': 2}})
         crawler.dequeue()
+        self.scheduler.remove(crawler.id)
 
     def resume_crawler(self, crawler):
         self.crawlers[crawler.id] = self.crawlers_paused.pop(crawler.id)
@@ -108,6 +134,7 @@ class MultiCrawlerService(AsyncService):
             {'_id': ObjectId(crawler.id)},
             {'$set': {'crawling_status': 1}})
         crawler.queue()
+        self.scheduler.add(crawler.id)
 
     def start_crawler(self, crawler):
         print("MultiCrawlerService start crawler ", crawler.name)
@@ -119,6 +146,7 @@ class MultiCrawlerService(AsyncService):
             {'_id': ObjectId(crawler.id)},
             {'$set': {'crawling_status': 1}})
         crawler.queue()
+        self.scheduler.add(crawler.id)
 
     def stop_crawler(self, crawler, status=0):
         print("MultiCrawlerService stop crawler ", crawler.name)
@@ -126,12 +154,18 @@ class MultiCrawlerService(AsyncService):
             {'_id': ObjectId(crawler.id)},
             {'$set': {'crawling_status': status}})
         crawler.dequeue()
-        self.crawlers[crawler.id]['service'].stop()
-        del self.crawlers[crawler.id]
+        self.scheduler.remove(crawler.id)
+        entry = self.crawlers.pop(crawler.id, None) or self.crawlers_paused.pop(crawler.id, None)
+        if entry is not None:
+            entry['service'].stop()
 
     def choose_crawler(self):
         print("MultiCrawlerService choose crawler")
-        crawler_id = self.redis.brpoplpush(CRAWLERS_POOL_NAME, CRAWLERS_POOL_NAME, timeout=3)
+        start_urls = dict((crawler_id, c['crawler'].start_url)
+                          for crawler_id, c in self.crawlers.iteritems())
+        crawler_id = self.scheduler.claim(start_urls)
+        if crawler_id is None:
+            return None
         crawler = self.crawlers[crawler_id]
         print("got crawler", crawler['service'].name)
         if crawler['service'].crawler.crawler.on_pause:
@@ -153,6 +187,22 @@ class MultiCrawlerService(AsyncService):
         print("MultiCrawlerService every minute")
 
         self.check_crawlers_pool()
+        print("Flushed %s crawl counters" % CRAWL_COUNTERS.flush(self.db))
+        httpclient.log_pool_stats()
+        robots.log_stats()
+        for crawler in self.crawlers.values():
+            crawler_class = crawler['service'].crawler.crawler
+            print("Redis round trips per page %s: %.1f" % (crawler['crawler'].name,
+                                                           crawler_class.redis.average()))
+            # the stats go through the counting proxy too, but aren't part
+            # of a crawled page
+            round_trips = crawler_class.redis.round_trips
+            stats = crawler_class.seen.stats()
+            revisit = crawler_class.revisit.stats()
+            crawler_class.redis.round_trips = round_trips
+            print("Seen filter %s: %s bytes" % (crawler['crawler'].name, stats['bytes']))
+            print("Revisit %s: every %.0fs, change rate %.2f" % (
+                crawler['crawler'].name, revisit['interval'], revisit['change_rate']))
 
     def _save_data(self, result):
         print("MultiCrawlerService _save_data")
@@ -165,4 +215,4 @@ class MultiCrawlerService(AsyncService):
         extracted_page.save()
         crawler.extractor.save_entities(extracted_page.doc)
         self.db.url_queue.insert({'url': page.url})
-        crawler.inc_crawled_count()
+        CRAWL_COUNTERS.count(crawler, extracted_pages=1)
@@ -0,0 +1,135 @@
+''' Sitemap discovery and streaming sitemap / sitemap index parsing.
+
+Sitemaps are read straight off the HTTP response with lxml iterparse and
+every <url>/<sitemap> element is dropped once handled, so memory stays flat
+for sitemaps with millions of entries. Gzipped sitemaps are decompressed on
+the fly.
+'''
+import zlib
+import logging
+from urlparse import urlparse
+
+from lxml import etree
+
+from entitycrawler import httpclient
+from entitycrawler.crawler.scrapers.dates import parse_date
+
+log = logging.getLogger("crawler")
+
+SITEMAP_DEPTH = 3  # sitemap index -> sitemap index -> ... -> urlset
+SITEMAP_TIMEOUT = 60
+GZIP_TYPES = frozenset(['application/x-gzip', 'application/gzip'])
+
+URL = 'url'
+SITEMAP = 'sitemap'
+
+
+def default_sitemap(url):
+    parsed = urlparse(url)
+    return '%s://%s/sitemap.xml' % (parsed.scheme or 'http', parsed.netloc)
+
+
+def discover(url, robots):
+    ''' Sitemaps listed in robots.txt, else /sitemap.xml if it is one '''
+    sitemaps = robots.rules(url).sitemaps
+    if sitemaps:
+        return list(sitemaps)
+    candidate = default_sitemap(url)
+    for kind, _, _ in iter_entries(candidate):
+        log.debug("found sitemap (%s entries): %s", kind, candidate)
+        return [candidate]
+    return []
+
+
+class GunzipStream(object):
+
+    ''' File-like gzip decompression of a non seekable stream
+        (py2 GzipFile wants to seek) '''
+
+    def __init__(self, raw, chunk_size=64 * 1024):
+        self.raw = raw
+        self.chunk_size = chunk_size
+        self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = self.raw.read(self.chunk_size)
+            if not chunk:
+                self._buffer += self._inflate.flush()
+                break
+            self._buffer += self._inflate.decompress(chunk)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _open(url):
+    resp = httpclient.get(url, stream=True, timeout=SITEMAP_TIMEOUT)
+    if resp.status_code != 200:
+        resp.close()
+        return None, None
+    resp.raw.decode_content = True  # Content-Encoding: gzip
+    content_type = resp.headers.get('content-type', '').split(';')[0].strip().lower()
+    gzipped = url.lower().endswith('.gz') or content_type in GZIP_TYPES
+    if gzipped and 'gzip' not in resp.headers.get('content-encoding', ''):
+        return resp, GunzipStream(resp.raw)
+    return resp, resp.raw
+
+
+def iter_entries(url):
+    ''' (URL or SITEMAP, loc, lastmod datetime or None) of one sitemap file '''
+    try:
+        resp, stream = _open(url)
+    except Exception as e:
+        log.debug("sitemap %s failed: %s", url, e)
+        return
+    if resp is None:
+        return
+    try:
+        context = etree.iterparse(stream, events=('end',), recover=True,
+                                  resolve_entities=False, no_network=True)
+        for _, elem in context:
+            if not isinstance(elem.tag, basestring):
+                continue
+            name = etree.QName(elem)
+            if name.localname in (URL, SITEMAP):
+                # only the entry's own <loc>/<lastmod>, not those of
+                # extensions like <image:image><image:loc>
+                loc = elem.findtext(etree.QName(name.namespace, 'loc').text)
+                lastmod = elem.findtext(etree.QName(name.namespace, 'lastmod').text)
+                loc = (loc or '').strip()
+                if loc:
+                    yield name.localname, loc, parse_date((lastmod or '').strip())
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+    except (etree.XMLSyntaxError, IOError, zlib.error) as e:
+        log.debug("sitemap %s: %s", url, e)
+    finally:
+        resp.close()
+
+
+def iter_urls(sitemaps, since=None, depth=SITEMAP_DEPTH):
+    ''' (loc, lastmod) of pages in sitemaps, following sitemap indexes.
+
+    since - aware datetime; entries (and child sitemaps) with an older or
+            equal lastmod are skipped, entries without lastmod are kept
+    '''
+    seen = set()
+    stack = [(url, 0) for url in reversed(sitemaps)]
+    while stack:
+        url, level = stack.pop()
+        if url in seen:
+            continue
+        seen.add(url)
+        children = []
+        for kind, loc, lastmod in iter_entries(url):
+            if since is not None and lastmod is not None and lastmod <= since:
+                continue
+            if kind == URL:
+                yield loc, lastmod
+            elif level < depth:
+                children.append((loc, level + 1))
+        stack.extend(reversed(children))
@@ -0,0 +1,196 @@
+''' One-pass matching of a URL against a crawler's URL patterns.
+
+The patterns are compiled into a single alternation, one named group per
+pattern, non-default patterns first, so a single re.match() tells which
+pattern (if any) a URL matches and non-default ones win. A trie of the
+literal prefixes of the patterns (e.g. "http://www.site.com/news/")
+rejects links to other hosts before any regex runs.
+
+Patterns that can't take part in the alternation (own groups numbered or
+named, backreferences, inline flags, or too many patterns for re) are
+matched one by one after it.
+'''
+import re
+import logging
+
+log = logging.getLogger("crawler")
+
+FLAGS = re.IGNORECASE
+GROUP_PREFIX = '_p'
+MAX_GROUPS = 99  # py2 re allows 100 groups per pattern, incl. group 0
+SPECIAL = frozenset('.^$*+?{}[]\\|()')
+QUANTIFIERS = frozenset('*?{')
+# escapes standing for one literal character
+LITERAL_ESCAPES = frozenset('.-/:?&=#%+*$^|()[]{}\\_~!,;@')
+MAX_PREFIXES = 16  # trie entries per pattern
+NOT_COMBINABLE = re.compile(r'\(\?[PiLmsux#]|\\[1-9]')
+
+
+def _literal_at(pattern, i):
+    ''' (literal text, length in pattern) of the atom at i; text is None if
+        the atom isn't a plain character, escaped character or a group of
+        those, like (www\.) '''
+    ch = pattern[i]
+    if ch == '\\':
+        if pattern[i + 1:i + 2] and pattern[i + 1] in LITERAL_ESCAPES:
+            return pattern[i + 1], 2
+        return None, 0
+    if ch == '(':
+        end = pattern.find(')', i)
+        start = i + 3 if pattern.startswith('(?:', i) else i + 1
+        if end < 0 or pattern[start:start + 1] == '?':
+            return None, 0
+        text = []
+        j = start
+        while j < end:
+            literal, step = _literal_at(pattern, j)
+            if literal is None or len(literal) != 1 or \
+                    pattern[j + step:j + step + 1] in QUANTIFIERS.union('+'):
+                return None, 0
+            text.append(literal)
+            j += step
+        return ''.join(text), end + 1 - i
+    if ch in SPECIAL:
+        return None, 0
+    return ch, 1
+
+
+def literal_prefixes(pattern, limit=MAX_PREFIXES):
+    ''' Lowercased literal texts one of which every match of pattern starts
+        with (optional parts like s? or (www\.)? give alternatives); ['']
+        if there is no such text '''
+    if not _top_level_alternation_free(pattern):
+        return ['']
+    prefixes = ['']
+    i = 1 if pattern.startswith('^') else 0  # re.match is anchored anyway
+    while i < len(pattern):
+        literal, step = _literal_at(pattern, i)
+        if literal is None:
+            break
+        literal = literal.lower()
+        nxt = pattern[i + step:i + step + 1]
+        if nxt == '?':
+            if len(prefixes) * 2 > limit:
+                break
+            prefixes = prefixes + [p + literal for p in prefixes]
+            i += step + 1
+            continue
+        if nxt and nxt in QUANTIFIERS:
+            break  # repeated: stop before it
+        prefixes = [p + literal for p in prefixes]
+        if nxt == '+':
+            break
+        i += step
+    return prefixes
+
+
+def _top_level_alternation_free(pattern):
+    depth = 0
+    escaped = in_class = False
+    for ch in pattern:
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif in_class:
+            in_class = ch != ']'
+        elif ch == '[':
+            in_class = True
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == '|' and depth == 0:
+            return False
+    return True
+
+
+class PrefixTrie(object):
+
+    ''' Set of prefixes; tells if a string starts with any of them '''
+
+    def __init__(self, prefixes):
+        self.root = {}
+        self.match_all = False
+        for prefix in prefixes:
+            if not prefix:
+                self.match_all = True
+                continue
+            node = self.root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node[None] = True
+
+    def starts_any(self, text):
+        if self.match_all:
+            return True
+        node = self.root
+        for ch in text:
+            if None in node:
+                return True
+            node = node.get(ch)
+            if node is None:
+                return False
+        return None in node
+
+
+class URLPatternMatcher(object):
+
+    ''' patterns - (id, regex source) in priority order, default - id of
+        the default pattern (matched last), defaults - ids of more of them
+        (patterns of several crawlers of one site) '''
+
+    def __init__(self, patterns, default=None, defaults=()):
+        patterns = list(patterns)
+        self.defaults = set(defaults)
+        if default is not None:
+            self.defaults.add(default)
+        ordered = [p for p in patterns if p[0] not in self.defaults] + \
+                  [p for p in patterns if p[0] in self.defaults]
+        self.trie = PrefixTrie(prefix for _, source in ordered
+                               for prefix in literal_prefixes(source))
+
+        combinable = []
+        self.separate = []
+        groups = 0
+        for _id, source in ordered:
+            regex = re.compile(source, FLAGS)
+            if groups + regex.groups + 1 <= MAX_GROUPS and not NOT_COMBINABLE.search(source):
+                combinable.append((_id, source))
+                groups += regex.groups + 1
+            else:
+                self.separate.append((_id, regex))
+        self.group_ids = {}
+        self.combined = None
+        if combinable:
+            alternatives = []
+            for i, (_id, source) in enumerate(combinable):
+                name = '%s%d' % (GROUP_PREFIX, i)
+                self.group_ids[name] = _id
+                alternatives.append('(?P<%s>%s)' % (name, source))
+            try:
+                self.combined = re.compile('|'.join(alternatives), FLAGS)
+            except (re.error, AssertionError, OverflowError) as e:
+                log.warning("can't combine URL patterns, matching one by one: %s", e)
+                self.group_ids = {}
+                self.separate = [(_id, re.compile(source, FLAGS)) for _id, source in ordered]
+
+    def match_id(self, url):
+        ''' id of the first non-default pattern url matches, else the default
+            id if that matches, else None '''
+        if not self.trie.starts_any(url.lower()):
+            return None
+        found = None
+        if self.combined is not None:
+            m = self.combined.match(url)
+            if m is not None:
+                found = self.group_ids[m.lastgroup]
+                # a default match must not hide a separately matched pattern
+                if found not in self.defaults or not self.separate:
+                    return found
+        for _id, regex in self.separate:
+            if regex.match(url):
+                if _id not in self.defaults:
+                    return _id
+                found = found or _id
+        return found
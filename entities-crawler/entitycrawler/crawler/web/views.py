@@ -230,7 +230,7 @@ def url_pattern_del(pattern_id):
 
     if request.method == 'GET':
         try:
-            WebsiteURLPatterns.delete(db=entity_db, _id=pattern_id)
+            WebsiteURLPatterns.delete(db=entity_db, _id=pattern_id, redis=redis)
             return jsonify(**{'status': 'SUCCESS'})
         except Exception as e:
             return jsonify(**{'status': 'FAIL', 'msg': e})
@@ -3,7 +3,17 @@ from math import ceil
 
 
 CRAWLERS_POOL_NAME = 'crawlers'
-CRAWLER_QUEUE_PREFIX = 'crawler_'
+CRAWLERS_READY_NAME = 'crawlers_ready'
+HOST_BUCKET_PREFIX = 'host_bucket_'
+ROBOTS_PREFIX = 'robots_'
+SITEMAP_VISIT_PREFIX = 'sitemap_visit_'
+REVISIT_PREFIX = 'revisit_'
+FEED_STATE_PREFIX = 'feed_state_'
+FEED_URL_PREFIX = 'feed_url_'
+CRAWLER_QUEUE_PREFIX = 'crawler_'  # legacy SET frontier, migrated on start
+CRAWLER_FRONTIER_PREFIX = 'frontier_'
+CRAWLER_SEEN_PREFIX = 'crawler_seen_'
+URL_PATTERNS_VERSION_NAME = 'url_patterns_version'  # counter and pub/sub channel
 REDIS_SPLIT_SYMBOL = '||'
 
 
@@ -14,10 +24,19 @@ WEBSITES_ENTITIES_COL = "website_entities"
 WEBSITES_CANDIDATES_COL = "website_candidates"
 WEBSITES_COL = "website"
 CRAWLERS_COL = "crawlers"
+HTTP_VALIDATORS_COL = "http_validators"
+HTML_BLOBS_COL = "html_blobs"
+DEDUP_STATS_COL = "dedup_stats"
+
+# crawled pages live 1h past crawled_at (see ensure_crawled_pages_index),
+# blobs HTML_BLOB_TTL past last_seen, which htmlstore keeps at or after the
+# crawled_at of the pages using them, so blobs outlive their pages
+HTML_BLOB_TTL = 2 * 3600
 
 CRAWLER_INDEX_CHECKED = False
 EXTRACTOR_INDEX_CHECKED = False
 CRAWLED_PAGES_INDEX_CHECKED = False
+HTML_BLOBS_INDEX_CHECKED = False
 
 
 def paginate(cursor, page, per_page=25, max_count=250):
@@ -34,12 +53,25 @@ def ensure_crawled_pages_index(db):
         CRAWLED_PAGES_INDEX_CHECKED = True
 
 
+def ensure_html_blobs_index(db):
+    global HTML_BLOBS_INDEX_CHECKED
+    if not HTML_BLOBS_INDEX_CHECKED:
+        db[HTML_BLOBS_COL].ensure_index('last_seen', expireAfterSeconds=HTML_BLOB_TTL)
+        HTML_BLOBS_INDEX_CHECKED = True
+
+
 def ensure_crawler_indexes(db):
     global CRAWLER_INDEX_CHECKED
     if not CRAWLER_INDEX_CHECKED:
         db[CRAWLED_PAGES_COL].ensure_index([
             ('url', pymongo.ASCENDING),
         ])
+        db[CRAWLED_PAGES_COL].ensure_index([
+            ('canonical_key', pymongo.ASCENDING),
+        ], sparse=True)
+        db[HTTP_VALIDATORS_COL].ensure_index([
+            ('url', pymongo.ASCENDING),
+        ], unique=True)
         CRAWLER_INDEX_CHECKED = True
 
 
@@ -52,6 +84,12 @@ def ensure_extractor_indexes(db):
         db[EXTRACTED_PAGES_COL].ensure_index([
             ('site', pymongo.ASCENDING),
         ])
+        db[EXTRACTED_PAGES_COL].ensure_index([
+            ('simhash_bands', pymongo.ASCENDING),
+        ], sparse=True)
+        db[DEDUP_STATS_COL].ensure_index([
+            ('site', pymongo.ASCENDING),
+        ], unique=True)
         
         
         db[WEBSITES_ENTITIES_COL].ensure_index([
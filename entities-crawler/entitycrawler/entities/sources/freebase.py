@@ -3,11 +3,11 @@ import datetime as dt
 import logging
 
 
-import requests
 from requests.exceptions import RequestException
 from pymongo import MongoClient
 from pymongo.errors import DuplicateKeyError
 
+from entitycrawler import httpclient
 
 log = logging.getLogger("entityextractor")
 
@@ -40,7 +40,7 @@ class FreebaseEntityImporter(object):
 
     def _req(self, params, n=1):
         try:
-            return requests.get(self.conf['freebase_url'], params=params, timeout=self.conf['timeout'])
+            return httpclient.get(self.conf['freebase_url'], params=params, timeout=self.conf['timeout'])
         except RequestException:
             if n <= self.conf['retry']:
                 return self._req(params, n=n + 1)
@@ -1,10 +1,10 @@
 
-import requests
 from BeautifulSoup import BeautifulSoup
 import datetime as dt
 import time
 from pymongo import MongoClient
 from entitycrawler import db as edb
+from entitycrawler import httpclient
 
 class IMDBEntityImporter(object):
 
@@ -117,7 +117,7 @@ class IMDBEntityImporter(object):
     def _get_url(self, url):
         while True:
             try:
-                r = requests.get('http://www.imdb.com'+url)
+                r = httpclient.get('http://www.imdb.com'+url)
                 if r.status_code == 200:
                     return r
                 else:
@@ -1,10 +1,11 @@
 import datetime as dt
-import requests
 from pymongo import MongoClient
 from pymongo.errors import DuplicateKeyError
 import re
 from langdetect import detect
 
+from entitycrawler import httpclient
+
 
 class WikidataEntityImporter(object):
 
@@ -25,20 +26,20 @@ class WikidataEntityImporter(object):
         self.db = db
 
     def get_properties_list(self, category):
-        r = requests.get('https://www.wikidata.org/w/api.php?action=wbsearchentities&search='+category+'&language=en&type=property&limit=50&format=json',
+        r = httpclient.get('https://www.wikidata.org/w/api.php?action=wbsearchentities&search='+category+'&language=en&type=property&limit=50&format=json',
                          timeout=self.conf['timeout'])
         properties_list = r.json()['search']
         print('properties found for category: ', category, ' is ', [prop['label'] for prop in properties_list])
         return properties_list
 
     def get_entities_list(self, prop):
-        r = requests.get('http://wdq.wmflabs.org/api?q=claim['+str(prop)+']',
+        r = httpclient.get('http://wdq.wmflabs.org/api?q=claim['+str(prop)+']',
                          timeout=self.conf['timeout'])
         entities_list = r.json()['items']
         return entities_list
 
     def get_entity(self, ids):
-        r = requests.get('https://www.wikidata.org/w/api.php?action=wbgetentities&ids='+str(ids)[:-1]+'&props=labels&languages=en&format=json',
+        r = httpclient.get('https://www.wikidata.org/w/api.php?action=wbgetentities&ids='+str(ids)[:-1]+'&props=labels&languages=en&format=json',
                          timeout=self.conf['timeout'])
         entity_data = r.json()
         return entity_data
@@ -1,5 +1,6 @@
 import math
 import datetime
+import logging
 import os
 import re
 from collections import Counter
@@ -14,15 +15,20 @@ from entitycrawler.db import (EXTRACTED_PAGES_COL,
                               ensure_extractor_indexes)
 
 import entitycrawler.crawler
+from entitycrawler.extractor import dedup
 from entitycrawler.extractor.exceptions import ExtractionError
+from entitycrawler.crawler.exceptions import PageNotModifiedError
 from entitycrawler.crawler.scrapers import ScrappedPage
 from entitycrawler.utils import lazyprop
+from entitycrawler.textmatch import MultiPatternMatcher
 try:
     from web import db as unitsdb
 except:
     print("Couldn't import UnitsDB connection")
     unitsdb = None
 
+log = logging.getLogger("entityextractor")
+
 current_path = os.path.dirname(os.path.realpath(__file__))
 
 ENTITIES_CACHE = dict()
@@ -246,8 +252,16 @@ class ExtractedPage(object):
         else:
             page_extract = None
 
+        page_scrap = None
         if not page_extract:
-            page_scrap = ScrappedPage(url, scrapper, db=db)
+            try:
+                page_scrap = ScrappedPage(url, scrapper, db=db)
+            except PageNotModifiedError:
+                page_extract = extractor.get_extract(url)
+                if page_extract is None:
+                    page_scrap = ScrappedPage(url, scrapper, db=db, revalidate=False)
+
+        if page_scrap is not None:
             if save and not page_scrap.is_saved:
                 page_scrap.save()
             try:
@@ -327,8 +341,11 @@ class EntityExtractor(object):
     name = _type + ver
     entities_cache = {}
     candidates_cache = []
+    _shared = {}  # id(db) -> EntityExtractor, see shared()
 
     TITLE_WEIGHT = ENTITIES_OVER_CANDIDATES_WEIGHT = 2
+    # reuse entities of a stored near-duplicate extract instead of running NER
+    reuse_duplicates = True
 
     def __init__(self, mongodb):
         self.db = mongodb
@@ -339,6 +356,15 @@ class EntityExtractor(object):
         punkt_param.abbrev_types = ('dr', 'vs', 'mr', 'mrs', 'prof', 'inc')
         self.sentence_splitter = PunktSentenceTokenizer(punkt_param)
 
+    @classmethod
+    def shared(cls, mongodb):
+        ''' Process-wide extractor of mongodb, built on first use (loading
+            AFINN and Punkt and checking indexes is expensive) '''
+        extractor = cls._shared.get(id(mongodb))
+        if extractor is None:
+            extractor = cls._shared[id(mongodb)] = cls(mongodb)
+        return extractor
+
     def wrap_entities_for_db(self, scored_entities):
         ''' convert Entity Object
             to list of items {entity fields,
@@ -484,6 +510,7 @@ class EntityExtractor(object):
         scored_text_entities = {}
         scored_text_candidates = {}
 
+        highlights = MultiPatternMatcher(p for p in highlighted_strings if len(p) >= 2)
         sentences = self.sentence_splitter.tokenize(text)
         for sent in sentences:
             if len(sent) < 3:
@@ -491,13 +518,9 @@ class EntityExtractor(object):
             sent_entities, sent_candidates, sent_no_entities = self.named_entity_extractor(sent)
             entities.extend(sent_entities)
             candidates.extend(sent_candidates)
-            for piece in highlighted_strings:
-
-                if len(piece) < 2:
-                    continue
+            for piece in highlights.found_in(sent):
                 if piece not in sent_candidates and\
-                        piece not in sent_entities and\
-                        piece in sent:
+                        piece not in sent_entities:
                     checked_entity = Entity.check(piece, self.db)
                     if checked_entity is not None:
                         sent_entities.append(checked_entity)
@@ -551,6 +574,18 @@ class EntityExtractor(object):
             "keywords": page.metadata.get('keywords', [])
         }
 
+        fingerprint = dedup.simhash(text)
+        extracted_data.update(dedup.fingerprint_fields(fingerprint))
+        if self.reuse_duplicates:
+            duplicate = dedup.find_duplicate(self.db, fingerprint, url=page.url)
+            dedup.record(self.db, extracted_data['site'], duplicate is not None)
+            if duplicate is not None:
+                log.debug("Near-duplicate of %s, reusing its entities", duplicate['url'])
+                for field in dedup.REUSED_FIELDS:
+                    extracted_data[field] = copy.deepcopy(duplicate[field])
+                extracted_data['duplicate_of'] = duplicate['url']
+                return extracted_data
+
         extract = self.extract_entities(
             page.title, text, page.highlighted_strings)
         extracted_data['suggested_entities'], extracted_data['entities'], extracted_data['candidates'] = extract
@@ -0,0 +1,105 @@
+''' Near-duplicate detection for extracted pages (SimHash).
+
+Syndicated copies and print/AMP variants of an article differ only in a few
+words, so their 64 bit SimHashes differ in a few bits. Fingerprints are cut
+into BANDS bands of equal width and stored with the extracted page; any page
+within MAX_DISTANCE bits shares at least one band with it (pigeonhole), so a
+lookup is a single indexed `$in` query on the bands.
+'''
+import re
+import hashlib
+from collections import Counter
+
+from entitycrawler.db import EXTRACTED_PAGES_COL, DEDUP_STATS_COL
+
+FINGERPRINT_BITS = 64
+BANDS = 4
+MAX_DISTANCE = 3  # must stay below BANDS
+SHINGLE_SIZE = 3
+MIN_TOKENS = 20  # shorter texts are too unstable to fingerprint
+REUSED_FIELDS = ('suggested_entities', 'entities', 'candidates')  # copied from a duplicate
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+BAND_WIDTH = FINGERPRINT_BITS // BANDS
+BAND_MASK = (1 << BAND_WIDTH) - 1
+
+
+def _feature_hash(feature):
+    return int(hashlib.md5(feature.encode('utf-8')).hexdigest()[:FINGERPRINT_BITS // 4], 16)
+
+
+def simhash(text):
+    ''' 64 bit SimHash over word shingles, None for too short texts '''
+    tokens = TOKEN_RE.findall(text.lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = Counter(u' '.join(tokens[i:i + SHINGLE_SIZE])
+                       for i in xrange(len(tokens) - SHINGLE_SIZE + 1))
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, count in shingles.iteritems():
+        h = _feature_hash(shingle)
+        for bit in xrange(FINGERPRINT_BITS):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def to_hex(fingerprint):
+    ''' Mongo has no unsigned 64 bit ints, fingerprints are stored as hex '''
+    return '%016x' % fingerprint
+
+
+def bands(fingerprint):
+    return ['%d:%0*x' % (i, BAND_WIDTH // 4, fingerprint >> (i * BAND_WIDTH) & BAND_MASK)
+            for i in xrange(BANDS)]
+
+
+def fingerprint_fields(fingerprint):
+    ''' Fields stored in the extracted page document '''
+    if fingerprint is None:
+        return {}
+    return {'simhash': to_hex(fingerprint), 'simhash_bands': bands(fingerprint)}
+
+
+def find_duplicate(db, fingerprint, url=None, fields=REUSED_FIELDS):
+    ''' url and fields of the closest stored extract within MAX_DISTANCE of
+        fingerprint (other than url); candidates sharing a band are read
+        with their fingerprint only, the full fields of the closest one '''
+    if fingerprint is None:
+        return None
+    query = {'simhash_bands': {'$in': bands(fingerprint)}}
+    if url is not None:
+        query['url'] = {'$ne': url}
+    best, best_distance = None, MAX_DISTANCE + 1
+    for doc in db[EXTRACTED_PAGES_COL].find(query, {'simhash': 1}):
+        d = distance(fingerprint, int(doc['simhash'], 16))
+        if d < best_distance:
+            best, best_distance = doc['_id'], d
+    if best is None:
+        return None
+    return db[EXTRACTED_PAGES_COL].find_one({'_id': best}, ['url'] + list(fields))
+
+
+def record(db, site, duplicate):
+    ''' Count an extraction for the per-site duplicate rate '''
+    inc = {'pages': 1, 'duplicates': 1 if duplicate else 0}
+    db[DEDUP_STATS_COL].update({'site': site}, {'$inc': inc}, upsert=True)
+
+
+def duplicate_rate(db, site):
+    ''' (pages, duplicates, rate) for site '''
+    stats = db[DEDUP_STATS_COL].find_one({'site': site}) or {}
+    pages = stats.get('pages', 0)
+    duplicates = stats.get('duplicates', 0)
+    rate = float(duplicates) / pages if pages else 0.0
+    return pages, duplicates, rate
@@ -0,0 +1,157 @@
+''' Content-addressed, compressed storage for raw page HTML.
+
+Pages keep only `html_hash` (sha1 of the stored bytes) and `html_unicode`;
+the body lives once in HTML_BLOBS_COL no matter how many pages/recrawls
+share it. A str and a unicode body with the same UTF-8 bytes share a blob,
+so whether html was unicode is recorded on the page, not the blob.
+Blobs expire HTML_BLOB_TTL after last_seen. Saving or extending a page
+moves last_seen up to the page's crawled_at (never back), so a blob
+outlives every page that references it.
+'''
+import zlib
+import hashlib
+import logging
+from datetime import datetime
+
+from bson.binary import Binary
+
+from entitycrawler.db import CRAWLED_PAGES_COL, HTML_BLOBS_COL, ensure_html_blobs_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger("crawler")
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+DEFAULT_CODEC = ZSTD if zstandard is not None else ZLIB
+MIGRATION_BATCH = 500
+
+
+def _compress(data, codec):
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data, codec):
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("HTML blob is zstd compressed but zstandard isn't installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _to_bytes(html):
+    ''' (bytes, is_unicode) '''
+    if isinstance(html, unicode):
+        return html.encode('utf-8'), True
+    return html, False
+
+
+def html_hash(html):
+    return hashlib.sha1(_to_bytes(html)[0]).hexdigest()
+
+
+def is_unicode(html):
+    ''' Value of the page's html_unicode field for html '''
+    return isinstance(html, unicode)
+
+
+def make_blob(html, codec=None):
+    ''' (hash, blob fields) for html, without touching the DB '''
+    codec = codec or DEFAULT_CODEC
+    data = _to_bytes(html)[0]
+    return hashlib.sha1(data).hexdigest(), {
+        'codec': codec,
+        'data': Binary(_compress(data, codec)),
+        'size': len(data),
+    }
+
+
+def save(db, html, codec=None, until=None):
+    ''' Store html once and return its hash. One upsert: an existing blob
+        only gets its last_seen moved up to until (the crawled_at of the
+        page, default now). The page keeps is_unicode(html) next to the hash.
+    '''
+    ensure_html_blobs_index(db)
+    key, blob = make_blob(html, codec)
+    db[HTML_BLOBS_COL].update({'_id': key},
+                              {'$setOnInsert': blob,
+                               '$max': {'last_seen': until or datetime.utcnow()}},
+                              upsert=True)
+    return key
+
+
+def touch(db, key, until=None):
+    ''' Move last_seen of an already stored blob up to until (default now) '''
+    extend(db, [key], until or datetime.utcnow())
+
+
+def extend(db, keys, until):
+    ''' Keep the blobs of keys at least until the pages expiring at until '''
+    keys = [key for key in keys if key]
+    if keys:
+        db[HTML_BLOBS_COL].update({'_id': {'$in': keys}},
+                                  {'$max': {'last_seen': until}}, multi=True)
+
+
+def load(db, key, as_unicode=None):
+    ''' Stored html for key (None if the blob is gone), decoded when the
+        page's html_unicode is set; as_unicode None (pages saved before
+        html_unicode) falls back to the flag of old blobs '''
+    if not key:
+        return None
+    blob = db[HTML_BLOBS_COL].find_one({'_id': key})
+    if blob is None:
+        log.debug("HTML blob %s not found", key)
+        return None
+    data = _decompress(str(blob['data']), blob.get('codec', ZLIB))
+    if as_unicode is None:
+        as_unicode = blob.get('unicode')
+    if as_unicode:
+        return data.decode('utf-8')
+    return data
+
+
+def migrate(db, codec=None, batch=MIGRATION_BATCH):
+    ''' Move inline `html` of crawled pages into blobs.
+
+    Pages whose html is None or empty only lose the field, they get no blob.
+    Returns (pages migrated, distinct blobs written).
+    '''
+    pages = empty = 0
+    hashes = set()
+    while True:
+        docs = list(db[CRAWLED_PAGES_COL].find({'html': {'$exists': True}},
+                                               {'html': 1, 'crawled_at': 1}).limit(batch))
+        if not docs:
+            break
+        for doc in docs:
+            if not doc.get('html'):
+                db[CRAWLED_PAGES_COL].update({'_id': doc['_id']}, {'$unset': {'html': ''}})
+                empty += 1
+                continue
+            key = save(db, doc['html'], codec, until=doc.get('crawled_at'))
+            hashes.add(key)
+            db[CRAWLED_PAGES_COL].update({'_id': doc['_id']},
+                                         {'$set': {'html_hash': key,
+                                                   'html_unicode': is_unicode(doc['html'])},
+                                          '$unset': {'html': ''}})
+            pages += 1
+        log.info("HTML migration: %s pages, %s blobs, %s without html", pages, len(hashes), empty)
+    return pages, len(hashes)
+
+
+if __name__ == '__main__':
+    import sys
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    db_name = sys.argv[1] if len(sys.argv) > 1 else 'entityextractor'
+    print("migrated %s pages into %s blobs" % migrate(MongoClient()[db_name]))
@@ -0,0 +1,137 @@
+''' Shared HTTP client.
+
+One requests.Session per process with per-host keep-alive connection pools,
+so the crawlers, scrapers and entity importers stop paying a fresh TCP/TLS
+handshake for every request to the same host.
+'''
+import os
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+log = logging.getLogger("crawler")
+
+USER_AGENT = 'TrendIn'
+REQUEST_TIMEOUT = 180
+
+DEFAULT_CONF = {
+    'pool_connections': 100,  # number of hosts to keep pools for
+    'pool_maxsize': 4,  # connections kept alive per host
+    'pool_block': True,  # never open more than pool_maxsize per host
+    'retries': 3,
+    'backoff_factor': 0.5,
+    'status_forcelist': (500, 502, 503, 504),
+    'timeout': REQUEST_TIMEOUT,
+}
+
+_conf = DEFAULT_CONF.copy()
+_state = {'session': None, 'pid': None}
+_lock = threading.Lock()
+
+
+def configure(**kw):
+    ''' Override pool/retry settings. Sessions created afterwards use them. '''
+    unknown = set(kw).difference(DEFAULT_CONF)
+    if unknown:
+        raise ValueError("Unknown HTTP client settings: %s" % ", ".join(unknown))
+    _conf.update(kw)
+    reset()
+
+
+def reset():
+    ''' Drop the process session (its pools are closed). '''
+    with _lock:
+        session = _state['session']
+        if session is not None and _state['pid'] == os.getpid():
+            session.close()
+        _state['session'] = None
+        _state['pid'] = None
+
+
+def _make_session():
+    retry = Retry(total=_conf['retries'],
+                  backoff_factor=_conf['backoff_factor'],
+                  status_forcelist=_conf['status_forcelist'],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=_conf['pool_connections'],
+                          pool_maxsize=_conf['pool_maxsize'],
+                          pool_block=_conf['pool_block'],
+                          max_retries=retry)
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_session():
+    ''' Session of the current process.
+
+    Pools can't be shared with forked children, so a new session is built
+    when the pid changes.
+    '''
+    pid = os.getpid()
+    session = _state['session']
+    if session is None or _state['pid'] != pid:
+        with _lock:
+            if _state['session'] is None or _state['pid'] != pid:
+                _state['session'] = _make_session()
+                _state['pid'] = pid
+            session = _state['session']
+    return session
+
+
+def request(method, url, **kw):
+    kw.setdefault('timeout', _conf['timeout'])
+    return get_session().request(method, url, **kw)
+
+
+def get(url, **kw):
+    return request('GET', url, **kw)
+
+
+def head(url, **kw):
+    kw.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kw)
+
+
+def pool_stats():
+    ''' Connection pool counters of the current session.
+
+    `misses` is the number of new connections opened (a handshake each),
+    `hits` the number of requests served over an already open connection.
+    '''
+    hosts = {}
+    session = _state['session']
+    if session is not None and _state['pid'] == os.getpid():
+        seen = set()
+        for adapter in session.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = '%s://%s' % (pool.scheme, pool.host)
+                stats = hosts.setdefault(host, {'requests': 0, 'misses': 0})
+                stats['requests'] += pool.num_requests
+                stats['misses'] += pool.num_connections
+    requests_count = sum(s['requests'] for s in hosts.values())
+    misses = sum(s['misses'] for s in hosts.values())
+    return {'requests': requests_count,
+            'misses': misses,
+            'hits': requests_count - misses,
+            'hosts': hosts}
+
+
+def log_pool_stats():
+    stats = pool_stats()
+    log.info("HTTP pools: %s requests, %s hits, %s misses (%s hosts)",
+             stats['requests'], stats['hits'], stats['misses'],
+             len(stats['hosts']))
+    return stats
@@ -0,0 +1,81 @@
+''' Multi-pattern substring search (Aho-Corasick) '''
+from collections import deque
+
+
+class MultiPatternMatcher(object):
+
+    ''' Automaton built once over a set of strings; reports which of them
+        occur in a text in a single pass over that text.
+
+        Empty patterns are ignored.
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = []
+        index = {}
+        for p in patterns:
+            if p and p not in index:
+                index[p] = len(self.patterns)
+                self.patterns.append(p)
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]  # pattern index ending in the state
+        self._out_link = [0]  # closest state on the fail chain with an output
+        for i, p in enumerate(self.patterns):
+            self._add(p, i)
+        self._build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _add(self, pattern, i):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._out_link.append(0)
+            state = nxt
+        self._out[state] = i
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].iteritems():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                f = self._goto[f].get(ch, 0)
+                self._fail[nxt] = f
+                self._out_link[nxt] = f if self._out[f] is not None else self._out_link[f]
+
+    def search(self, text):
+        ''' Indices (into self.patterns) of the patterns found in text '''
+        found = set()
+        total = len(self.patterns)
+        if not total:
+            return found
+        goto, fail, out, out_link = self._goto, self._fail, self._out, self._out_link
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] is not None else out_link[state]
+            while s:
+                found.add(out[s])
+                s = out_link[s]
+            if len(found) == total:
+                break
+        return found
+
+    def found_in(self, text):
+        ''' Patterns found in text, in pattern order '''
+        return [self.patterns[i] for i in sorted(self.search(text))]
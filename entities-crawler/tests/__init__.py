@@ -0,0 +1 @@
+''' Run from entities-crawler/: python -m unittest discover -s tests -t . '''
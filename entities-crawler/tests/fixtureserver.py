@@ -0,0 +1,57 @@
+''' Local HTTP server for tests: serves a dict of path -> (status, headers,
+body) and records the requests it got '''
+import threading
+import BaseHTTPServer
+
+
+class FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body = self.server.respond(self.path, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer(BaseHTTPServer.HTTPServer):
+
+    ''' pages - path -> (status, headers, body) or a callable(request headers)
+        returning that; paths not in pages are 404 '''
+
+    def __init__(self, pages):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), FixtureHandler)
+        self.pages = pages
+        self.requests = []
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_port
+
+    def respond(self, path, headers):
+        page = self.pages.get(path)
+        if page is None:
+            return 404, {'Content-Type': 'text/plain'}, 'not found'
+        if callable(page):
+            return page(headers)
+        return page
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
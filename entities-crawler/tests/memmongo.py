@@ -0,0 +1,101 @@
+''' In-memory stand-in for the pymongo 2 style collection calls the crawler
+uses, so tests need no MongoDB server. Queries support equality, $in and
+$or; updates $set, $setOnInsert, $unset, $inc, $max or a whole document. '''
+import copy
+import itertools
+
+
+def matches(doc, spec):
+    for field, cond in spec.items():
+        if field == '$or':
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict) and '$in' in cond:
+            if doc.get(field) not in cond['$in']:
+                return False
+        elif doc.get(field) != cond:
+            return False
+    return True
+
+
+class Collection(object):
+
+    def __init__(self):
+        self.docs = []
+        self._ids = itertools.count(1)
+
+    def find(self, spec=None, projection=None):
+        found = [copy.deepcopy(d) for d in self.docs if matches(d, spec or {})]
+        if projection:
+            keep = set(f for f, on in projection.items() if on)
+            keep.add('_id')
+            if not projection.get('_id', 1):
+                keep.discard('_id')
+            found = [dict((f, v) for f, v in d.items() if f in keep) for d in found]
+        return found
+
+    def find_one(self, spec=None, projection=None):
+        found = self.find(spec, projection)
+        return found[0] if found else None
+
+    def update(self, spec, document, upsert=False, multi=False):
+        docs = [d for d in self.docs if matches(d, spec)]
+        inserted = not docs
+        if inserted:
+            if not upsert:
+                return {'n': 0, 'nModified': 0}
+            doc = dict((f, v) for f, v in spec.items() if not f.startswith('$')
+                       and not isinstance(v, dict))
+            doc.setdefault('_id', next(self._ids))
+            self.docs.append(doc)
+            docs = [doc]
+        for doc in docs if multi else docs[:1]:
+            if any(op.startswith('$') for op in document):
+                if inserted:
+                    doc.update(copy.deepcopy(document.get('$setOnInsert', {})))
+                doc.update(copy.deepcopy(document.get('$set', {})))
+                for field in document.get('$unset', {}):
+                    doc.pop(field, None)
+                for field, n in document.get('$inc', {}).items():
+                    doc[field] = doc.get(field, 0) + n
+                for field, value in document.get('$max', {}).items():
+                    if field not in doc or value > doc[field]:
+                        doc[field] = value
+            else:
+                _id = doc['_id']
+                doc.clear()
+                doc.update(copy.deepcopy(document))
+                doc['_id'] = _id
+        if inserted:
+            return {'n': 1, 'nModified': 0, 'upserted': docs[0]['_id'], 'nUpserted': 1}
+        return {'n': len(docs), 'nModified': len(docs)}
+
+    def distinct(self, field, spec=None):
+        values = []
+        for doc in self.docs:
+            if matches(doc, spec or {}) and field in doc and doc[field] not in values:
+                values.append(doc[field])
+        return values
+
+    def insert(self, document):
+        return self.update({'_id': document.get('_id', next(self._ids))}, document, upsert=True)
+
+    def remove(self, spec):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, spec)]
+        return {'n': before - len(self.docs)}
+
+    def ensure_index(self, *args, **kwargs):
+        pass
+
+
+class MemMongo(dict):
+
+    ''' db[name] / db.name -> Collection '''
+
+    def __missing__(self, name):
+        collection = self[name] = Collection()
+        return collection
+
+    def __getattr__(self, name):
+        return self[name]
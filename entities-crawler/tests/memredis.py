@@ -0,0 +1,151 @@
+''' In-memory stand-in for the Redis commands the crawler uses, so tests
+need no Redis server '''
+
+
+class Pipeline(object):
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class ZSet(dict):
+    ''' member -> score '''
+
+
+class MemRedis(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    def type(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return 'none'
+        if isinstance(value, set):
+            return 'set'
+        if isinstance(value, ZSet):
+            return 'zset'
+        if isinstance(value, dict):
+            return 'hash'
+        return 'string'
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def expire(self, key, ttl):
+        return key in self.data
+
+    # strings and bits
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def incr(self, key, amount=1):
+        self.data[key] = str(int(self.data.get(key, 0)) + amount)
+        return int(self.data[key])
+
+    def setbit(self, key, offset, value):
+        bits = self.data.setdefault(key, bytearray())
+        byte, bit = divmod(offset, 8)
+        if len(bits) <= byte:
+            bits.extend(b'\0' * (byte + 1 - len(bits)))
+        old = (bits[byte] >> (7 - bit)) & 1
+        if value:
+            bits[byte] |= 1 << (7 - bit)
+        else:
+            bits[byte] &= ~(1 << (7 - bit)) & 0xff
+        return old
+
+    def getbit(self, key, offset):
+        bits = self.data.get(key, bytearray())
+        byte, bit = divmod(offset, 8)
+        return (bits[byte] >> (7 - bit)) & 1 if byte < len(bits) else 0
+
+    def strlen(self, key):
+        return len(self.data.get(key, ''))
+
+    # hashes
+
+    def hget(self, key, field):
+        value = self.data.get(key, {}).get(field)
+        return None if value is None else str(value)
+
+    def hgetall(self, key):
+        return dict((field, str(value)) for field, value in self.data.get(key, {}).items())
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+        return 1
+
+    def hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if field in fields:
+            return 0
+        fields[field] = value
+        return 1
+
+    def hmset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+        return True
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        fields[field] = int(fields.get(field, 0)) + amount
+        return fields[field]
+
+    # sets
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    # sorted sets
+
+    def zadd(self, key, mapping):
+        members = self.data.setdefault(key, ZSet())
+        added = 0
+        for member, score in mapping.items():
+            added += member not in members
+            members[member] = float(score)
+        return added
+
+    def _ranked(self, key, start, end):
+        ranked = sorted((score, member) for member, score in self.data.get(key, {}).items())
+        return ranked[start:None if end == -1 else end + 1]
+
+    def zrange(self, key, start, end, withscores=False):
+        ranked = self._ranked(key, start, end)
+        if withscores:
+            return [(member, score) for score, member in ranked]
+        return [member for _, member in ranked]
+
+    def zremrangebyrank(self, key, start, end):
+        ranked = self._ranked(key, start, end)
+        for _, member in ranked:
+            del self.data[key][member]
+        return len(ranked)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def publish(self, channel, message):
+        return 0
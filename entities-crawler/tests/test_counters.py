@@ -0,0 +1,70 @@
+''' CounterBuffer flushes and their failures '''
+import unittest
+
+from pymongo.errors import BulkWriteError, AutoReconnect
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler.counters import CounterBuffer
+
+
+class Collection(object):
+    ''' Applies a bulk of $inc updates, except those to the ids in fail '''
+
+    def __init__(self, fail=(), error=None):
+        self.docs = {}
+        self.fail = set(fail)
+        self.error = error
+
+    def bulk_write(self, requests, ordered=True):
+        if self.error:
+            raise self.error
+        errors = []
+        for index, request in enumerate(requests):
+            doc = request._doc
+            _id = request._filter['_id']
+            if _id in self.fail:
+                errors.append({'index': index, 'code': 1, 'errmsg': 'failed', 'op': doc})
+                continue
+            counts = self.docs.setdefault(_id, {})
+            for field, n in doc['$inc'].items():
+                counts[field] = counts.get(field, 0) + n
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'writeConcernErrors': [],
+                                  'nInserted': 0, 'nUpserted': 0, 'nMatched': 0,
+                                  'nModified': 0, 'nRemoved': 0, 'upserted': []})
+
+
+class CounterBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = CounterBuffer()
+        for _id in ('a', 'b', 'c'):
+            self.buffer.inc('crawlers', _id, crawled_pages=2, bytes=10)
+
+    def test_flush(self):
+        db = {'crawlers': Collection()}
+        self.assertEqual(self.buffer.flush(db), 3)
+        self.assertEqual(db['crawlers'].docs['b'], {'crawled_pages': 2, 'bytes': 10})
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_partial_failure_keeps_only_failed(self):
+        db = {'crawlers': Collection(fail=['b'])}
+        self.buffer.flush(db)
+        self.assertEqual(sorted(db['crawlers'].docs), ['a', 'c'])
+        self.assertEqual(len(self.buffer), 1)
+        db['crawlers'].fail = set()
+        self.buffer.flush(db)
+        for _id in ('a', 'b', 'c'):
+            self.assertEqual(db['crawlers'].docs[_id], {'crawled_pages': 2, 'bytes': 10})
+
+    def test_connection_failure_keeps_all(self):
+        db = {'crawlers': Collection(error=AutoReconnect('down'))}
+        self.buffer.flush(db)
+        self.assertEqual(len(self.buffer), 3)
+        db['crawlers'].error = None
+        self.buffer.flush(db)
+        self.assertEqual(db['crawlers'].docs['a'], {'crawled_pages': 2, 'bytes': 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
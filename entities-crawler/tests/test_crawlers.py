@@ -0,0 +1,186 @@
+''' Smoke test: each crawler type crawls one page of a local site '''
+import unittest
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler.crawlers import LinksCrawler, SitemapCrawler, RSSCrawler
+from entitycrawler.crawler.canonical import CanonicalRules
+from entitycrawler.crawler.scrapers import SoupScrapper
+from entitycrawler.crawler.counters import CRAWL_COUNTERS
+from entitycrawler.crawler.frontier import SPECIFIC_PATTERN
+from entitycrawler.crawler.urlmatch import URLPatternMatcher
+from entitycrawler.db import FEED_STATE_PREFIX
+
+from tests.memredis import MemRedis
+from tests.memmongo import MemMongo
+from tests.fixtureserver import FixtureServer
+
+HTML = {'Content-Type': 'text/html; charset=utf-8'}
+ARTICLE = '''<html><head><title>Article one</title></head><body>
+<h1>Article one</h1>
+<p>Some text of the first article, long enough to be taken for the text of the caf\xc3\xa9.</p>
+<a href="/news/article-2.html">next</a> <a href="http://other.example.com/">elsewhere</a>
+</body></html>'''
+
+
+class AllPatterns(object):
+
+    ''' WebsiteURLPatterns stand-in: every link of the site is valid '''
+
+    def __init__(self, site):
+        self.site = site
+
+    def validate_link(self, url):
+        return url.startswith(self.site)
+
+    def match_id(self, url):
+        return 'default' if self.validate_link(url) else None
+
+
+class CrawlerRecord(object):
+
+    ''' The part of WebsiteCrawler the crawler classes use '''
+
+    def __init__(self, site, name):
+        self._id = self.id = name
+        self.website_id = 'website-' + name
+        self.redis = MemRedis()
+        self.db = None
+        self.start_url = site + '/'
+        self.frequency = 3600
+        self.age = 3600
+        self.max_depth = 10
+        self.max_frontier = 1000
+        self.date_detector = None
+        self.default_url_pattern = 'default'
+        self.url_patterns = AllPatterns(site)
+        self.canonical = CanonicalRules({})
+
+    def check_urls_age(self, urls):
+        return urls
+
+
+class CrawlPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer({'/': (200, HTML, ARTICLE),
+                                     '/news/article-1.html': (200, HTML, ARTICLE)}).__enter__()
+        self.url = self.server.url + '/news/article-1.html'
+        CRAWL_COUNTERS._pending.clear()
+
+    def tearDown(self):
+        self.server.__exit__()
+        CRAWL_COUNTERS._pending.clear()
+
+    def crawl(self, crawler_class):
+        record = CrawlerRecord(self.server.url, crawler_class._type)
+        crawler = crawler_class(SoupScrapper, record)
+        crawler.frontier.push([self.url], 1)
+        return crawler, crawler.crawl_page()
+
+    def assertCounted(self, crawler):
+        counts = CRAWL_COUNTERS._pending[('crawlers', crawler.crawler._id)]
+        self.assertEqual(counts['crawled_pages'], 1)
+        self.assertEqual(counts['bytes'], len(ARTICLE))  # bytes, not characters
+        self.assertFalse(counts['errors'])
+
+    def test_links_crawler(self):
+        crawler, page = self.crawl(LinksCrawler)
+        self.assertEqual(page.url, self.url)
+        self.assertIn('Article one', page.title)
+        self.assertCounted(crawler)
+        # the page keeps all its links (crawled_pages is shared by crawlers),
+        # the in-site link is queued, the other host is not
+        self.assertIn('http://other.example.com/', page.page['links'])
+        self.assertEqual([url for url, _ in crawler.frontier.pop(10)],
+                         [self.server.url + '/news/article-2.html'])
+
+    def test_stored_page_not_counted(self):
+        record = CrawlerRecord(self.server.url, LinksCrawler._type)
+        record.db = MemMongo()
+        crawler = LinksCrawler(SoupScrapper, record)
+        crawler.frontier.push([self.url], 1)
+        crawler.crawl_page().save()
+        crawler.frontier.push([self.url], 1)
+        page = crawler.crawl_page()
+        self.assertEqual(page.url, self.url)
+        self.assertIsNone(page.downloaded_bytes)
+        self.assertCounted(crawler)
+
+    def test_sitemap_crawler(self):
+        crawler, page = self.crawl(SitemapCrawler)
+        self.assertEqual(page.url, self.url)
+        self.assertIn('Article one', page.title)
+        self.assertCounted(crawler)
+        # sitemap crawlers don't follow links
+        self.assertEqual(len(crawler.frontier), 0)
+
+    def test_sitemap_listing_start_page(self):
+        record = CrawlerRecord(self.server.url, SitemapCrawler._type)
+        crawler = SitemapCrawler(SoupScrapper, record)
+        # the walk claimed the visit, then reaches the home page
+        self.assertTrue(crawler.revisit.claim())
+        crawler.frontier.push([record.start_url], 1)
+        page = crawler.crawl_page()
+        self.assertEqual(page.url, record.start_url)
+        self.assertFalse(crawler.on_pause)
+        self.assertEqual(crawler.revisit.stats()['visits'], 0)
+
+    def test_rss_crawler(self):
+        crawler, page = self.crawl(RSSCrawler)
+        self.assertEqual(page['url'], self.url)
+        self.assertIn('Article one', page['title'])
+        self.assertCounted(crawler)
+
+
+class FeedErrorTest(unittest.TestCase):
+
+    FEED_PAGE = '<html><head><link rel="alternate" type="application/rss+xml" ' \
+        'href="/feed.xml"></head><body></body></html>'
+
+    def crawler(self, pages):
+        self.server = FixtureServer(pages).__enter__()
+        self.addCleanup(self.server.__exit__)
+        return RSSCrawler(SoupScrapper, CrawlerRecord(self.server.url, RSSCrawler._type))
+
+    def test_feed_error(self):
+        crawler = self.crawler({'/': (200, HTML, self.FEED_PAGE),
+                                '/feed.xml': (500, HTML, 'error')})
+        self.assertIsNone(crawler.get_url())
+        self.assertIn('/feed.xml', [path for path, _ in self.server.requests])
+        self.assertEqual(crawler.poll_feed(self.server.url + '/feed.xml'), [])
+        # an error page is not taken for a feed without entries
+        self.assertEqual(crawler.redis.hgetall(FEED_STATE_PREFIX + self.server.url + '/feed.xml'), {})
+
+    def test_start_page_error(self):
+        crawler = self.crawler({'/': (500, HTML, 'error')})
+        self.assertIsNone(crawler.feed_url())
+        self.assertIsNone(crawler.get_url())
+
+    def test_site_down(self):
+        crawler = self.crawler({})
+        self.server.__exit__()
+        self.assertIsNone(crawler.get_url())
+        self.assertEqual(crawler.poll_feed(self.server.url + '/feed.xml'), [])
+
+
+class QueueUrlsTest(unittest.TestCase):
+
+    def test_queued_as_found_deduped_canonically(self):
+        record = CrawlerRecord('http://www.example.com', 'queue-test')
+        record.url_patterns = URLPatternMatcher(
+            [('news', r'http://www\.example\.com/news/.*/'), ('default', r'http://www\.example\.com/.*')],
+            'default')
+        crawler = LinksCrawler(SoupScrapper, record)
+        queued = crawler.queue_urls(['http://www.example.com/news/2016/story/',
+                                     'http://www.example.com/news/2016/story/?utm_source=x',
+                                     'http://www.example.com/about'])
+        self.assertEqual(queued, 2)
+        entries = crawler.frontier.pop(10)
+        # www. and trailing slash kept, so the specific pattern still matches
+        self.assertEqual(entries, [('http://www.example.com/news/2016/story/', 1),
+                                   ('http://www.example.com/about', 1)])
+        self.assertEqual(crawler.pattern_rank(entries[0][0]), SPECIFIC_PATTERN)
+
+
+if __name__ == '__main__':
+    unittest.main()
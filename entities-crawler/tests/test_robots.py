@@ -0,0 +1,94 @@
+''' robots.txt rules and cache against a local fixture server '''
+import unittest
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler import robots
+
+from tests.memredis import MemRedis
+from tests.fixtureserver import FixtureServer
+
+ETAG = '"fixture-1"'
+ROBOTS_TXT = '\n'.join([
+    'User-agent: *',
+    'Crawl-delay: 2',
+    'Disallow: /private/',
+    'Allow: /private/public/',
+    'Disallow: /*.pdf$',
+    'Disallow: /search?',
+    '',
+    'User-agent: BadBot',
+    'Disallow: /',
+])
+
+
+def robots_txt(headers):
+    if headers.get('If-None-Match') == ETAG:
+        return 304, {}, ''
+    return 200, {'Content-Type': 'text/plain', 'ETag': ETAG}, ROBOTS_TXT
+
+
+class RobotsTest(unittest.TestCase):
+
+    def setUp(self):
+        robots.ROBOTS_LOCAL_CACHE.clear()
+        self.server = FixtureServer({'/robots.txt': robots_txt}).__enter__()
+        self.base = self.server.url
+
+    def tearDown(self):
+        self.server.__exit__()
+        robots.ROBOTS_LOCAL_CACHE.clear()
+
+    def fetches(self):
+        return [headers.get('if-none-match') for path, headers in self.server.requests
+                if path == '/robots.txt']
+
+    def test_rules(self):
+        cache = robots.RobotsCache()
+        allowed = dict((path, cache.allowed(self.base + path)) for path in [
+            '/', '/news/story.html', '/private/page.html', '/private/public/page.html',
+            '/files/report.pdf', '/files/report.pdf?x=1', '/search?q=x', '/search'])
+        self.assertEqual(allowed, {
+            '/': True,
+            '/news/story.html': True,
+            '/private/page.html': False,
+            '/private/public/page.html': True,  # longer allow wins
+            '/files/report.pdf': False,
+            '/files/report.pdf?x=1': True,  # $ anchors the end
+            '/search?q=x': False,
+            '/search': True,
+        })
+        self.assertEqual(cache.crawl_delay(self.base + '/'), 2)
+        self.assertEqual(self.fetches(), [None])
+
+    def test_conditional_revalidation(self):
+        cache = robots.RobotsCache()
+        self.assertFalse(cache.allowed(self.base + '/private/a.html'))
+        self.assertFalse(cache.allowed(self.base + '/private/b.html'))
+        self.assertEqual(self.fetches(), [None])
+        # expired: revalidated with If-None-Match, answered 304
+        key = robots.robots_url(self.base)
+        robots.ROBOTS_LOCAL_CACHE[key].expires = 0
+        robots.ROBOTS_LOCAL_CACHE[key].entry['expires'] = 0
+        self.assertFalse(cache.allowed(self.base + '/private/a.html'))
+        self.assertTrue(cache.allowed(self.base + '/news/a.html'))
+        self.assertEqual(self.fetches(), [None, ETAG])
+        self.assertGreater(robots.ROBOTS_LOCAL_CACHE[key].expires, 0)
+
+    def test_shared_cache(self):
+        redis = MemRedis()
+        self.assertFalse(robots.RobotsCache(redis).allowed(self.base + '/private/a.html'))
+        robots.ROBOTS_LOCAL_CACHE.clear()  # another process
+        self.assertFalse(robots.RobotsCache(redis).allowed(self.base + '/private/a.html'))
+        self.assertEqual(self.fetches(), [None])
+
+    def test_missing_and_failing(self):
+        cache = robots.RobotsCache()
+        del self.server.pages['/robots.txt']
+        self.assertTrue(cache.allowed(self.base + '/private/a.html'))
+        robots.ROBOTS_LOCAL_CACHE.clear()
+        self.server.pages['/robots.txt'] = (503, {}, 'busy')
+        self.assertFalse(cache.allowed(self.base + '/news/a.html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+''' ScrappedPage storage and revalidation against a local fixture server '''
+import unittest
+from datetime import timedelta
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler.canonical import CanonicalRules
+from entitycrawler.crawler.exceptions import PageNotModifiedError
+from entitycrawler.crawler.scrapers import ScrappedPage, BSOUP
+from entitycrawler import htmlstore
+from entitycrawler.db import (CRAWLED_PAGES_COL, EXTRACTED_PAGES_COL, HTTP_VALIDATORS_COL,
+                              HTML_BLOBS_COL, HTML_BLOB_TTL)
+
+from tests.memmongo import MemMongo
+from tests.fixtureserver import FixtureServer
+
+STORY = '''<html><head><title>Story</title>
+<link rel="canonical" href="/story/1"></head><body>
+<p>Text of the story, long enough to be taken for the text of the page.</p>
+</body></html>'''
+
+
+def page(etag, body):
+    def respond(headers):
+        if headers.get('If-None-Match') == etag:
+            return 304, {}, ''
+        return 200, {'Content-Type': 'text/html; charset=utf-8', 'ETag': etag}, body
+    return respond
+
+
+class RevalidationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer({
+            '/story?id=1': page('"variant"', STORY),
+            '/story/1': page('"canonical"', STORY),
+        }).__enter__()
+        self.fetched = self.server.url + '/story?id=1'
+        self.canonical = self.server.url + '/story/1'
+        self.db = MemMongo()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def scrape(self, url):
+        return ScrappedPage(url, BSOUP, db=self.db, canonical=CanonicalRules())
+
+    def conditional(self, path):
+        return [headers.get('if-none-match') for p, headers in self.server.requests if p == path]
+
+    def test_validators_keyed_by_fetched_url(self):
+        scraped = self.scrape(self.fetched)
+        self.assertEqual(scraped.url, self.canonical)
+        scraped.save()
+        self.db[EXTRACTED_PAGES_COL].insert({'url': scraped.url})
+        self.assertEqual(ScrappedPage.get_validators(self.db, self.fetched)['etag'], '"variant"')
+        self.assertIsNone(self.db[HTTP_VALIDATORS_COL].find_one({'url': self.canonical}))
+
+        # once the crawled page expired, the fetched URL is revalidated
+        self.db[CRAWLED_PAGES_COL].remove({})
+        with self.assertRaises(PageNotModifiedError):
+            self.scrape(self.fetched)
+        self.assertEqual(self.conditional('/story?id=1'), [None, '"variant"'])
+
+        # and the canonical URL doesn't send the validators of the variant
+        self.scrape(self.canonical)
+        self.assertEqual(self.conditional('/story/1'), [None])
+
+
+class HTMLBlobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FixtureServer({'/story/1': page('"canonical"', STORY)}).__enter__()
+        self.db = MemMongo()
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def blob(self, scraped):
+        doc = self.db[CRAWLED_PAGES_COL].find_one({'url': scraped.url})
+        return doc, self.db[HTML_BLOBS_COL].find_one({'_id': doc['html_hash']})
+
+    def test_blob_outlives_page(self):
+        scraped = ScrappedPage(self.server.url + '/story/1', BSOUP, db=self.db)
+        scraped.save(expire=2 * HTML_BLOB_TTL)
+        doc, blob = self.blob(scraped)
+        self.assertEqual(blob['last_seen'], doc['crawled_at'])
+
+        # a page saved again with a shorter expiry doesn't shorten the blob
+        ScrappedPage(scraped.url, BSOUP, db=self.db).save()
+        self.assertEqual(self.blob(scraped)[1]['last_seen'], blob['last_seen'])
+
+        later = blob['last_seen'] + timedelta(days=1)
+        htmlstore.extend(self.db, [doc['html_hash']], later)
+        self.assertEqual(self.blob(scraped)[1]['last_seen'], later)
+
+
+if __name__ == '__main__':
+    unittest.main()
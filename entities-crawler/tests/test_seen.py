@@ -0,0 +1,57 @@
+''' Seen filter generations against the in-memory Redis '''
+import unittest
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler import seen
+
+from tests.memredis import MemRedis
+
+AGE = 7200  # generations of 3600s
+
+
+class Clock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class SeenFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock(1000 * AGE)
+        self._time, seen.time = seen.time, self.clock
+        self.filter = seen.SeenFilter(MemRedis(), 'test', AGE, capacity=100)
+
+    def tearDown(self):
+        seen.time = self._time
+
+    def add(self, *urls):
+        return self.filter.add_many(urls)
+
+    def test_suppressed_within_generation(self):
+        self.assertEqual(self.add('http://x/a', 'http://x/b', 'http://x/a'),
+                         ['http://x/a', 'http://x/b'])
+        self.assertEqual(self.add('http://x/a', 'http://x/c'), ['http://x/c'])
+
+    def test_linked_every_generation_becomes_new_again(self):
+        new = []
+        for generation in range(5):
+            new.append(self.add('http://x/nav') == ['http://x/nav'])
+            self.clock.now += AGE // 2
+        # seen in generation 0, still held by the previous generation in 1,
+        # dropped out of both in 2 and so on
+        self.assertEqual(new, [True, False, True, False, True])
+
+    def test_only_new_urls_counted(self):
+        self.add('http://x/a', 'http://x/b')
+        self.clock.now += AGE // 2
+        self.add('http://x/a', 'http://x/b', 'http://x/c')
+        generations = self.filter.stats()['generations']
+        self.assertEqual(sorted(g['items'] for g in generations.values()), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+''' Sitemap parsing against a local server '''
+import unittest
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler import sitemaps
+
+from tests.fixtureserver import FixtureServer
+
+XML = {'Content-Type': 'application/xml'}
+IMAGE_SITEMAP = '''<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url>
+    <loc>http://example.com/article-1.html</loc>
+    <lastmod>2016-05-01</lastmod>
+    <image:image><image:loc>http://example.com/img/1.jpg</image:loc></image:image>
+  </url>
+  <url>
+    <image:image><image:loc>http://example.com/img/2.jpg</image:loc></image:image>
+    <loc>http://example.com/article-2.html</loc>
+  </url>
+</urlset>'''
+INDEX = '''<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>%s/images.xml</loc></sitemap>
+</sitemapindex>'''
+
+
+class SitemapEntriesTest(unittest.TestCase):
+
+    def test_extension_locs_ignored(self):
+        with FixtureServer({'/images.xml': (200, XML, IMAGE_SITEMAP)}) as server:
+            entries = list(sitemaps.iter_entries(server.url + '/images.xml'))
+        self.assertEqual([(kind, loc) for kind, loc, _ in entries],
+                         [('url', 'http://example.com/article-1.html'),
+                          ('url', 'http://example.com/article-2.html')])
+        self.assertEqual(entries[0][2].date().isoformat(), '2016-05-01')
+        self.assertIsNone(entries[1][2])
+
+    def test_index(self):
+        with FixtureServer({}) as server:
+            server.pages['/sitemap.xml'] = (200, XML, INDEX % server.url)
+            server.pages['/images.xml'] = (200, XML, IMAGE_SITEMAP)
+            urls = [loc for loc, _ in sitemaps.iter_urls([server.url + '/sitemap.xml'])]
+        self.assertEqual(urls, ['http://example.com/article-1.html',
+                                'http://example.com/article-2.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
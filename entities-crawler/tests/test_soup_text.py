@@ -0,0 +1,66 @@
+''' SoupScrapper text extraction against what v3 produced.
+
+tests/fixtures/soup_text/<page>.v3.json hold the text, highlights and
+title that SoupScrapper v3 (the recursive version, as it was before v4)
+returned for <page>.html, html collapsed the way its _download did.
+v4 must return the same, except for these intended differences:
+
+- v3 merged the first text piece of a page into its own group, so the
+  block it starts has that piece twice (print_version.html); v4 has it once
+- v3 returned highlights in set order, v4 in the order of the page
+
+The pages contain nothing ftfy changes, so the outputs don't depend on the
+ftfy version.
+'''
+import os
+import json
+import glob
+import unittest
+
+import entitycrawler.crawler  # noqa, import order of the crawler package
+from entitycrawler.crawler.scrapers import SoupScrapper
+
+from tests.fixtureserver import FixtureServer
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'soup_text')
+HTML = {'Content-Type': 'text/html'}
+
+
+def undouble(block):
+    ''' block without the repeated leading piece of v3, if it has one '''
+    for i in xrange(len(block) // 2, 0, -1):
+        piece = block[:i]
+        if block[i:i + 1] == u' ' and block.startswith(piece + u' ' + piece):
+            return block[i + 1:]
+    return block
+
+
+def expected(v3):
+    text = list(v3['text'])
+    if len(text) > 1:
+        text[1] = undouble(text[1])
+    return text, sorted(v3['highlighted_strings']), v3['title']
+
+
+class SoupTextTest(unittest.TestCase):
+
+    def test_same_as_v3(self):
+        paths = sorted(glob.glob(os.path.join(FIXTURES, '*.html')))
+        self.assertTrue(paths)
+        pages = dict(('/' + os.path.basename(path), (200, HTML, open(path, 'rb').read()))
+                     for path in paths)
+        with FixtureServer(pages) as server:
+            for path in paths:
+                name = os.path.basename(path)
+                text, highlights, title = SoupScrapper(server.url + '/' + name).get_text()
+                with open(path[:-len('.html')] + '.v3.json') as f:
+                    v3 = json.load(f)
+                self.assertEqual((text, sorted(highlights), title), expected(v3), name)
+
+    def test_undouble(self):
+        self.assertEqual(undouble(u'Heavy snow Heavy snow fell'), u'Heavy snow fell')
+        self.assertEqual(undouble(u'Heavy snow fell'), u'Heavy snow fell')
+
+
+if __name__ == '__main__':
+    unittest.main()